@@ -10,6 +10,9 @@ from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from address.views import AddressViewSet
+from core.query_budget import QueryBudgetMixin
+
 ADDRESS_GET = reverse("address:address-list")
 USER_ADDRESS_GET = reverse("address:deliveryaddress-list")
 
@@ -175,4 +178,22 @@ class PrivateAddressAPI(TestCase):
 
         response = self.client.get(USER_ADDRESS_GET)
 
-        self.assertEqual(response.status_code,status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code,status.HTTP_200_OK)
+
+
+class AddressQueryBudgetTests(QueryBudgetMixin,TestCase):
+    """Listing addresses stays within budget whatever the number of children."""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com",password="test123",is_active=True)
+        self.authenticate(self.client,self.user)
+        self.province = create_address(id="1",name="Province",parent=None)
+
+    def seed(self,size):
+        for index in range(Address.objects.filter(parent=self.province).count(),size):
+            create_address(id=f"1.{index}",name=f"City {index}",parent=self.province)
+
+    def test_list_budget(self):
+        self.assertBudgetIndependentOfN(AddressViewSet,'list',self.seed,
+                                        lambda: self.client.get(ADDRESS_GET,{"parent":self.province.id}))
@@ -15,6 +15,9 @@ class AddressViewSet(GenericViewSet,ListModelMixin):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
     queryset = Address.objects.all().order_by('parent')
+    query_budgets = {
+        'list': 2,
+    }
 
     def get_queryset(self):
         if(self.request.method == "GET"):
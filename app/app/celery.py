@@ -19,6 +19,16 @@ app.config_from_object(settings, namespace='CELERY')
 app.autodiscover_tasks()
 
 app.conf.beat_schedule = {
+    # Picks up reviews whose moderation was never scheduled, e.g. after a broker outage.
+    'moderate-pending-reviews': {
+        'task': 'core.tasks.moderate_reviews',
+        'schedule': 60.0,
+    },
+    # Completes or closes payments whose customer never came back from Khalti.
+    'reconcile-pending-payments': {
+        'task': 'core.tasks.reconcile_payments',
+        'schedule': 300.0,
+    },
 }
 
 # if 'runserver' in sys.argv:
@@ -59,6 +59,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.query_budget.QueryStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     "corsheaders.middleware.CorsMiddleware",
@@ -147,10 +148,45 @@ STATICFILES_DIRS = [
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 INVOICES_PATH = os.path.join(BASE_DIR,'static','invoices')
+# "x-accel-redirect" (nginx) or "x-sendfile" (apache, lighttpd) hands invoice
+# downloads to the reverse proxy, empty streams them from Django.
+INVOICES_SENDFILE = os.environ.get("INVOICES_SENDFILE", "")
+# nginx location marked internal that aliases INVOICES_PATH.
+INVOICES_ACCEL_REDIRECT_PREFIX = os.environ.get("INVOICES_ACCEL_REDIRECT_PREFIX", "/protected/invoices/")
+# "local" keeps invoices under INVOICES_PATH, "s3" stores them in a bucket
+# shared by every web node and worker (AWS S3, MinIO or another compatible store).
+INVOICES_STORAGE = os.environ.get("INVOICES_STORAGE", "local")
+INVOICES_STORAGE_BACKENDS = {
+    "local": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {"location": INVOICES_PATH},
+    },
+    "s3": {
+        "BACKEND": "storages.backends.s3.S3Storage",
+        "OPTIONS": {
+            "bucket_name": os.environ.get("INVOICES_BUCKET", "invoices"),
+            "endpoint_url": os.environ.get("INVOICES_S3_ENDPOINT_URL"),
+            "access_key": os.environ.get("INVOICES_S3_ACCESS_KEY"),
+            "secret_key": os.environ.get("INVOICES_S3_SECRET_KEY"),
+            "region_name": os.environ.get("INVOICES_S3_REGION"),
+            "default_acl": "private",
+            "file_overwrite": True,
+        },
+    },
+}
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    "invoices": INVOICES_STORAGE_BACKENDS[INVOICES_STORAGE],
+}
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'static')
 
+# Query Budget Config
+# Send the SQL query count and time of each request in a Server-Timing header.
+QUERY_STATS_SERVER_TIMING = DEBUG
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -178,6 +214,31 @@ SIMPLE_JWT = {
 PAYMENT_URL = "https://a.khalti.com/api/v2/epayment/initiate/"
 PAYMENT_LOOKUP_URL = "https://a.khalti.com/api/v2/epayment/lookup/"
 KHALTI_API_KEY = os.environ.get("KHALTI_API_KEY")
+# Seconds to open a connection and to wait for the response.
+KHALTI_CONNECT_TIMEOUT = float(os.environ.get("KHALTI_CONNECT_TIMEOUT", 3.05))
+KHALTI_READ_TIMEOUT = float(os.environ.get("KHALTI_READ_TIMEOUT", 10))
+# Keep-alive connections kept per process.
+KHALTI_POOL_MAXSIZE = int(os.environ.get("KHALTI_POOL_MAXSIZE", 10))
+KHALTI_LOOKUP_RETRIES = 2
+KHALTI_RETRY_BACKOFF = 0.25
+KHALTI_RETRY_BACKOFF_MAX = 2
+# Consecutive failed calls that open the circuit, and seconds it stays open.
+KHALTI_BREAKER_THRESHOLD = 5
+KHALTI_BREAKER_RESET_TIMEOUT = 30
+# Pending payments older than this are looked up by the reconciliation job.
+PAYMENT_RECONCILE_AFTER_MINUTES = 15
+PAYMENT_RECONCILE_BATCH_SIZE = 100
+# Concurrent gateway lookups per batch.
+PAYMENT_RECONCILE_WORKERS = 8
+
+# Outbox Config
+# Messages published per relay transaction, and seconds the relay sleeps when idle.
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_POLL_INTERVAL = 0.5
+# Longest the relay waits between attempts while the broker or database is down.
+OUTBOX_MAX_BACKOFF = 30
+# Published messages, and so their dedup keys, are kept this long.
+OUTBOX_RETENTION_HOURS = 24
 
 
 #CK editior config
@@ -210,12 +271,26 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.environ.get("email","")
 EMAIL_HOST_PASSWORD = os.environ.get("password","")
+# Emails queued within the window are sent over one connection, at most this many per connection.
+EMAIL_BATCH_WINDOW_MS = 2000
+EMAIL_BATCH_SIZE = 50
+# The email queue lives in its own Redis database, out of reach of cache.clear().
+# Its keys carry no TTL, so volatile-* eviction policies never drop them.
+EMAIL_QUEUE_REDIS_URL = os.environ.get("EMAIL_QUEUE_REDIS", "redis://redis:6379/2")
+# Longest a flush may hold the queue. A crashed flush's emails are recovered after it.
+EMAIL_FLUSH_LOCK_TIMEOUT = 60*10
 
 # Celery Config
 CELERY_broker_url = os.environ.get("CELERY_BROKER", "redis://redis:6379/0")
 result_backend = os.environ.get("CELERY_BACKEND", "redis://redis:6379/0")
 CELERY_broker_connection_retry_on_startup = True
 
+# Review Analyzer Config
+REVIEW_ANALYZER_WARM_UP = os.environ.get("REVIEW_ANALYZER_WARM_UP", "True") == "True"
+# Reviews posted within the window are moderated together, at most this many per model call.
+REVIEW_MODERATION_BATCH_SIZE = 32
+REVIEW_MODERATION_WINDOW_MS = 500
+
 # Redis Cache Config
 CACHES = {
     "default": {
@@ -227,9 +302,32 @@ CACHES = {
     }
 }
 
+# Product Image Config
+# Widths of the resized variants rendered for every uploaded product image.
+PRODUCT_IMAGE_VARIANT_WIDTHS = [160, 320, 640, 1024]
+
+# Product Cache Config
+# Entries are invalidated through version counters, the timeouts only bound memory use.
+PRODUCT_LIST_CACHE_TIMEOUT = 60*10
+PRODUCT_DETAIL_CACHE_TIMEOUT = 60*60
+# Expired entries are served for this long while one request rebuilds them under a lock.
+PRODUCT_CACHE_STALE_TIMEOUT = 60
+PRODUCT_CACHE_LOCK_TIMEOUT = 10
+# Higher values refresh entries earlier ahead of expiry.
+PRODUCT_CACHE_XFETCH_BETA = 1.0
+
 # Elastic Search Config
 ELASTICSEARCH_DSL = {
     "default": {
         "hosts": "http://es:9200",
     },
 }
+# Index writes go through core.tasks.index_products and become searchable on the
+# index refresh interval instead of forcing a refresh per write.
+ELASTICSEARCH_DSL_SIGNAL_PROCESSOR = 'core.services.search_index.QueuedSignalProcessor'
+ELASTICSEARCH_DSL_AUTO_REFRESH = False
+# Edits to the same products within the window are written in one bulk request.
+SEARCH_INDEX_WINDOW_MS = 1000
+SEARCH_INDEX_BATCH_SIZE = 500
+# Admin saves index synchronously with refresh=wait_for, for read-your-write.
+SEARCH_INDEX_WAIT_FOR = os.environ.get("SEARCH_INDEX_WAIT_FOR", "False") == "True"
@@ -10,6 +10,9 @@ from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from cart.views import CartViewSet
+from core.query_budget import QueryBudgetMixin
+
 CART_LIST = reverse('cart:cart-list')
 CART_DETAIL = reverse('cart:cart-detail',args=[1])
 
@@ -149,4 +152,50 @@ class PrivateCartAPITest(TestCase):
         create_cart(**data)
         response = self.client.get(CART_LIST)
         self.assertEqual(response.status_code,status.HTTP_200_OK)
-        self.assertEqual(len(response.json()["results"]),1)
\ No newline at end of file
+        self.assertEqual(len(response.json()["results"]),1)
+
+
+class CartQueryBudgetTests(QueryBudgetMixin,TestCase):
+    """Queries of each cart action stay within budget whatever the cart size."""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com",password="test123",is_active=True)
+        self.authenticate(self.client,self.user)
+        self.product = create_product(name="Macbook Pro M1 Pro",price=265000,stock=100,threshold=2)
+        self.cart = create_cart(p_id=self.product,quantity=1,user=self.user)
+
+    def seed(self,size):
+        """Fill the cart up to size rows."""
+        for index in range(Cart.objects.filter(user=self.user).count(),size):
+            product = create_product(name=f"Product {index}",price=100,stock=100,threshold=2)
+            create_cart(p_id=product,quantity=1,user=self.user)
+
+    def test_list_budget(self):
+        self.assertBudgetIndependentOfN(CartViewSet,'list',self.seed,lambda: self.client.get(CART_LIST))
+
+    def test_retrieve_budget(self):
+        detail_url = reverse('cart:cart-detail',args=[self.cart.id])
+        self.assertBudgetIndependentOfN(CartViewSet,'retrieve',self.seed,lambda: self.client.get(detail_url))
+
+    def test_create_budget(self):
+        """Adding to an existing row and adding a new row both stay within budget."""
+        self.assertBudgetIndependentOfN(CartViewSet,'create',self.seed,
+                                        lambda: self.client.post(CART_LIST,{'p_id':self.product.p_id,'quantity':1}))
+        product = create_product(name="New product",price=100,stock=100,threshold=2)
+        self.assertWithinBudget(CartViewSet,'create',lambda: self.client.post(CART_LIST,{'p_id':product.p_id,'quantity':1}))
+
+    def test_update_budget(self):
+        detail_url = reverse('cart:cart-detail',args=[self.cart.id])
+        data = {'p_id':self.product.p_id,'quantity':2}
+        self.assertBudgetIndependentOfN(CartViewSet,'update',self.seed,lambda: self.client.put(detail_url,data))
+        self.assertBudgetIndependentOfN(CartViewSet,'partial_update',self.seed,
+                                        lambda: self.client.patch(detail_url,{'quantity':3}))
+
+    def test_destroy_budget(self):
+        carts = []
+        def seed(size):
+            self.seed(size)
+            carts.append(Cart.objects.filter(user=self.user).order_by('-id').first())
+        self.assertBudgetIndependentOfN(CartViewSet,'destroy',seed,
+                                        lambda: self.client.delete(reverse('cart:cart-detail',args=[carts[-1].id])))
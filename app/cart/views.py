@@ -5,7 +5,7 @@ from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.permissions import IsAuthenticated
 
 from cart import serializers
-from core.pagination import CustomPagination
+from core.pagination import KeysetPagination
 from core.models import Cart
 
 class CartViewSet(viewsets.ModelViewSet):
@@ -14,7 +14,16 @@ class CartViewSet(viewsets.ModelViewSet):
     queryset = Cart.objects.all()
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
-    pagination_class = CustomPagination
+    pagination_class = KeysetPagination
+    query_budgets = {
+        # Page number responses without a cursor add a COUNT.
+        'list': 3,
+        'retrieve': 2,
+        'create': 4,
+        'update': 4,
+        'partial_update': 3,
+        'destroy': 3,
+    }
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
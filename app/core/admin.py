@@ -6,6 +6,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
 from django import forms
+from django.db import transaction
 from django.db.models import Sum, F, Count
 from django.db.models.functions import TruncMonth,TruncDay
 from django.core import serializers
@@ -15,12 +16,12 @@ from ckeditor.widgets import CKEditorWidget
 from admincharts.admin import AdminChartMixin
 from admincharts.utils import months_between_dates
 from django.db.models import F
-from elasticsearch_dsl import Index
 
-from core.documents import ProductDocument
+from core.services.search_index import index_now
 from core import models
 
 import os
+from functools import partial
 
 
 class ProductAdminForm(forms.ModelForm):
@@ -115,28 +116,10 @@ class ProductAdmin(admin.ModelAdmin):
             self.update_html_file(obj.p_id, file_content)
             obj.description = self.get_html_file_url(obj.p_id)
         super().save_model(request, obj, form, change)
-        image_url = models.ProductImage.objects.filter(p_id=obj).first()
-        if(image_url):
-            image_url = image_url.image_url.url
-        else:
-            image_url = ''
-        product_document = ProductDocument(
-            meta={'id': obj.p_id},
-            p_id=obj.p_id,
-            name=obj.name,
-            price=obj.price,
-            rating=obj.rating,
-            category=obj.category.category, 
-            stock=obj.stock,
-            threshold=obj.threshold,
-            description=obj.description,
-            image_url=image_url
-        )
-
-        product_document.save()
-
-        product_document_index = Index('product')
-        product_document_index.refresh()
+        # Saving queues the product for the index task, wait_for mode also
+        # indexes it before the response so the editor sees the change.
+        if(settings.SEARCH_INDEX_WAIT_FOR):
+            transaction.on_commit(partial(index_now,[obj.p_id]))
 
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
@@ -165,7 +148,8 @@ class ProductAdmin(admin.ModelAdmin):
 
 class ReviewAdmin(admin.ModelAdmin):
     """Define admin page for review."""
-    list_display = ['id','p_id','review','user']
+    list_display = ['id','p_id','review','user','status']
+    list_filter = ['status']
     readonly_fields = ['product_name','user']
     search_fields = ['p_id__name']
     def product_name(self,obj):
@@ -190,7 +174,7 @@ class PaymentAdmin(AdminChartMixin,admin.ModelAdmin):
     """Define admin panel for payment."""
     list_display = ['id',"quantity","status","user",'date_time']
     readonly_fields = ['date_time']
-    list_filter = ['date_time']
+    list_filter = ['status','date_time']
     ordering = ['-date_time']
     search_fields = ['id']
     start_date = None
@@ -316,6 +300,11 @@ class ProductImageAdmin(admin.ModelAdmin):
     list_display = ['p_id','image_url']
     list_per_page = 50
 
+    def delete_queryset(self, request, queryset):
+        p_ids = list(queryset.values_list('p_id',flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        models.ProductImage.refresh_primary_images(p_ids)
+
 class DeliveryAddressAdmin(admin.ModelAdmin):
     """Admin panel for uploading product images"""
     list_display = ['user']
@@ -326,6 +315,13 @@ class AddressAdmin(admin.ModelAdmin):
     list_display = ['id','name','parent']
     list_per_page = 50
 
+class OutboxMessageAdmin(admin.ModelAdmin):
+    """Admin panel for inspecting the task outbox"""
+    list_display = ['id','key','created_at','published_at']
+    list_filter = [('published_at',admin.EmptyFieldListFilter)]
+    readonly_fields = ['signature','key','created_at','published_at']
+    list_per_page = 50
+
 admin.site.register(models.User, UserAdmin)
 admin.site.register(models.Product, ProductAdmin)
 admin.site.register(models.Review, ReviewAdmin)
@@ -336,4 +332,5 @@ admin.site.register(models.ProductImage,ProductImageAdmin)
 admin.site.register(models.PaymentProduct,PaymentProductsAdmin)
 admin.site.register(models.DeliveryAddress,DeliveryAddressAdmin)
 admin.site.register(models.Address,AddressAdmin)
-admin.site.register(models.DiscountCoupon,DiscountCouponAdmin)
\ No newline at end of file
+admin.site.register(models.DiscountCoupon,DiscountCouponAdmin)
+admin.site.register(models.OutboxMessage,OutboxMessageAdmin)
\ No newline at end of file
@@ -1,6 +1,7 @@
 from django_elasticsearch_dsl import Document,Index,fields
 
 from core.models import Product,Category,ProductImage
+from core.services.image_variants import srcset
 from elasticsearch_dsl import connections
 
 product_index = Index('product')
@@ -38,16 +39,22 @@ class ProductDocument(Document):
         analyzer='custom_analyzer'  # Specify the custom analyzer here
     )
     image_url = fields.TextField(attr='image_url.url')
+    srcset = fields.ObjectField(properties={
+        'webp': fields.KeywordField(index=False),
+        'jpeg': fields.KeywordField(index=False),
+    })
     class Django(object):
         model = Product
         related_models = [Category, ProductImage]
 
     def prepare_image_url(self, instance):
-        if instance.product_id_image:
-            if instance.product_id_image.first():
-                return instance.product_id_image.first().image_url.url
+        if instance.primary_image:
+            return instance.primary_image.url
         return ''
 
+    def prepare_srcset(self, instance):
+        return srcset(instance.primary_image_variants)
+
     def get_queryset(self):
         """Not mandatory but to improve performance we can select related in one sql request"""
         return super(ProductDocument, self).get_queryset().select_related(
@@ -64,5 +71,3 @@ class ProductDocument(Document):
         # el
         if isinstance(related_instance, ProductImage):
             return related_instance.p_id
-    
-
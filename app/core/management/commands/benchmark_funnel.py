@@ -0,0 +1,187 @@
+"""
+Django command to measure latency, queries and allocations of the purchase funnel
+"""
+import json
+import math
+import random
+import time
+import tracemalloc
+import uuid
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from elasticsearch_dsl import connections
+from rest_framework.test import APIClient
+
+from core.documents import ProductDocument
+from core.pagination import CustomPagination
+from core.models import User, Product, Category
+from core.services.fake_elasticsearch import FakeElasticsearch
+from core.services.fake_khalti import FakeKhalti
+from core.services.product_cache import invalidate_listings, invalidate_products
+from core.management.commands.seed_benchmark_data import CATEGORY_PREFIX
+
+ENDPOINTS = (
+    'product-list', 'product-detail', 'cart-create', 'payment-create', 'payment-validate', 'payment-download',
+)
+
+
+def percentile(values: list, percent: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent/100*len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the purchase funnel."""
+    help = ('Drive product listing, cart, payment create, validate and download against local fakes of '
+            'Khalti and Elasticsearch, using the data from seed_benchmark_data. Writes to the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Purchases made')
+        parser.add_argument('--warmup', type=int, default=3, help='Purchases made before measuring')
+        parser.add_argument('--alloc-every', type=int, default=5,
+                            help='Trace allocations on every nth purchase, those are left out of latency')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+        parser.add_argument('--baseline', help='JSON report to compare against')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed p95 and query count growth over the baseline')
+
+    def request(self, name, call, traced):
+        """Run one request and record its latency, queries and peak allocations."""
+        if traced:
+            tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = call()
+            elapsed = (time.perf_counter() - started)*1000
+        if response.status_code >= 400:
+            raise CommandError(f"{name} answered {response.status_code}: {getattr(response, 'data', '')}")
+        if traced:
+            self.results[name]['alloc_kib'].append(tracemalloc.get_traced_memory()[1]/1024)
+            tracemalloc.stop()
+        else:
+            self.results[name]['ms'].append(elapsed)
+        self.results[name]['queries'].append(len(queries))
+        return response
+
+    def purchase(self, user, traced):
+        """One pass through the funnel for the user."""
+        client = APIClient()
+        client.force_authenticate(user)
+        product_ids = self.rng.sample(self.product_ids, 2)
+        category = self.rng.choice(list(self.pages))
+        page_no = self.rng.randint(1, self.pages[category])
+        self.request('product-list', lambda: client.get(
+            reverse('product:product-list'), {'category': category, 'page_no': page_no}), traced)
+        self.request('product-detail', lambda: client.get(
+            reverse('product:product-detail', args=[product_ids[0]])), traced)
+        for p_id in product_ids:
+            self.request('cart-create', lambda: client.post(
+                reverse('cart:cart-list'), {'p_id': p_id, 'quantity': 1}), traced)
+        pidx = self.request('payment-create', lambda: client.post(
+            reverse('payment:payment-list'), {'return_url': 'http://localhost:8000/success'}), traced).data['pidx']
+        transaction_id = uuid.uuid4().hex[:22]
+        self.khalti.complete(pidx, transaction_id)
+        amount = self.khalti.payments[pidx]['total_amount']
+        self.request('payment-validate', lambda: client.get(
+            reverse('payment:validate'), {'pidx': pidx, 'transaction_id': transaction_id, 'amount': amount}), traced)
+        response = self.request('payment-download', lambda: client.get(
+            reverse('payment:download'), {'id': pidx}), traced)
+        # Drain the stream so rendering and file reads are measured.
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+
+    def report(self) -> dict:
+        report = {}
+        for name in ENDPOINTS:
+            result = self.results[name]
+            if not result['ms']:
+                continue
+            report[name] = {
+                'requests': len(result['ms']),
+                'p50_ms': round(percentile(result['ms'], 50), 2),
+                'p95_ms': round(percentile(result['ms'], 95), 2),
+                'queries': round(sum(result['queries'])/len(result['queries']), 1),
+                'max_queries': max(result['queries']),
+                'peak_alloc_kib': round(max(result['alloc_kib']), 1) if result['alloc_kib'] else None,
+            }
+        return report
+
+    def regressions(self, report: dict, baseline: dict) -> list:
+        found = []
+        limit = 1 + self.tolerance
+        for name, expected in baseline.items():
+            actual = report.get(name)
+            if actual is None:
+                continue
+            if actual['p95_ms'] > expected['p95_ms']*limit:
+                found.append(f"{name} p95 {actual['p95_ms']}ms > {expected['p95_ms']}ms")
+            if actual['max_queries'] > expected['max_queries']:
+                found.append(f"{name} queries {actual['max_queries']} > {expected['max_queries']}")
+        return found
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        users = list(User.objects.filter(email__startswith="bench-user-", deliveryaddress__isnull=False).distinct())
+        categories = Category.objects.filter(category__startswith=CATEGORY_PREFIX)
+        products = list(Product.objects.filter(category__in=categories).select_related('category'))
+        if not users or len(products) < 2:
+            raise CommandError("No benchmark data, run seed_benchmark_data first")
+        self.rng = random.Random(options['seed'])
+        self.product_ids = [product.p_id for product in products]
+        # Listing pages only up to the last one of each category.
+        counts = Counter(product.category.category for product in products)
+        self.pages = {category: math.ceil(count/CustomPagination.page_size) for category, count in counts.items()}
+        self.tolerance = options['tolerance']
+        self.results = defaultdict(lambda: {'ms': [], 'queries': [], 'alloc_kib': []})
+
+        document = ProductDocument()
+        search = FakeElasticsearch([document.prepare(product) for product in products]).start()
+        self.khalti = FakeKhalti().start()
+        fakes = override_settings(
+            PAYMENT_URL=self.khalti.initiate_url,
+            PAYMENT_LOOKUP_URL=self.khalti.lookup_url,
+            KHALTI_API_KEY="Key benchmark",
+            ELASTICSEARCH_DSL_AUTOSYNC=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        )
+        fakes.enable()
+        connections.configure(default={'hosts': search.url})
+        # Start from cold cache entries of the benchmark products only, other cached data is left alone.
+        invalidate_products(self.product_ids)
+        invalidate_listings({product.category_id for product in products})
+        try:
+            for iteration in range(options['warmup'] + options['iterations']):
+                measured = iteration - options['warmup']
+                traced = measured >= 0 and options['alloc_every'] and measured % options['alloc_every'] == 0
+                self.purchase(self.rng.choice(users), traced)
+                if measured < 0:
+                    self.results.clear()
+        finally:
+            connections.configure(**settings.ELASTICSEARCH_DSL)
+            fakes.disable()
+            self.khalti.stop()
+            search.stop()
+
+        report = self.report()
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(f"{'endpoint':<18}{'requests':>9}{'p50 ms':>9}{'p95 ms':>9}{'queries':>9}{'max q':>7}{'peak KiB':>10}")
+            for name, row in report.items():
+                peak = row['peak_alloc_kib'] if row['peak_alloc_kib'] is not None else '-'
+                self.stdout.write(f"{name:<18}{row['requests']:>9}{row['p50_ms']:>9}{row['p95_ms']:>9}"
+                                  f"{row['queries']:>9}{row['max_queries']:>7}{peak:>10}")
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                found = self.regressions(report, json.load(file))
+            if found:
+                raise CommandError("Regressions over baseline: " + "; ".join(found))
+            self.stdout.write(self.style.SUCCESS("No regressions over baseline"))
@@ -0,0 +1,52 @@
+"""
+Django command to measure invoice rendering time and memory
+"""
+import time
+import tracemalloc
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+
+from core.services.pdf_generator import InvoiceRenderer
+
+
+def sample_rows(products: int) -> list:
+    rows = [['Product Name','Unit Price','Units','Subtotal']]
+    rows += [[f"Product {index}", 100.0, 2, 200.0] for index in range(products)]
+    rows.append(['Discount', None, None, -50.0])
+    return rows
+
+
+class Command(BaseCommand):
+    """Django command to benchmark invoice rendering."""
+    help = 'Compare rendering with a new renderer per invoice against one shared renderer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200, help='Invoices rendered per strategy')
+        parser.add_argument('--products', type=int, default=5, help='Product rows per invoice')
+
+    def measure(self, renderer_for, count, rows):
+        """Mean milliseconds per invoice and peak traced memory in KiB."""
+        tracemalloc.start()
+        started = time.perf_counter()
+        for index in range(count):
+            renderer_for(index).render(BytesIO(), rows, f"txn-{index}")
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return elapsed*1000/count, peak/1024
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        rows = sample_rows(options['products'])
+        count = options['count']
+        shared = InvoiceRenderer()
+        results = {
+            # Building styles and header for every invoice, as generate() did before.
+            'per-invoice renderer': self.measure(lambda index: InvoiceRenderer(), count, rows),
+            'shared renderer': self.measure(lambda index: shared, count, rows),
+        }
+        for name, (ms, peak) in results.items():
+            self.stdout.write(f"{name:>22}: {ms:8.2f} ms/invoice, peak {peak:10.1f} KiB")
+        before, after = results['per-invoice renderer'][0], results['shared renderer'][0]
+        self.stdout.write(self.style.SUCCESS(f"Shared renderer is {before/after:.2f}x the speed of per-invoice setup"))
@@ -0,0 +1,33 @@
+"""
+Django command to render variants of existing product images
+"""
+from django.core.management.base import BaseCommand
+
+from core.models import ProductImage
+from core.services.image_variants import generate_variants
+from core.tasks import generate_image_variants
+
+
+class Command(BaseCommand):
+    """Django command to backfill product image variants."""
+    help = 'Render resized and WebP variants of product images that have none'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Render variants of every image, not only images without variants')
+        parser.add_argument('--sync', action='store_true',
+                            help='Render in this process instead of queueing Celery tasks')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        images = ProductImage.objects.order_by('id')
+        if not options['all']:
+            images = images.filter(variants={})
+        image_ids = list(images.values_list('id', flat=True))
+        for image_id in image_ids:
+            if options['sync']:
+                generate_variants(image_id)
+            else:
+                generate_image_variants.delay(image_id)
+        action = "Rendered" if options['sync'] else "Queued"
+        self.stdout.write(self.style.SUCCESS(f"{action} variants of {len(image_ids)} images"))
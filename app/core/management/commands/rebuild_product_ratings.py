@@ -0,0 +1,16 @@
+"""
+Django command to rebuild product rating aggregates from published reviews
+"""
+from django.core.management.base import BaseCommand
+
+from core.services.product_rating import rebuild_ratings
+
+
+class Command(BaseCommand):
+    """Django command to rebuild product ratings."""
+    help = 'Recompute rating_sum, rating_count and rating of every product'
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        updated = rebuild_ratings()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings of {updated} products"))
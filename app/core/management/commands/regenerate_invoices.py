@@ -0,0 +1,26 @@
+"""
+Django command to render invoices of completed payments in bulk
+"""
+from django.core.management.base import BaseCommand
+
+from core.models import Payment
+from core.services.invoice import generate_many
+
+
+class Command(BaseCommand):
+    """Django command to regenerate or backfill invoices."""
+    help = 'Render the invoice PDF of every completed payment'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing-only', action='store_true',
+                            help='Only render invoices of payments without a stored invoice')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Payments loaded per query')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        payments = Payment.objects.filter(status="Completed").order_by('date_time')
+        if options['missing_only']:
+            payments = payments.filter(invoice_path='')
+        count = generate_many(payments, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rendered {count} invoices"))
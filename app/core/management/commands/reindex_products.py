@@ -0,0 +1,87 @@
+"""
+Django command to rebuild the product search index without downtime
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from elasticsearch.helpers import parallel_bulk
+from elasticsearch_dsl import connections
+
+from core.documents import ProductDocument, product_index
+
+
+class Command(BaseCommand):
+    """Django command to reindex products into a new index behind the product alias."""
+    help = 'Index every product into a new versioned index and swap the alias to it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Products read per query and documents sent per bulk request')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Threads sending bulk requests in parallel')
+        parser.add_argument('--keep-old', action='store_true',
+                            help='Keep the indices the alias pointed to before')
+
+    def actions(self, index_name, chunk_size):
+        """Stream index actions for every product into the given index."""
+        document = ProductDocument()
+        products = document.get_queryset().order_by('p_id').iterator(chunk_size=chunk_size)
+        for product in products:
+            yield {
+                '_op_type': 'index',
+                '_index': index_name,
+                '_id': document.generate_id(product),
+                '_source': document.prepare(product),
+            }
+
+    def swap_alias(self, client, alias, index_name):
+        """Point the alias at index_name in one request and return the indices it left."""
+        actions = [{'add': {'index': index_name, 'alias': alias}}]
+        old_indices = []
+        if client.indices.exists_alias(name=alias):
+            old_indices = list(client.indices.get_alias(name=alias).keys())
+            actions += [{'remove': {'index': index, 'alias': alias}} for index in old_indices]
+        elif client.indices.exists(index=alias):
+            # The first run replaces the index created by search_index --create.
+            actions.append({'remove_index': {'index': alias}})
+        client.indices.update_aliases(body={'actions': actions})
+        return old_indices
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        client = connections.get_connection()
+        alias = product_index._name
+        index_name = f"{alias}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
+        index = product_index.clone(index_name)
+        index.settings(refresh_interval='-1')
+        index.create(using=client)
+
+        indexed = 0
+        failed = 0
+        results = parallel_bulk(
+            client,
+            self.actions(index_name, options['chunk_size']),
+            thread_count=options['workers'],
+            chunk_size=options['chunk_size'],
+            raise_on_error=False,
+        )
+        for ok, item in results:
+            if ok:
+                indexed += 1
+            else:
+                failed += 1
+                self.stderr.write(f"Failed to index {item}")
+        if failed:
+            client.indices.delete(index=index_name)
+            self.stderr.write(self.style.ERROR(f"{failed} products failed, alias {alias} left unchanged"))
+            return
+
+        client.indices.put_settings(index=index_name, body={'index': {'refresh_interval': '1s'}})
+        client.indices.refresh(index=index_name)
+        old_indices = self.swap_alias(client, alias, index_name)
+        if not options['keep_old']:
+            for old_index in old_indices:
+                client.indices.delete(index=old_index)
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} products into {index_name}"))
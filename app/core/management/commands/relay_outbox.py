@@ -0,0 +1,61 @@
+"""
+Django command to publish outbox messages to Celery
+"""
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from core.services import outbox
+
+
+class Command(BaseCommand):
+    """Django command to run the outbox relay."""
+    help = 'Publish committed outbox messages to the broker in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE,
+                            help='Messages published per transaction')
+        parser.add_argument('--interval', type=float, default=settings.OUTBOX_POLL_INTERVAL,
+                            help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Publish what is pending and exit')
+        parser.add_argument('--stats', action='store_true',
+                            help='Print the backlog and lag and exit')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if options['stats']:
+            self.stdout.write(json.dumps(outbox.stats()))
+            return
+        retention = timedelta(hours=settings.OUTBOX_RETENTION_HOURS)
+        last_purge = None
+        failures = 0
+        while True:
+            try:
+                lag = outbox.stats()['lag_seconds']
+                published = outbox.relay_pending(options['batch_size'])
+                if published:
+                    self.stdout.write(self.style.SUCCESS(f"Published {published} messages, lag {lag}s"))
+                if last_purge is None or time.monotonic() - last_purge > 3600:
+                    outbox.purge_published(retention)
+                    last_purge = time.monotonic()
+                failures = 0
+            except Exception as e:
+                if options['once']:
+                    raise
+                # Pending messages stay in the outbox, keep relaying once the broker is back.
+                failures += 1
+                backoff = min(options['interval'] * 2**failures, settings.OUTBOX_MAX_BACKOFF)
+                self.stderr.write(self.style.ERROR(f"Relaying failed: {e!r}, retrying in {backoff}s"))
+                if not connection.in_atomic_block:
+                    # Drop a database connection the error left unusable.
+                    close_old_connections()
+                time.sleep(backoff)
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
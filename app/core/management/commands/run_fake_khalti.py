@@ -0,0 +1,30 @@
+"""
+Django command to serve a local stand-in for the Khalti API
+"""
+from django.core.management.base import BaseCommand
+
+from core.services.fake_khalti import FakeKhalti
+
+
+class Command(BaseCommand):
+    """Django command to run the fake Khalti gateway."""
+    help = 'Serve the Khalti initiate and lookup endpoints from memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--delay', type=float, default=0,
+                            help='Seconds added to every response')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        fake = FakeKhalti(options['host'], options['port'])
+        fake.delay = options['delay']
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake Khalti listening, set PAYMENT_URL={fake.initiate_url} "
+            f"and PAYMENT_LOOKUP_URL={fake.lookup_url}"
+        ))
+        try:
+            fake.server.serve_forever()
+        except KeyboardInterrupt:
+            fake.server.server_close()
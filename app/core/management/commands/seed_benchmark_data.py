@@ -0,0 +1,121 @@
+"""
+Django command to seed a dataset for the purchase funnel benchmark
+"""
+import random
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from core.models import (
+    User, Category, Product, Review, Cart, Payment, PaymentProduct, Address, DeliveryAddress,
+)
+from core.services.product_rating import rebuild_ratings
+
+USER_EMAIL = "bench-user-{}@example.com"
+USER_PASSWORD = "benchmark123"
+CATEGORY_PREFIX = "bench-"
+ADDRESS_PREFIX = "B"
+
+
+def clear():
+    """Delete a previously seeded dataset."""
+    # Seeded products were never indexed, so there is nothing to remove from the index.
+    with override_settings(ELASTICSEARCH_DSL_AUTOSYNC=False):
+        User.objects.filter(email__startswith="bench-user-").delete()
+        Category.objects.filter(category__startswith=CATEGORY_PREFIX).delete()
+        Address.objects.filter(id__startswith=ADDRESS_PREFIX, parent=None).delete()
+
+
+class Command(BaseCommand):
+    """Django command to seed benchmark data."""
+    help = 'Create users, products, reviews, carts, payments and addresses for benchmark_funnel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--reviews', type=int, default=5, help='Reviews per product')
+        parser.add_argument('--cart-items', type=int, default=3, help='Cart rows per user')
+        parser.add_argument('--payments', type=int, default=5, help='Past payments per user')
+        parser.add_argument('--addresses', type=int, default=5,
+                            help='Provinces, cities per province and areas per city')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true', help='Delete the previously seeded data first')
+
+    def seed_addresses(self, count):
+        addresses = []
+        for province in range(count):
+            province_id = f"{ADDRESS_PREFIX}{province}"
+            addresses.append(Address(id=province_id, name=f"Province {province}"))
+            for city in range(count):
+                city_id = f"{province_id}.{city}"
+                addresses.append(Address(id=city_id, name=f"City {city}", parent_id=province_id))
+                for area in range(count):
+                    addresses.append(Address(id=f"{city_id}.{area}", name=f"Area {area}", parent_id=city_id))
+        Address.objects.bulk_create(addresses)
+        return [address for address in addresses if address.id.count('.') == 2]
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            if options['clear']:
+                clear()
+            # One hash for every user, hashing each password would dominate seeding.
+            password = make_password(USER_PASSWORD)
+            users = User.objects.bulk_create([
+                User(email=USER_EMAIL.format(index), first_name="Bench", last_name=str(index),
+                     phone="9800000000", password=password, is_active=True)
+                for index in range(options['users'])
+            ])
+            categories = Category.objects.bulk_create([
+                Category(category=f"{CATEGORY_PREFIX}{index}") for index in range(options['categories'])
+            ])
+            # Stock is high enough for the benchmark never to run out.
+            products = Product.objects.bulk_create([
+                Product(name=f"Bench product {index}", price=rng.randint(10, 5000), stock=10**6, threshold=10,
+                        description=f"Benchmark product {index}", category=rng.choice(categories))
+                for index in range(options['products'])
+            ])
+            Review.objects.bulk_create([
+                Review(p_id=product, user=user, review="Works as described",
+                       rating=rng.randint(1, 5), status="Published")
+                # A user reviews a product at most once.
+                for product in products for user in rng.sample(users, min(options['reviews'], len(users)))
+            ], batch_size=1000)
+            rebuild_ratings()
+
+            Cart.objects.bulk_create([
+                Cart(user=user, p_id=product, quantity=rng.randint(1, 3))
+                for user in users for product in rng.sample(products, min(options['cart_items'], len(products)))
+            ], batch_size=1000)
+
+            payments = []
+            payment_products = []
+            for user in users:
+                for _ in range(options['payments']):
+                    payment = Payment(id=uuid.uuid4().hex[:22], user=user, quantity=0, status="Completed",
+                                      transaction_id=uuid.uuid4().hex[:22], amount=0)
+                    for product in rng.sample(products, min(3, len(products))):
+                        quantity = rng.randint(1, 3)
+                        payment.quantity += quantity
+                        payment.amount += product.price*quantity
+                        payment_products.append(PaymentProduct(payment_id=payment, product=product, quantity=quantity,
+                                                               amount=product.price*quantity))
+                    payments.append(payment)
+            Payment.objects.bulk_create(payments, batch_size=1000)
+            PaymentProduct.objects.bulk_create(payment_products, batch_size=1000)
+
+            areas = self.seed_addresses(options['addresses'])
+            DeliveryAddress.objects.bulk_create([
+                DeliveryAddress(user=user, area=area, city_id=area.parent_id, provience_id=area.parent_id.split('.')[0])
+                for user, area in ((user, rng.choice(areas)) for user in users)
+            ])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} users, {len(products)} products, {len(payments)} payments "
+            f"and {len(areas)} delivery areas"
+        ))
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:54
+
+from django.db import migrations, models
+
+
+def publish_existing_reviews(apps, schema_editor):
+    """Reviews created before moderation was asynchronous were already checked."""
+    Review = apps.get_model('core', 'Review')
+    Review.objects.update(status='Published')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_remove_user_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending (Default)'), ('Published', 'Published'), ('Rejected', 'Rejected')], default='Pending', max_length=9),
+        ),
+        migrations.RunPython(publish_existing_reviews, migrations.RunPython.noop),
+    ]
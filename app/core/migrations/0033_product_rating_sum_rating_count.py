@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:56
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    """Fill rating_sum and rating_count from published reviews."""
+    Product = apps.get_model('core', 'Product')
+    Review = apps.get_model('core', 'Review')
+    published = Review.objects.filter(
+        p_id=OuterRef('pk'), status='Published', rating__isnull=False
+    ).order_by().values('p_id')
+    Product.objects.update(
+        rating_sum=Coalesce(Subquery(published.annotate(total=Sum('rating')).values('total')), Value(0.0)),
+        rating_count=Coalesce(Subquery(published.annotate(total=Count('id')).values('total')), Value(0)),
+    )
+    Product.objects.filter(rating_count__gt=0).update(rating=F('rating_sum')/F('rating_count'))
+    Product.objects.filter(rating_count=0).update(rating=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_review_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_product_rating_sum_rating_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['user', 'p_id'], name='cart_user_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='discountcoupon',
+            index=models.Index(condition=models.Q(('used', False)), fields=['user', '-id'], name='coupon_user_unused_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', '-date_time'], name='payment_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', 'status'], name='payment_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentproduct',
+            index=models.Index(fields=['payment_id', 'product'], name='paymentproduct_payment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('status', 'Published')), fields=['p_id', '-id'], name='review_product_published_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='invoice_path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0039_outbox_message'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('Completed', 'Completed'), ('Pending', 'Pending (Default)'), ('Refunded', 'Refunded'), ('Expired', 'Expired'), ('Canceled', 'Canceled'), ('NeedsRefund', 'Paid but out of stock, needs refund')], default='Pending', max_length=11),
+        ),
+    ]
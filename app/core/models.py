@@ -3,6 +3,8 @@ Database Models
 """
 
 from django.db import models
+from django.db.models import JSONField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -64,7 +66,12 @@ class Product(models.Model):
     threshold = models.IntegerField(validators=[MinValueValidator(0)])
     stock = models.IntegerField(validators=[MinValueValidator(0)])
     rating = models.FloatField(validators=[MinValueValidator(1.0,"Minimum value muct be 1"),MaxValueValidator(5.0,"Maximum value must be 5")],default=0)
+    rating_sum = models.FloatField(default=0)
+    rating_count = models.IntegerField(default=0)
     description = models.CharField(max_length=200,default=None,null=True)
+    # File of the product's first image, maintained by ProductImage.
+    primary_image = models.ImageField(upload_to='images/',blank=True,null=True,default=None,editable=False)
+    primary_image_variants = models.JSONField(default=dict,blank=True,editable=False)
     category = models.ForeignKey(
         Category,
         on_delete=models.CASCADE,
@@ -74,6 +81,11 @@ class Product(models.Model):
 
 class Review(models.Model):
     """Create Review Table."""
+    TYPE_STATUS = [
+        ("Pending", "Pending (Default)"),
+        ("Published", "Published"),
+        ("Rejected", "Rejected")
+    ]
     p_id = models.ForeignKey(
         Product,
         on_delete=models.CASCADE,
@@ -86,9 +98,13 @@ class Review(models.Model):
         related_name='user_review'
     )
     rating = models.FloatField(validators=[MinValueValidator(1.0,"Minimum value muct be 1"),MaxValueValidator(5.0,"Maximum value must be 5")],null=True,default=None)
+    status = models.CharField(choices=TYPE_STATUS,max_length=9,default='Pending')
 
     class Meta:
         unique_together = ('p_id','user')
+        indexes = [
+            models.Index(fields=['p_id','-id'],condition=models.Q(status='Published'),name='review_product_published_idx'),
+        ]
 
 class Cart(models.Model):
     """Create Cart model."""
@@ -104,6 +120,11 @@ class Cart(models.Model):
         related_name='user_cart'
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user','p_id'],name='cart_user_product_idx'),
+        ]
+
 
 class DiscountCoupon(models.Model):
     """Discount coupon for a user."""
@@ -113,15 +134,25 @@ class DiscountCoupon(models.Model):
     max_percentage = models.IntegerField()
     used = models.BooleanField(default=False)
 
+    class Meta:
+        # Redemption looks up (user, coupon_code, used), but coupon_code is unique, so its
+        # own index already narrows that to one row; a (user, coupon_code) index would duplicate it.
+        indexes = [
+            models.Index(fields=['user','-id'],condition=models.Q(used=False),name='coupon_user_unused_idx'),
+        ]
+
 class Payment(models.Model):
     TYPE_STATUS = [
         ("Completed", "Completed"),
         ("Pending", "Pending (Default)"),
-        ("Refunded", "Refunded")
+        ("Refunded", "Refunded"),
+        ("Expired", "Expired"),
+        ("Canceled", "Canceled"),
+        ("NeedsRefund", "Paid but out of stock, needs refund"),
     ]
     id = models.CharField(max_length=25, primary_key=True)
     quantity = models.IntegerField(validators=[MinValueValidator(1)])
-    status = models.CharField(choices=TYPE_STATUS,max_length=9,default='Pending')
+    status = models.CharField(choices=TYPE_STATUS,max_length=11,default='Pending')
     transaction_id = models.CharField(max_length=25,null=True,default=None)
     amount = models.FloatField(default=None,null=True,blank=True)
     user = models.ForeignKey(
@@ -132,6 +163,14 @@ class Payment(models.Model):
     date_time = models.DateTimeField(auto_now_add=True)
     coupon = models.ForeignKey(DiscountCoupon,on_delete=models.DO_NOTHING,null=True,default=None)
     discount_amount = models.FloatField(null=True,default=0)
+    # Content-addressed path of the invoice in the invoices storage.
+    invoice_path = models.CharField(max_length=100,blank=True,default='',editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user','-date_time'],name='payment_user_date_idx'),
+            models.Index(fields=['user','status'],name='payment_user_status_idx'),
+        ]
 
 class Address(models.Model):
     """Available addresses."""
@@ -156,10 +195,17 @@ class PaymentProduct(models.Model):
     quantity = models.IntegerField(validators=[MinValueValidator(1)])
     amount = models.FloatField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['payment_id','product'],name='paymentproduct_payment_idx'),
+        ]
+
 class ProductImage(models.Model):
     """Model to store images of product."""
     p_id = models.ForeignKey(Product,on_delete=models.CASCADE,related_name='product_id_image')
     image_url = models.ImageField(upload_to='images/')
+    # {format: {width: path}} written by core.services.image_variants.
+    variants = models.JSONField(default=dict,blank=True,editable=False)
 
     def clean(self):
         # Count the existing records with the same p_id
@@ -174,4 +220,35 @@ class ProductImage(models.Model):
     def save(self, *args, **kwargs):
         # Clean the model before saving to validate the limit
         self.clean()
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+        ProductImage.refresh_primary_images([self.p_id_id])
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        ProductImage.refresh_primary_images([self.p_id_id])
+        return result
+
+    @classmethod
+    def refresh_primary_images(cls, p_ids):
+        """Set primary_image of the products to their first image in one UPDATE."""
+        first_image = cls.objects.filter(p_id=OuterRef('pk')).order_by('id')
+        Product.objects.filter(p_id__in=p_ids).update(
+            primary_image=Subquery(first_image.values('image_url')[:1]),
+            primary_image_variants=Coalesce(Subquery(first_image.values('variants')[:1]),Value({},JSONField())),
+        )
+
+class OutboxMessage(models.Model):
+    """Celery signature to publish once the transaction that wrote it commits."""
+    signature = models.JSONField()
+    # Messages sharing a key are only enqueued once.
+    key = models.CharField(max_length=255,unique=True,null=True,blank=True,default=None)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True,blank=True,default=None)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'],condition=models.Q(published_at=None),name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.signature.get('task')} ({self.key or self.id})"
@@ -1,6 +1,93 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.db import connections
+from rest_framework.pagination import PageNumberPagination, CursorPagination, Cursor
 
 class CustomPagination(PageNumberPagination):
     page_size = 10
     page_query_param = "page_no"
-    max_page_size = 100
\ No newline at end of file
+    max_page_size = 100
+
+
+def approximate_count(queryset) -> int:
+    """Row estimate from the PostgreSQL planner, exact count on other databases."""
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.count()
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(CursorPagination):
+    """Cursor pagination on the ordering the view already applies to its queryset.
+
+    Clients opt in by sending a cursor, an empty one for the first page.
+    Pages are then fetched with WHERE <ordering field> < position instead of
+    OFFSET, and no COUNT(*) is run unless ?total=true asks for an approximate
+    total. Requests without a cursor are answered by CustomPagination.
+    """
+    page_size = CustomPagination.page_size
+    ordering = '-id'
+    total_query_param = 'total'
+    legacy_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            self.legacy_paginator = CustomPagination()
+            return self.legacy_paginator.paginate_queryset(queryset, request, view)
+        self.total = None
+        if request.query_params.get(self.total_query_param) in ('1', 'true', 'True'):
+            self.total = approximate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def decode_cursor(self, request):
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(field for field in queryset.query.order_by if isinstance(field, str))
+        return ordering or super().get_ordering(request, queryset, view)
+
+    def get_paginated_response(self, data):
+        if self.legacy_paginator:
+            return self.legacy_paginator.get_paginated_response(data)
+        response = super().get_paginated_response(data)
+        if self.total is not None:
+            response.data['total'] = self.total
+        return response
+
+    def to_html(self):
+        if self.legacy_paginator:
+            return self.legacy_paginator.to_html()
+        return super().to_html()
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['total'] = {
+            'type': 'integer',
+            'description': 'Approximate number of results, only with ?total=true.',
+        }
+        return response_schema
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        parameters.append({
+            'name': self.total_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Include an approximate total.',
+            'schema': {'type': 'boolean'},
+        })
+        parameters.append({
+            'name': CustomPagination.page_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Page number, used when no cursor is sent.',
+            'schema': {'type': 'integer'},
+        })
+        return parameters
+
+    def cursor_url(self, base_url, position) -> str:
+        """Link to the page that follows the given position."""
+        self.base_url = base_url
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=str(position)))
@@ -0,0 +1,119 @@
+"""SQL query budgets for API views.
+
+A viewset declares the most queries each of its actions may run as
+`query_budgets = {action: queries}`. QueryStatsMiddleware records the queries
+and database time of every request and warns when an action runs over its
+budget. QueryBudgetMixin enforces the budgets in tests, and checks that the
+count stays the same however many rows the request touches.
+"""
+
+import time
+from contextlib import ExitStack, contextmanager
+from logging import getLogger
+
+from django.conf import settings
+from django.db import connections
+from rest_framework_simplejwt.tokens import AccessToken
+
+logger = getLogger(__name__)
+
+
+class QueryRecorder:
+    """Database execute wrapper that counts queries and sums their time."""
+
+    def __init__(self):
+        self.queries = []
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.queries.append(sql)
+
+    def __len__(self):
+        return len(self.queries)
+
+    @contextmanager
+    def record(self):
+        """Record the queries run on any database inside the block."""
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+
+def view_action(view, method: str) -> tuple:
+    """Viewset class of a routed view function and the action it dispatches the method to."""
+    actions = getattr(view, 'actions', None) or {}
+    return getattr(view, 'cls', None), actions.get(method.lower())
+
+
+def action_budget(cls, action: str):
+    """Query budget of the action, None if the view declares none."""
+    return getattr(cls, 'query_budgets', {}).get(action)
+
+
+class QueryStatsMiddleware:
+    """Log SQL query count and time of each view, and budget overruns."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+        match = request.resolver_match
+        if match is None:
+            return response
+        cls, action = view_action(match.func, request.method)
+        name = f"{cls.__name__}.{action}" if cls and action else match.view_name
+        milliseconds = recorder.duration*1000
+        if settings.QUERY_STATS_SERVER_TIMING:
+            response['Server-Timing'] = f'db;dur={milliseconds:.1f};desc="{len(recorder)} queries"'
+        budget = action_budget(cls, action)
+        if budget is not None and len(recorder) > budget:
+            logger.warning("%s ran %d queries, over its budget of %d", name, len(recorder), budget)
+        else:
+            logger.debug("%s ran %d queries in %.1fms", name, len(recorder), milliseconds)
+        return response
+
+
+class QueryBudgetMixin:
+    """TestCase assertions for the query budgets of viewset actions.
+
+    Budgets include the user lookup of JWT authentication, so clients
+    should log in with authenticate() rather than force_authenticate().
+    """
+
+    def authenticate(self, client, user):
+        """Send a bearer access token for the user with every request."""
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+    def assertWithinBudget(self, viewset, action: str, request):
+        """Call request() and fail if it runs more queries than the action's budget."""
+        budget = action_budget(viewset, action)
+        self.assertIsNotNone(budget, f"{viewset.__name__}.{action} declares no query budget")
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = request()
+        self.assertLess(response.status_code, 400, getattr(response, 'data', response))
+        self.assertLessEqual(
+            len(recorder), budget,
+            f"{viewset.__name__}.{action} ran {len(recorder)} queries, budget {budget}:\n" + "\n".join(recorder.queries)
+        )
+        return len(recorder)
+
+    def assertBudgetIndependentOfN(self, viewset, action: str, seed, request, sizes=(1, 5)):
+        """Seed each size of data, then check the action runs the same number of queries within budget."""
+        counts = {}
+        for size in sizes:
+            seed(size)
+            counts[size] = self.assertWithinBudget(viewset, action, request)
+        self.assertEqual(
+            len(set(counts.values())), 1,
+            f"{viewset.__name__}.{action} queries grow with the data, queries per size: {counts}"
+        )
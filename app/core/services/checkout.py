@@ -0,0 +1,70 @@
+"""Price a user's cart once and carry the result through checkout."""
+
+from core.models import Cart, PaymentProduct
+
+
+class PricedCartItem:
+    """A cart row joined with the product it points to."""
+
+    def __init__(self, product, quantity: int):
+        self.product = product
+        self.quantity = quantity
+
+    @property
+    def unit_price(self) -> float:
+        return self.product.price
+
+    @property
+    def total_price(self) -> float:
+        return self.quantity*self.product.price
+
+    def as_product_detail(self) -> dict:
+        """Line item in the shape expected by Khalti's product_details."""
+        return {
+            "name": self.product.name,
+            "unit_price": self.unit_price,
+            "quantity": self.quantity,
+            "total_price": self.total_price,
+            "identity": str(self.product.p_id),
+            "id": self.product.p_id,
+        }
+
+
+class PricedCart:
+    """Cart of a user priced from a single cart + product query."""
+
+    def __init__(self, items: list):
+        self.items = items
+
+    @classmethod
+    def for_user(cls, user):
+        """Load the cart of the user together with its products."""
+        carts = Cart.objects.filter(user=user).select_related('p_id').order_by('id')
+        return cls([PricedCartItem(cart.p_id, cart.quantity) for cart in carts])
+
+    def __len__(self):
+        return len(self.items)
+
+    def is_empty(self) -> bool:
+        return len(self.items) == 0
+
+    @property
+    def total_amount(self) -> float:
+        return sum(item.total_price for item in self.items)
+
+    @property
+    def total_quantity(self) -> int:
+        return sum(item.quantity for item in self.items)
+
+    def product_details(self) -> list:
+        return [item.as_product_detail() for item in self.items]
+
+    def create_payment_products(self, payment) -> list:
+        """Persist the priced lines of the cart against a payment in one insert."""
+        return PaymentProduct.objects.bulk_create([
+            PaymentProduct(payment_id=payment,
+                           product=item.product,
+                           quantity=item.quantity,
+                           amount=item.total_price)
+            for item in self.items
+        ])
@@ -0,0 +1,151 @@
+"""Local stand-in for the Elasticsearch search API used by benchmarks.
+
+It serves _search and _count requests from documents held in memory. Only what the
+product listing sends is understood: term and match clauses, sort, from
+and size. Use a real cluster to measure search itself.
+"""
+
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+VERSION = "7.17.12"
+
+
+def _clauses(query, kind: str):
+    """Every {field: value} under a clause of the kind, anywhere in the query."""
+    if isinstance(query, dict):
+        for key, value in query.items():
+            if key == kind and isinstance(value, dict):
+                yield value
+            else:
+                yield from _clauses(value, kind)
+    elif isinstance(query, list):
+        for value in query:
+            yield from _clauses(value, kind)
+
+
+def _search_text(query) -> list:
+    words = []
+    for clause in _clauses(query, 'multi_match'):
+        words += str(clause.get('query', '')).lower().split()
+    for clause in _clauses(query, 'match'):
+        for value in clause.values():
+            value = value.get('query', '') if isinstance(value, dict) else value
+            words += str(value).lower().split()
+    return words
+
+
+def _sort_key(sort: list):
+    fields = []
+    for item in sort:
+        if isinstance(item, str):
+            field, descending = item.lstrip('-'), item.startswith('-')
+        else:
+            field, options = next(iter(item.items()))
+            order = options.get('order', 'asc') if isinstance(options, dict) else options
+            descending = order == 'desc'
+        fields.append((field, descending))
+    return fields
+
+
+class FakeElasticsearch:
+    """Threaded HTTP server answering searches over in-memory documents."""
+
+    def __init__(self, documents: list, id_field: str = 'p_id', host: str = "127.0.0.1", port: int = 0):
+        self.documents = documents
+        self.id_field = id_field
+        self.searches = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeElasticsearch":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def matches(self, query: dict) -> list:
+        hits = self.documents
+        for clause in _clauses(query, 'term'):
+            for field, value in clause.items():
+                value = value.get('value') if isinstance(value, dict) else value
+                hits = [document for document in hits if str(document.get(field)) == str(value)]
+        words = _search_text(query)
+        if words:
+            hits = [document for document in hits if all(word in str(document.get('name', '')).lower() for word in words)]
+        return hits
+
+    def count(self, body: dict) -> dict:
+        return {
+            "count": len(self.matches(body.get('query', {}))),
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+        }
+
+    def search(self, index: str, body: dict) -> dict:
+        self.searches += 1
+        hits = self.matches(body.get('query', {}))
+        for field, descending in reversed(_sort_key(body.get('sort', []))):
+            hits = sorted(hits, key=lambda document: document.get(field) or 0, reverse=descending)
+        start = body.get('from', 0)
+        page = hits[start:start + body.get('size', 10)]
+        return {
+            "took": 1,
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {
+                "total": {"value": len(hits), "relation": "eq"},
+                "max_score": None,
+                "hits": [
+                    {"_index": index, "_type": "_doc", "_id": str(document[self.id_field]), "_score": None, "_source": document}
+                    for document in page
+                ],
+            },
+        }
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def respond(self, data: dict, code: int = 200):
+                content = json.dumps(data).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                # The 7.x client refuses servers that do not identify as Elasticsearch.
+                self.send_header("X-Elastic-Product", "Elasticsearch")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                path = self.path.split('?')[0].strip('/')
+                if path.endswith('_search'):
+                    self.respond(fake.search(path.split('/')[0], json.loads(body or b"{}")))
+                elif path.endswith('_count'):
+                    self.respond(fake.count(json.loads(body or b"{}")))
+                elif not path:
+                    self.respond({
+                        "name": "fake",
+                        "cluster_name": "fake",
+                        "version": {"number": VERSION, "build_flavor": "default"},
+                        "tagline": "You Know, for Search",
+                    })
+                else:
+                    self.respond({"error": "not supported", "status": 400}, 400)
+
+            do_POST = do_GET
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,139 @@
+"""Local stand-in for the Khalti ePayment API used by tests and benchmarks.
+
+It answers the initiate and lookup endpoints from memory. Payments start as
+Pending and are completed with complete(). Latency and failures can be
+injected to exercise timeouts, retries and the circuit breaker.
+"""
+
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+INITIATE_PATH = "/api/v2/epayment/initiate/"
+LOOKUP_PATH = "/api/v2/epayment/lookup/"
+
+
+class FakeKhalti:
+    """Threaded HTTP server with the Khalti initiate and lookup endpoints."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.payments = {}
+        self.requests = []
+        # Client addresses seen, one per TCP connection.
+        self.connections = set()
+        self.delay = 0
+        self.failures = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def initiate_url(self) -> str:
+        return self.base_url+INITIATE_PATH
+
+    @property
+    def lookup_url(self) -> str:
+        return self.base_url+LOOKUP_PATH
+
+    def start(self) -> "FakeKhalti":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def fail_next(self, count: int = 1, status: int = 503):
+        """Answer the next count requests with the status."""
+        with self.lock:
+            self.failures.extend([status]*count)
+
+    def complete(self, pidx: str, transaction_id: str = None):
+        """Mark a payment as paid by the customer."""
+        with self.lock:
+            payment = self.payments[pidx]
+            payment['status'] = "Completed"
+            payment['transaction_id'] = transaction_id or uuid.uuid4().hex[:22]
+
+    def _respond(self, path: str, headers, body: bytes) -> tuple:
+        with self.lock:
+            self.requests.append(path)
+            if self.failures:
+                return self.failures.pop(0), {"detail": "Service unavailable"}
+        if self.delay:
+            time.sleep(self.delay)
+        if not headers.get("Authorization"):
+            return 401, {"detail": "Authentication credentials were not provided."}
+        if path == INITIATE_PATH:
+            return self._initiate(json.loads(body or b"{}"))
+        if path == LOOKUP_PATH:
+            return self._lookup(parse_qs(body.decode()).get("pidx", [""])[0])
+        return 404, {"detail": "Not found."}
+
+    def _initiate(self, payload: dict) -> tuple:
+        if float(payload.get("amount") or 0) < 1000:
+            return 400, {
+                "amount": ["Amount should be greater than Rs. 10, that is 1000 paisa."],
+                "error_key": "validation_error",
+            }
+        pidx = uuid.uuid4().hex[:22]
+        with self.lock:
+            self.payments[pidx] = {
+                "pidx": pidx,
+                "total_amount": payload["amount"],
+                "status": "Pending",
+                "transaction_id": None,
+                "fee": 0,
+                "refunded": False,
+            }
+        return 200, {
+            "pidx": pidx,
+            "payment_url": f"{self.base_url}/?pidx={pidx}",
+            "expires_at": "",
+            "expires_in": 1800,
+        }
+
+    def _lookup(self, pidx: str) -> tuple:
+        with self.lock:
+            payment = self.payments.get(pidx)
+            if payment is None:
+                return 404, {"detail": "Not found.", "error_key": "validation_error"}
+            return 200, dict(payment)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                fake.connections.add(self.client_address)
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                code, data = fake._respond(self.path, self.headers, body)
+                content = json.dumps(data).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
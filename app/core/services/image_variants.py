@@ -0,0 +1,73 @@
+"""Resized JPEG and WebP variants of product images for responsive clients."""
+
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from core.models import ProductImage
+
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 6},
+    'jpeg': {'format': 'JPEG', 'quality': 80, 'optimize': True, 'progressive': True},
+}
+
+
+def variant_path(image: ProductImage, width: int, extension: str) -> str:
+    stem = os.path.splitext(os.path.basename(image.image_url.name))[0]
+    return f"images/variants/{image.pk}/{stem}-{width}.{extension}"
+
+
+def render_variants(image: ProductImage) -> dict:
+    """Write every configured width narrower than the original in each format.
+
+    Returns {format: {width: path}}. The original is never upscaled.
+    """
+    with image.image_url.open('rb') as file:
+        original = ImageOps.exif_transpose(Image.open(file))
+        original = original.convert('RGB')
+    variants = {extension: {} for extension in FORMATS}
+    for width in sorted(settings.PRODUCT_IMAGE_VARIANT_WIDTHS):
+        if width >= original.width:
+            break
+        height = round(original.height*width/original.width)
+        resized = original.resize((width, height), Image.LANCZOS)
+        for extension, options in FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, **options)
+            path = variant_path(image, width, extension)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            variants[extension][str(width)] = default_storage.save(path, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def generate_variants(image_id: int) -> dict:
+    """Render and store the variants of a product image."""
+    # core.documents imports this module for srcset.
+    from core.services.product_cache import invalidate_products
+    from core.services.search_index import queue_products
+    image = ProductImage.objects.filter(pk=image_id).first()
+    if image is None:
+        return {}
+    variants = render_variants(image)
+    ProductImage.objects.filter(pk=image_id).update(variants=variants)
+    ProductImage.refresh_primary_images([image.p_id_id])
+    # Updates send no save signals.
+    invalidate_products([image.p_id_id])
+    queue_products([image.p_id_id])
+    return variants
+
+
+def srcset(variants: dict) -> dict:
+    """{format: "url 320w, url 640w"} ready for <source srcset>."""
+    return {
+        extension: ", ".join(
+            f"{default_storage.url(path)} {width}w"
+            for width, path in sorted(paths.items(), key=lambda item: int(item[0]))
+        )
+        for extension, paths in (variants or {}).items() if paths
+    }
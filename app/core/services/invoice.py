@@ -0,0 +1,80 @@
+"""Build payment invoices from stored payment rows."""
+
+from io import BytesIO
+
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from core.models import Payment, PaymentProduct
+from core.services.invoice_storage import invoice_exists, save_invoice
+from core.services.pdf_generator import get_renderer
+
+
+def invoice_file_name(payment_id: str) -> str:
+    return payment_id+'.pdf'
+
+
+def with_invoice_rows(payments):
+    """Prefetch the purchased products of the payments in two queries."""
+    return payments.prefetch_related(Prefetch(
+        'paymentproduct_set',
+        queryset=PaymentProduct.objects.select_related('product').order_by('id'),
+    ))
+
+
+def invoice_rows(payment: Payment) -> list:
+    """Header, one row per purchased product and the discount."""
+    rows = [['Product Name','Unit Price','Units','Subtotal']]
+    for payment_product in payment.paymentproduct_set.all():
+        product = payment_product.product
+        rows.append([product.name,product.price,payment_product.quantity,payment_product.amount])
+    rows.append(['Discount',None,None,payment.discount_amount*-1])
+    return rows
+
+
+def render(payment: Payment) -> bool:
+    """Render and store the invoice, setting payment.invoice_path without saving it.
+
+    Returns whether the path changed.
+    """
+    buffer = BytesIO()
+    issued = timezone.localtime(payment.date_time)
+    get_renderer().render(buffer,invoice_rows(payment),payment.transaction_id or '',issued)
+    path = save_invoice(buffer.getvalue())
+    changed = payment.invoice_path != path
+    payment.invoice_path = path
+    return changed
+
+
+def generate_invoice(payment_id: str) -> str:
+    """Render the invoice PDF of a completed payment. Returns its storage path."""
+    payment = with_invoice_rows(Payment.objects.all()).get(id=payment_id,status="Completed")
+    if(render(payment)):
+        Payment.objects.filter(id=payment.id).update(invoice_path=payment.invoice_path)
+    return payment.invoice_path
+
+
+def generate_many(payments, chunk_size: int = 500) -> int:
+    """Render the invoices of a queryset of completed payments.
+
+    Rows are prefetched and new paths saved per chunk, and every invoice
+    reuses the same renderer. Returns the number of invoices written.
+    """
+    count = 0
+    changed = []
+    for payment in with_invoice_rows(payments.filter(status="Completed")).iterator(chunk_size=chunk_size):
+        if(render(payment)):
+            changed.append(payment)
+        if(len(changed) >= chunk_size):
+            Payment.objects.bulk_update(changed,['invoice_path'])
+            changed = []
+        count += 1
+    Payment.objects.bulk_update(changed,['invoice_path'])
+    return count
+
+
+def ensure_invoice(payment: Payment) -> str:
+    """Storage path of the invoice, rendering it first if the worker has not yet."""
+    if not invoice_exists(payment.invoice_path):
+        return generate_invoice(payment.id)
+    return payment.invoice_path
@@ -0,0 +1,52 @@
+"""Content-addressed invoice files on the storage configured as STORAGES["invoices"].
+
+Files are named after the SHA-256 of their bytes and sharded into two
+directory levels, so identical invoices are stored once and no directory
+grows past a few thousand entries. Any Django storage works, the settings
+ship a local disk and an S3-compatible configuration.
+"""
+
+import hashlib
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, storages
+
+
+def invoice_storage():
+    return storages["invoices"]
+
+
+def content_path(content: bytes) -> str:
+    """Sharded path of the content, e.g. 3f/a2/3fa2...e1.pdf."""
+    digest = hashlib.sha256(content).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.pdf"
+
+
+def digest_of(path: str) -> str:
+    """Content hash encoded in a path returned by save_invoice."""
+    return path.rsplit('/', 1)[-1].split('.', 1)[0]
+
+
+def save_invoice(content: bytes) -> str:
+    """Store the invoice unless the same bytes are already stored. Returns its path."""
+    storage = invoice_storage()
+    path = content_path(content)
+    if not storage.exists(path):
+        saved = storage.save(path, ContentFile(content))
+        # Storages that avoid overwrites rename on a race, keep the canonical name.
+        if saved != path:
+            storage.delete(saved)
+    return path
+
+
+def invoice_exists(path) -> bool:
+    return bool(path) and invoice_storage().exists(path)
+
+
+def on_local_disk() -> bool:
+    """Whether invoices are files a reverse proxy on this host can send itself."""
+    return isinstance(invoice_storage(), FileSystemStorage)
+
+
+def open_invoice(path: str):
+    return invoice_storage().open(path, 'rb')
@@ -0,0 +1,142 @@
+"""Khalti ePayment API client shared by every request of a process.
+
+One requests.Session keeps connections to the gateway alive, every call has
+connect and read timeouts, lookups are retried with jittered backoff and a
+circuit breaker fails calls fast while the gateway keeps failing.
+"""
+
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+# Gateway responses that mean it is unhealthy rather than that the request was wrong.
+UNAVAILABLE_STATUSES = (502, 503, 504)
+
+
+class GatewayUnavailable(Exception):
+    """The gateway could not be reached, timed out or answered with a 5xx."""
+
+
+class CircuitOpen(GatewayUnavailable):
+    """Recent calls failed, the gateway is not called until the reset timeout passes."""
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures.
+
+    Once open, calls fail straight away for `reset_timeout` seconds. The
+    first call after that is let through as a trial and closes the breaker
+    again if it succeeds.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def before_call(self):
+        with self.lock:
+            state = self.state
+            if state == 'open' or (state == 'half-open' and self.trial):
+                raise CircuitOpen("Khalti circuit is open")
+            if state == 'half-open':
+                self.trial = True
+
+    def record_success(self):
+        with self.lock:
+            self.reset()
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class KhaltiClient:
+    """Calls the Khalti initiate and lookup endpoints.
+
+    Responses are returned as is, 4xx included. GatewayUnavailable is raised
+    when no usable response was received.
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.KHALTI_POOL_MAXSIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.breaker = CircuitBreaker(settings.KHALTI_BREAKER_THRESHOLD, settings.KHALTI_BREAKER_RESET_TIMEOUT)
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": settings.KHALTI_API_KEY}
+
+    @property
+    def timeout(self) -> tuple:
+        return (settings.KHALTI_CONNECT_TIMEOUT, settings.KHALTI_READ_TIMEOUT)
+
+    def _post(self, url: str, **kwargs) -> requests.Response:
+        try:
+            response = self.session.post(url=url, headers=self.headers, timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            raise GatewayUnavailable(str(e)) from e
+        if response.status_code in UNAVAILABLE_STATUSES:
+            raise GatewayUnavailable(f"Khalti answered {response.status_code}")
+        return response
+
+    def _call(self, url: str, retries: int, **kwargs) -> requests.Response:
+        self.breaker.before_call()
+        for attempt in range(retries + 1):
+            try:
+                response = self._post(url, **kwargs)
+            except GatewayUnavailable:
+                if attempt == retries:
+                    self.breaker.record_failure()
+                    raise
+                # Full jitter keeps retries from many workers from arriving together.
+                backoff = min(settings.KHALTI_RETRY_BACKOFF_MAX, settings.KHALTI_RETRY_BACKOFF*2**attempt)
+                time.sleep(random.uniform(0, backoff))
+            else:
+                self.breaker.record_success()
+                return response
+
+    def initiate(self, payload: dict) -> requests.Response:
+        """Start a payment. Not retried, a repeat could create a second payment."""
+        return self._call(settings.PAYMENT_URL, retries=0, json=payload)
+
+    def lookup(self, pidx: str) -> requests.Response:
+        """Current state of a payment. Lookups are idempotent and retried."""
+        return self._call(settings.PAYMENT_LOOKUP_URL, retries=settings.KHALTI_LOOKUP_RETRIES, data={"pidx": pidx})
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> KhaltiClient:
+    """Client of the process, built on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = KhaltiClient()
+    return _client
@@ -0,0 +1,194 @@
+"""Send queued emails in batches over one SMTP connection.
+
+Emails queued within EMAIL_BATCH_WINDOW_MS are sent together by a single
+task. Emails sharing a digest key and recipients are merged into one.
+Emails the SMTP server refuses for good are moved to a dead letter list.
+
+The queue is kept in the Redis database of EMAIL_QUEUE_REDIS_URL, apart
+from the cache. A flush moves each batch to a processing list before
+sending it, so the batch of a flush that died is sent by the next one.
+"""
+
+import json
+import smtplib
+from logging import getLogger
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import get_connection
+from redis import Redis
+
+from core.services.mail_sender import build_email
+
+logger = getLogger(__name__)
+
+PENDING_KEY = "email:pending"
+PROCESSING_KEY = "email:processing"
+SCHEDULED_KEY = "email:scheduled"
+DEAD_KEY = "email:dead"
+LOCK_KEY = "email:flush"
+
+_redis = None
+
+
+def queue_connection() -> Redis:
+    """Redis client of the email queue, built on first use."""
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(settings.EMAIL_QUEUE_REDIS_URL)
+    return _redis
+
+
+class FlushInProgress(Exception):
+    """Raised when another flush holds the queue."""
+
+
+class BatchInterrupted(Exception):
+    """Raised when a send fails transiently, carrying the entries not sent yet."""
+
+    def __init__(self, unsent: list, error: Exception):
+        self.unsent = unsent
+        self.error = error
+        super().__init__(f"{len(unsent)} emails not sent: {error!r}")
+
+
+def queue_email(subject: str, message: str, to_list: list, pdf_file_path: str = '',
+                attachment_name: str = None, digest: str = None):
+    """Queue an email for the next batch."""
+    if not (subject and message and settings.EMAIL_HOST_USER and to_list):
+        return
+    entry = {
+        'subject': subject,
+        'message': message,
+        'to_list': list(to_list),
+        'pdf_file_path': pdf_file_path,
+        'attachment_name': attachment_name,
+        'digest': digest,
+    }
+    queue_connection().rpush(PENDING_KEY, json.dumps(entry))
+    window = settings.EMAIL_BATCH_WINDOW_MS/1000
+    if cache.add(SCHEDULED_KEY, True, timeout=window):
+        from core.tasks import flush_emails
+        flush_emails.apply_async(countdown=window)
+
+
+def merge_digests(entries: list) -> list:
+    """Merge entries with the same digest key and recipients into one, in queue order."""
+    merged = []
+    digests = {}
+    for entry in entries:
+        if not entry.get('digest'):
+            merged.append(entry)
+            continue
+        group = (entry['digest'], tuple(sorted(entry['to_list'])))
+        if group in digests:
+            digests[group]['message'] += "\n\n"+entry['message']
+        else:
+            digests[group] = dict(entry)
+            merged.append(digests[group])
+    return merged
+
+
+def is_permanent(error: Exception) -> bool:
+    """Whether the SMTP server rejected the email for good, so retrying cannot help."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPDataError):
+        return error.smtp_code >= 500
+    return False
+
+
+def send_batch(entries: list, dead_letter) -> int:
+    """Send the entries one by one over one connection. Returns the number of emails sent.
+
+    Emails the server refuses for good are passed to dead_letter and the
+    batch goes on. Any other failure raises BatchInterrupted with the
+    entries that were not sent, so only those are retried.
+    """
+    merged = merge_digests(entries)
+    sent = done = 0
+    try:
+        with get_connection() as connection:
+            for entry in merged:
+                try:
+                    message = build_email(
+                        entry['subject'], entry['message'], entry['to_list'],
+                        entry['pdf_file_path'], entry['attachment_name'],
+                    )
+                except OSError:
+                    logger.exception("Dropping email %r, its attachment cannot be read", entry['subject'])
+                    done += 1
+                    continue
+                try:
+                    sent += connection.send_messages([message]) or 0
+                except Exception as e:
+                    if not is_permanent(e):
+                        raise
+                    logger.exception("Dead lettering email %r, the server refused it", entry['subject'])
+                    dead_letter(entry, e)
+                done += 1
+    except Exception as e:
+        if done < len(merged):
+            raise BatchInterrupted(merged[done:], e) from e
+        logger.warning("Closing the SMTP connection failed after the batch was sent", exc_info=True)
+    return sent
+
+
+def requeue_processing(connection) -> int:
+    """Put the batch left in the processing list back at the head of the queue."""
+    moved = 0
+    while connection.lmove(PROCESSING_KEY, PENDING_KEY, 'RIGHT', 'LEFT') is not None:
+        moved += 1
+    return moved
+
+
+def take_batch(connection, batch_size: int) -> list:
+    """Move up to batch_size queued emails to the processing list and return them."""
+    pipeline = connection.pipeline()
+    for _ in range(batch_size):
+        pipeline.lmove(PENDING_KEY, PROCESSING_KEY, 'LEFT', 'RIGHT')
+    return [raw for raw in pipeline.execute() if raw is not None]
+
+
+def flush_pending(batch_size: int) -> int:
+    """Send every queued email, batch_size per connection. Returns the number sent.
+
+    One flush runs at a time, others raise FlushInProgress. A batch stays in
+    the processing list until it is sent, and a batch a crashed flush left
+    there is requeued first. When a batch is interrupted, the emails it did
+    not send yet are put back at the head of the queue and the error that
+    stopped it is raised.
+    """
+    connection = queue_connection()
+    lock = connection.lock(LOCK_KEY, timeout=settings.EMAIL_FLUSH_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        raise FlushInProgress()
+
+    def dead_letter(entry, error):
+        connection.rpush(DEAD_KEY, json.dumps(dict(entry, error=repr(error))))
+
+    try:
+        recovered = requeue_processing(connection)
+        if recovered:
+            logger.warning("Requeued %s emails of an interrupted flush", recovered)
+        # Emails queued from here on schedule another flush.
+        cache.delete(SCHEDULED_KEY)
+        total = 0
+        while True:
+            raw = take_batch(connection, batch_size)
+            if not raw:
+                return total
+            try:
+                total += send_batch([json.loads(entry) for entry in raw], dead_letter)
+            except BatchInterrupted as e:
+                pipeline = connection.pipeline()
+                pipeline.delete(PROCESSING_KEY)
+                pipeline.lpush(PENDING_KEY, *[json.dumps(entry) for entry in reversed(e.unsent)])
+                pipeline.execute()
+                raise e.error
+            except Exception:
+                requeue_processing(connection)
+                raise
+            connection.delete(PROCESSING_KEY)
+    finally:
+        lock.release()
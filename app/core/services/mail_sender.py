@@ -2,19 +2,23 @@ from django.core.mail import EmailMessage
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
+from core.services.invoice_storage import open_invoice
 import os
 
-def send_email(subject: str, message: str, to_list: list, pdf_file_path: str):
+def build_email(subject: str, message: str, to_list: list, pdf_file_path: str = '', attachment_name: str = None):
+    """EmailMessage from the site address, pdf_file_path is a path in the invoices storage."""
+    email = EmailMessage(subject, message, settings.EMAIL_HOST_USER, to_list)
+    if(pdf_file_path):
+        with open_invoice(pdf_file_path) as pdf_file:
+            email.attach(attachment_name or os.path.basename(pdf_file_path), pdf_file.read(), 'application/pdf')
+    return email
+
+def send_email(subject: str, message: str, to_list: list, pdf_file_path: str, attachment_name: str = None):
+    """pdf_file_path is a path in the invoices storage."""
     from_email = settings.EMAIL_HOST_USER
-    path = os.path.join(settings.INVOICES_PATH,pdf_file_path)
     if subject and message and from_email and to_list:
         try:
-            email = EmailMessage(subject, message, from_email, to_list)
-            if(pdf_file_path):
-                with open(path, 'rb') as pdf_file:
-                    email.attach(os.path.basename(path), pdf_file.read(), 'application/pdf')
-
-            email.send()
+            build_email(subject, message, to_list, pdf_file_path, attachment_name).send()
 
             return True
         except Exception as e:
@@ -22,4 +26,3 @@ def send_email(subject: str, message: str, to_list: list, pdf_file_path: str):
             return False
     else:
         return False
-    
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""Transactional outbox for Celery tasks.
+
+Request handlers write the task signature to the database in their own
+transaction instead of talking to the broker. A relay process publishes
+committed messages in batches, so a rolled back transaction sends nothing
+and a broker outage only delays delivery. Delivery is at least once.
+"""
+
+from datetime import timedelta
+
+from celery import signature
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from app.celery import app
+from core.models import OutboxMessage
+
+
+def enqueue(task_signature, key: str = None):
+    """Publish the Celery signature once the current transaction commits.
+
+    A message whose key is already in the outbox is dropped.
+    """
+    OutboxMessage.objects.bulk_create(
+        [OutboxMessage(signature=dict(task_signature), key=key)],
+        ignore_conflicts=key is not None,
+    )
+
+
+def relay_batch(batch_size: int) -> int:
+    """Publish up to batch_size pending messages. Returns the number published.
+
+    Rows are locked with skip_locked so several relays take disjoint
+    batches. If publishing fails the batch stays pending and is retried.
+    """
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(published_at=None)
+            .order_by('id')[:batch_size]
+        )
+        for message in messages:
+            signature(message.signature, app=app).apply_async()
+        OutboxMessage.objects.filter(id__in=[message.id for message in messages]).update(published_at=timezone.now())
+    return len(messages)
+
+
+def relay_pending(batch_size: int) -> int:
+    """Publish every pending message. Returns the number published."""
+    total = 0
+    while True:
+        published = relay_batch(batch_size)
+        total += published
+        if published < batch_size:
+            return total
+
+
+def purge_published(retention: timedelta) -> int:
+    """Delete messages published longer ago than retention.
+
+    Keys of purged messages can be enqueued again.
+    """
+    deleted, _ = OutboxMessage.objects.filter(published_at__lt=timezone.now() - retention).delete()
+    return deleted
+
+
+def stats() -> dict:
+    """Pending messages and how long the oldest one has waited, in seconds."""
+    pending = OutboxMessage.objects.filter(published_at=None).aggregate(count=Count('id'), oldest=Min('created_at'))
+    oldest = pending['oldest']
+    return {
+        'pending': pending['count'],
+        'lag_seconds': round((timezone.now() - oldest).total_seconds(), 3) if oldest else 0,
+    }
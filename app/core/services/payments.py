@@ -0,0 +1,187 @@
+"""Finalise payments from the state the Khalti gateway reports for them."""
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from logging import getLogger
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import Cart, DiscountCoupon, Payment, PaymentProduct, User
+from core.services import outbox
+from core.services.khalti_client import GatewayUnavailable, get_client
+from core.services.stock import InsufficientStock, low_stock_message, reserve_stock
+
+logger = getLogger(__name__)
+
+# Gateway states after which the customer can no longer pay.
+ABANDONED_STATUSES = {"Expired": "Expired", "User canceled": "Canceled"}
+
+
+def remove_from_cart(user_id: int, quantities: dict):
+    """Take the paid {p_id: quantity} out of the user's cart.
+
+    Only the paid lines go, so items added to the cart after the checkout
+    started stay there, as does any quantity added on top of a paid line.
+    """
+    remaining = dict(quantities)
+    deleted, reduced = [], []
+    for cart in Cart.objects.filter(user_id=user_id, p_id__in=quantities.keys()).order_by('id'):
+        paid = remaining[cart.p_id_id]
+        if not paid:
+            continue
+        if cart.quantity <= paid:
+            deleted.append(cart.id)
+            remaining[cart.p_id_id] = paid - cart.quantity
+        else:
+            cart.quantity -= paid
+            reduced.append(cart)
+            remaining[cart.p_id_id] = 0
+    Cart.objects.filter(id__in=deleted).delete()
+    Cart.objects.bulk_update(reduced, ['quantity'])
+
+
+def complete_payment(payment: Payment, data: dict) -> bool:
+    """Finalise a payment the gateway reports as Completed, exactly once.
+
+    The Pending to Completed transition is a conditional UPDATE, so of any
+    concurrent callers (validate, retries, reconciliation) only one wins and
+    the others wait for its commit and find nothing to do. The winner
+    reserves stock, takes the paid items out of the cart, credits reward points and writes the
+    email and invoice tasks to the outbox in the same transaction.
+
+    Returns whether this call completed the payment. Raises
+    InsufficientStock, rolling everything back, if the stock ran out.
+    """
+    from core.tasks import send_email, invoice_chain
+    # The gateway amount is in paisa.
+    amount = float(data['total_amount'])/100
+    with transaction.atomic():
+        claimed = Payment.objects.filter(id=payment.id, status="Pending").update(
+            status="Completed",
+            transaction_id=data['transaction_id'],
+            amount=amount,
+        )
+        if not claimed:
+            payment.refresh_from_db()
+            return False
+        quantities = {}
+        for p_id, quantity in PaymentProduct.objects.filter(payment_id=payment.id).values_list('product_id', 'quantity'):
+            quantities[p_id] = quantities.get(p_id, 0) + quantity
+        low_stock_products = reserve_stock(quantities)
+        remove_from_cart(payment.user_id, quantities)
+        # One point per full Rs. 100, reward_points is an integer column.
+        User.objects.filter(id=payment.user_id).update(reward_points=F('reward_points') + int(amount // 100))
+        payment.refresh_from_db()
+        if low_stock_products:
+            # Alerts of orders completed within one email window go out as one digest.
+            outbox.enqueue(send_email.si(
+                "Threshold Reached", low_stock_message(low_stock_products), [settings.EMAIL_HOST_USER], '',
+                digest="low-stock",
+            ))
+        outbox.enqueue(
+            invoice_chain(payment.id, payment.user.email, payment.transaction_id),
+            key=f"invoice:{payment.id}",
+        )
+    return True
+
+
+def abandon_payment(payment: Payment, status: str) -> bool:
+    """Close a pending payment the customer never paid and give the coupon back.
+
+    Returns False if the payment was finalised in the meantime.
+    """
+    with transaction.atomic():
+        if not Payment.objects.filter(id=payment.id, status="Pending").update(status=status):
+            return False
+        payment.status = status
+        if payment.coupon_id:
+            DiscountCoupon.objects.filter(id=payment.coupon_id).update(used=False)
+    return True
+
+
+def flag_for_refund(payment: Payment, data: dict, products: list) -> bool:
+    """Close a payment the customer paid for but whose stock ran out.
+
+    The payment moves to NeedsRefund in its own transaction, so it leaves
+    reconciliation for good, and the shop is alerted to refund it by hand.
+    Returns False if the payment was finalised in the meantime.
+    """
+    from core.tasks import send_email
+    amount = float(data['total_amount'])/100
+    with transaction.atomic():
+        flagged = Payment.objects.filter(id=payment.id, status="Pending").update(
+            status="NeedsRefund",
+            transaction_id=data['transaction_id'],
+            amount=amount,
+        )
+        if not flagged:
+            payment.refresh_from_db()
+            return False
+        payment.refresh_from_db()
+        outbox.enqueue(send_email.si(
+            "Refund Required",
+            f"Payment {payment.id} (txn ID:{payment.transaction_id}, amount {amount}) was paid "
+            f"but products {products} are out of stock. Refund the customer.",
+            [settings.EMAIL_HOST_USER], '',
+        ))
+    logger.error("Payment %s was paid but is out of stock for products %s, refund needed", payment.id, products)
+    return True
+
+
+def apply_lookup(payment: Payment, data: dict) -> str:
+    """Bring a pending payment in line with its gateway state. Returns the outcome."""
+    gateway_status = data.get('status')
+    if gateway_status == "Completed":
+        try:
+            completed = complete_payment(payment, data)
+        except InsufficientStock as e:
+            flagged = flag_for_refund(payment, data, e.product_ids)
+            return 'needs_refund' if flagged else 'already_finalised'
+        return 'completed' if completed else 'already_finalised'
+    if gateway_status in ABANDONED_STATUSES:
+        abandoned = abandon_payment(payment, ABANDONED_STATUSES[gateway_status])
+        return 'abandoned' if abandoned else 'already_finalised'
+    return 'pending'
+
+
+def _lookup(pidx: str):
+    try:
+        response = get_client().lookup(pidx)
+    except GatewayUnavailable:
+        return None
+    if response.status_code != 200:
+        return None
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+def reconcile_pending(after_minutes: int, batch_size: int, workers: int) -> dict:
+    """Finalise pending payments whose customer never came back to validate.
+
+    Payments older than after_minutes are looked up batch by batch, each
+    batch concurrently on at most `workers` threads. Database writes stay on
+    the calling thread. Returns the number of payments per outcome.
+    """
+    cutoff = timezone.now() - timedelta(minutes=after_minutes)
+    ids = list(
+        Payment.objects.filter(status="Pending", transaction_id=None, date_time__lt=cutoff)
+        .exclude(amount=None)
+        .order_by('date_time')
+        .values_list('id', flat=True)
+    )
+    outcomes = Counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(ids), batch_size):
+            batch = list(
+                Payment.objects.select_related('user')
+                .filter(id__in=ids[start:start + batch_size], status="Pending", transaction_id=None)
+            )
+            for payment, data in zip(batch, pool.map(_lookup, [payment.id for payment in batch])):
+                outcomes['unavailable' if data is None else apply_lookup(payment, data)] += 1
+    return dict(outcomes)
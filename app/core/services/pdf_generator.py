@@ -1,100 +1,99 @@
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.styles import ParagraphStyle
 from reportlab.lib.units import inch
 from datetime import datetime
-from django.conf import settings
-import os
-
-def generate(filename:str,data:list,transaction_id):
-    # try:
-    path = os.path.join(settings.INVOICES_PATH,filename)
-    doc = SimpleDocTemplate(path, pagesize=letter)
-
-    elements = []
-
-    company_name = "GoShopNow"
-
-    custom_style = ParagraphStyle(
-        name='CustomTitle',
-        fontName='Helvetica',
-        fontSize=28,
-        textColor=colors.blue,
-        alignment=1,
-        encoding='utf-8',
-    )
-    centered = Paragraph(company_name, custom_style)
-    elements.append(centered)
-
-    custom_style = ParagraphStyle(
-        name='CustomTitle',
-        fontSize=8,
-    )
-    new_data = []
-    for _ in data:
-            new_data.append([Paragraph(_[0],custom_style),_[1],_[2],_[3]])
-
-    table = Table(new_data, colWidths=[200, 80, 80, 80])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Courier'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTENCODING', (1, 0), (-1, -1), 'utf-8'),
-    ]))
-
-
-    data_total = [
-        ["", "", "", "Total"],
-        ["", "", "", f"Total: ${sum([float(row[-1]) for row in new_data[1:]])}"],
-    ]
-    table_total = Table(data_total, colWidths=[200, 80, 80, 80])
-    table_total.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-
-    elements.append(Spacer(1, 0.25 * inch))
-
-    today = 'Date: '+datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    date_style = ParagraphStyle(name='DateStyle', alignment=2)  # 2 corresponds to right alignment
-    date_text = Paragraph(today, date_style)
-    elements.append(date_text)
-    elements.append(Spacer(1, 0.15 * inch))
-
-    custom_style = ParagraphStyle(
-        name='CustomTitle',
-        fontSize=20,
-        alignment=1,
-    )
-
-    centered = Paragraph('Payment Invoice', custom_style)
-    elements.append(centered)
-
-    custom_style = ParagraphStyle(
-        name='CustomTitle',
-        fontSize=12,
-        alignment=0,
-    )
-    elements.append(Spacer(1, 0.15 * inch))
-    centered = Paragraph("Transaction ID: "+ transaction_id, custom_style)
-    elements.append(centered)
-
-    elements.append(Spacer(1, 0.15 * inch))
-
-    elements.append(table)
-    elements.append(table_total)
-
-    doc.build(elements)
-    #     return True
-    # except:
-    #     return False
\ No newline at end of file
+import threading
+
+
+class InvoiceRenderer:
+    """Lays out payment invoices.
+
+    Styles and the static header are built once, each invoice only adds its
+    date, transaction id and rows. Flowables are not thread safe, so use
+    get_renderer() for one renderer per thread.
+    """
+    COLUMN_WIDTHS = [200, 80, 80, 80]
+    COMPANY_NAME = "GoShopNow"
+
+    def __init__(self):
+        self.cell_style = ParagraphStyle(name='InvoiceCell', fontSize=8)
+        self.date_style = ParagraphStyle(name='DateStyle', alignment=2)  # 2 corresponds to right alignment
+        self.text_style = ParagraphStyle(name='InvoiceText', fontSize=12, alignment=0)
+        self.header = [
+            Paragraph(self.COMPANY_NAME, ParagraphStyle(
+                name='CompanyTitle',
+                fontName='Helvetica',
+                fontSize=28,
+                textColor=colors.blue,
+                alignment=1,
+                encoding='utf-8',
+            )),
+            Spacer(1, 0.25 * inch),
+        ]
+        self.title = [
+            Spacer(1, 0.15 * inch),
+            Paragraph('Payment Invoice', ParagraphStyle(name='InvoiceTitle', fontSize=20, alignment=1)),
+            Spacer(1, 0.15 * inch),
+        ]
+        self.spacer = Spacer(1, 0.15 * inch)
+        self.table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Courier'),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('FONTENCODING', (1, 0), (-1, -1), 'utf-8'),
+        ])
+        self.total_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ])
+
+    def render(self, target, data: list, transaction_id: str, issued: datetime = None):
+        """Write the invoice to a path or file object.
+
+        The same arguments always produce the same bytes, so stored invoices
+        can be deduplicated by content.
+        """
+        rows = [[Paragraph(row[0], self.cell_style), row[1], row[2], row[3]] for row in data]
+        table = Table(rows, colWidths=self.COLUMN_WIDTHS)
+        table.setStyle(self.table_style)
+
+        total = sum([float(row[-1]) for row in rows[1:]])
+        table_total = Table([
+            ["", "", "", "Total"],
+            ["", "", "", f"Total: ${total}"],
+        ], colWidths=self.COLUMN_WIDTHS)
+        table_total.setStyle(self.total_style)
+
+        today = 'Date: '+(issued or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+        elements = [
+            *self.header,
+            Paragraph(today, self.date_style),
+            *self.title,
+            Paragraph("Transaction ID: "+ transaction_id, self.text_style),
+            self.spacer,
+            table,
+            table_total,
+        ]
+        # invariant drops the creation time and random document id from the PDF.
+        SimpleDocTemplate(target, pagesize=letter, invariant=True).build(elements)
+
+
+_renderers = threading.local()
+
+
+def get_renderer() -> InvoiceRenderer:
+    """Renderer of the current thread, built on first use."""
+    if not hasattr(_renderers, 'renderer'):
+        _renderers.renderer = InvoiceRenderer()
+    return _renderers.renderer
@@ -0,0 +1,197 @@
+"""Product catalog cache invalidated through per-product and per-category versions.
+
+Keys embed the current version of what they depend on, so bumping a version
+makes every entry built from the old data unreachable at once and entries can
+live much longer than a fixed cache_page timeout.
+"""
+
+import hashlib
+import json
+import math
+import random
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+ALL_CATEGORIES = '*'
+LIST_PARAMS = ('search', 'category', 'price', 'rating', 'page_no')
+STATS_KINDS = ('list', 'detail')
+STATS_OUTCOMES = ('hits', 'stale', 'misses')
+
+
+def _version_key(kind: str, name) -> str:
+    return f"products:version:{kind}:{name}"
+
+
+def _versions(keys: list) -> list:
+    """Current value of each version counter.
+
+    A missing counter starts from the current time so a counter lost to
+    eviction never repeats a value used by entries still in the cache.
+    """
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(keys: list):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def _bump_on_commit(keys: list):
+    # Bumping before commit would let a concurrent request cache the old rows again.
+    transaction.on_commit(partial(_bump, keys))
+
+
+def invalidate_products(p_ids):
+    """Drop cached details of the products."""
+    _bump_on_commit([_version_key('product', p_id) for p_id in set(p_ids)])
+
+
+def invalidate_listings(categories):
+    """Drop cached listings of the categories and the unfiltered listing."""
+    categories = set(categories) | {ALL_CATEGORIES}
+    _bump_on_commit([_version_key('category', category) for category in categories])
+
+
+def invalidate_all():
+    """Drop every cached product detail and listing."""
+    _bump_on_commit([_version_key('catalog', 'generation')])
+
+
+def list_params(query_params):
+    """Query parameters of a product listing in canonical form.
+
+    Parameters equal to their default are left out and search is case and
+    whitespace normalised, so equivalent URLs share one entry. Returns None
+    for queries that should not be cached.
+    """
+    if set(query_params.keys()) - set(LIST_PARAMS):
+        return None
+    params = {}
+    search = ' '.join(query_params.get('search', '').lower().split())
+    if search:
+        params['search'] = search
+    category = query_params.get('category', '').strip()
+    if category:
+        params['category'] = category
+    try:
+        for name in ('price', 'rating'):
+            ordering = int(query_params.get(name, 0))
+            if ordering in (1, -1):
+                params[name] = ordering
+        page_no = int(query_params.get('page_no', 1))
+    except ValueError:
+        return None
+    if page_no != 1:
+        params['page_no'] = page_no
+    return params
+
+
+def list_key(query_params):
+    """Cache key of a product listing, None if the listing is not cacheable."""
+    params = list_params(query_params)
+    if params is None:
+        return None
+    generation, version = _versions([
+        _version_key('catalog', 'generation'),
+        _version_key('category', params.get('category', ALL_CATEGORIES)),
+    ])
+    digest = hashlib.md5(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return f"products:list:{generation}:{version}:{digest}"
+
+
+def detail_key(p_id) -> str:
+    """Cache key of a product detail."""
+    generation, version = _versions([
+        _version_key('catalog', 'generation'),
+        _version_key('product', p_id),
+    ])
+    return f"products:detail:{generation}:{version}:{p_id}"
+
+
+def _count(kind: str, outcome: str):
+    key = f"products:stats:{kind}:{outcome}"
+    cache.add(key, 0, timeout=None)
+    cache.incr(key)
+
+
+def _store(key: str, compute, timeout: int):
+    started = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - started
+    entry = {'value': value, 'expires': time.time() + timeout, 'delta': delta}
+    # Entries outlive their expiry by the stale timeout so they can be served during a rebuild.
+    cache.set(key, entry, timeout=timeout + settings.PRODUCT_CACHE_STALE_TIMEOUT)
+    return value
+
+
+def _should_refresh(entry: dict) -> bool:
+    """Probabilistic early expiration (XFetch).
+
+    Requests start refreshing ahead of expiry with a probability that grows
+    as expiry nears and with how long the value takes to compute, so one
+    request usually rebuilds the entry before it expires for everyone.
+    """
+    early = entry['delta']*settings.PRODUCT_CACHE_XFETCH_BETA*-math.log(1 - random.random())
+    return time.time() + early >= entry['expires']
+
+
+def fetch(kind: str, key: str, compute, timeout: int):
+    """Cached value of key, computed by a single request per key.
+
+    The request holding the rebuild lock recomputes the value. Others serve
+    the stale value meanwhile, or wait for the lock holder when there is
+    no value yet.
+    """
+    lock_key = f"{key}:lock"
+    lock_timeout = settings.PRODUCT_CACHE_LOCK_TIMEOUT
+    entry = cache.get(key)
+    if entry is not None and not _should_refresh(entry):
+        _count(kind, 'hits')
+        return entry['value']
+    if cache.add(lock_key, True, timeout=lock_timeout):
+        _count(kind, 'misses')
+        try:
+            return _store(key, compute, timeout)
+        finally:
+            cache.delete(lock_key)
+    if entry is not None:
+        _count(kind, 'stale')
+        return entry['value']
+
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            _count(kind, 'hits')
+            return entry['value']
+        if cache.get(lock_key) is None:
+            break
+    # The lock holder failed or is too slow, compute without the lock.
+    _count(kind, 'misses')
+    return _store(key, compute, timeout)
+
+
+def stats() -> dict:
+    """Hit, stale and miss counts of the product cache per endpoint."""
+    keys = [f"products:stats:{kind}:{outcome}" for kind in STATS_KINDS for outcome in STATS_OUTCOMES]
+    counts = cache.get_many(keys)
+    result = {}
+    for kind in STATS_KINDS:
+        result[kind] = {outcome: counts.get(f"products:stats:{kind}:{outcome}", 0) for outcome in STATS_OUTCOMES}
+        total = sum(result[kind].values())
+        served = result[kind]['hits'] + result[kind]['stale']
+        result[kind]['hit_ratio'] = round(served/total, 4) if total else None
+    return result
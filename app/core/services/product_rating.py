@@ -0,0 +1,86 @@
+"""Keep Product.rating in sync with its published reviews without rescanning them."""
+
+from django.db.models import Case, Count, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.lookups import GreaterThan
+
+from core.models import Product, Review
+from core.services.product_cache import invalidate_all, invalidate_products
+from core.services.search_index import queue_products
+
+
+def _rating(rating_sum, rating_count):
+    """Average rating expression, 0 for products without rated reviews."""
+    return Case(
+        When(GreaterThan(rating_count, 0), then=rating_sum/Cast(rating_count, FloatField())),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def apply_rating_changes(changes: dict):
+    """Apply {p_id: (rating_sum_delta, rating_count_delta)} in one UPDATE."""
+    changes = {p_id: change for p_id, change in changes.items() if change[1]}
+    if not changes:
+        return
+    sum_delta = Case(
+        *[When(p_id=p_id, then=Value(float(change[0]))) for p_id, change in changes.items()],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    count_delta = Case(
+        *[When(p_id=p_id, then=Value(change[1])) for p_id, change in changes.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    rating_sum = F('rating_sum') + sum_delta
+    rating_count = F('rating_count') + count_delta
+    Product.objects.filter(p_id__in=changes.keys()).update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating=_rating(rating_sum, rating_count),
+    )
+    invalidate_products(changes.keys())
+    queue_products(changes.keys())
+
+
+def rating_changes(reviews, sign: int = 1) -> dict:
+    """Group the ratings of reviews per product, ignoring reviews without a rating."""
+    changes = {}
+    for review in reviews:
+        if review.rating is None:
+            continue
+        rating_sum, rating_count = changes.get(review.p_id_id, (0, 0))
+        changes[review.p_id_id] = (rating_sum + sign*review.rating, rating_count + sign)
+    return changes
+
+
+def add_reviews(reviews):
+    """Count newly published reviews in their products' ratings."""
+    changes = rating_changes(reviews)
+    apply_rating_changes(changes)
+    # Reviews without a rating leave the rating alone but still show on the product.
+    unrated = {review.p_id_id for review in reviews} - changes.keys()
+    if unrated:
+        invalidate_products(unrated)
+
+
+def remove_reviews(reviews):
+    """Take deleted published reviews out of their products' ratings."""
+    apply_rating_changes(rating_changes(reviews, sign=-1))
+
+
+def rebuild_ratings():
+    """Recompute every product's aggregate from its published reviews in one UPDATE."""
+    published = Review.objects.filter(
+        p_id=OuterRef('pk'), status="Published", rating__isnull=False
+    ).order_by().values('p_id')
+    rating_sum = Coalesce(Subquery(published.annotate(total=Sum('rating')).values('total')), Value(0.0))
+    rating_count = Coalesce(Subquery(published.annotate(total=Count('id')).values('total')), Value(0))
+    updated = Product.objects.update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating=_rating(rating_sum, rating_count),
+    )
+    invalidate_all()
+    return updated
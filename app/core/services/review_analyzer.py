@@ -6,30 +6,74 @@ from nltk.stem import WordNetLemmatizer
 from nltk.corpus import stopwords
 import nltk
 import pickle
+import threading
 import os
 from django.conf import settings
 
 nltk.data.path.append(os.path.join(settings.BASE_DIR,'static','nltk_data'))
 
+MODEL_PATH = os.path.join(settings.BASE_DIR,'static','keras_model')
+MAX_SEQUENCE_LENGTH = 1250
+THRESHOLD = 0.5
+
+
+class ReviewClassifier:
+    """Binary classifier for harmful reviews. 0-> Safe."""
+
+    def __init__(self, path: str = MODEL_PATH):
+        self.model = load_model(os.path.join(path,"checkpoint.h5"))
+        with open(os.path.join(path,'tokenizer.pickle'), 'rb') as handle:
+            self.tokenizer = pickle.load(handle)
+        self.lemmatizer = WordNetLemmatizer()
+        self.stop_words = frozenset(stopwords.words('english'))
+
+    def remove_stop_words(self, text: str) -> str:
+        text = word_tokenize(text.lower())
+        text = [self.lemmatizer.lemmatize(word) for word in text if word.isalpha() and not word in self.stop_words]
+        return ' '.join(text)
+
+    def predict(self, texts: list) -> list:
+        """Probability of each text being harmful, computed in one batch."""
+        if not texts:
+            return []
+        cleaned_texts = [self.remove_stop_words(text or '') for text in texts]
+        sequences = self.tokenizer.texts_to_sequences(cleaned_texts)
+        padded_sequences = pad_sequences(sequences, maxlen=MAX_SEQUENCE_LENGTH)
+        predictions = self.model.predict(padded_sequences, verbose=0)
+        return [float(prediction[0]) for prediction in predictions]
+
+    def analyze_many(self, texts: list) -> list:
+        return [1 if prediction > THRESHOLD else 0 for prediction in self.predict(texts)]
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier() -> ReviewClassifier:
+    """Process wide classifier, loaded on first use."""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = ReviewClassifier()
+    return _classifier
+
+
+def warm_up():
+    """Load the model and run one prediction so the first request does not pay for it."""
+    get_classifier().analyze_many(["warm up"])
+
+
 def remove_stop_words(text):
-    lemmatizer = WordNetLemmatizer()
-    text = word_tokenize(text.lower())
-    stop_words = set(stopwords.words('english'))
-    text = [lemmatizer.lemmatize(word) for word in text if word.isalpha() and not word in stop_words]
-    return ' '.join(text)
+    return get_classifier().remove_stop_words(text)
+
+
+def analyze_many(texts: list) -> list:
+    """Classify a batch of reviews with a single model call."""
+    return get_classifier().analyze_many(texts)
+
 
 def analyze(text:str):
     """Binary Classification to detect harmful comment. 0-> Safe."""
-    path = os.path.join(settings.BASE_DIR,'static','keras_model')
-    model_lstm = load_model(os.path.join(path,"checkpoint.h5"))
-    with open(os.path.join(path,'tokenizer.pickle'), 'rb') as handle:
-        tokenizer = pickle.load(handle)
-
-    cleaned_text = remove_stop_words(text)
-    sequence = tokenizer.texts_to_sequences([cleaned_text])
-    padded_sequence = pad_sequences(sequence, maxlen=1250)
-    prediction = model_lstm.predict(padded_sequence)[0][0]
-    threshold = 0.5
-    binary_prediction = 1 if prediction > threshold else 0
-    return (binary_prediction)
-    
\ No newline at end of file
+    return analyze_many([text])[0]
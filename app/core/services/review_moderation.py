@@ -0,0 +1,39 @@
+"""Publish or reject pending reviews in batches."""
+
+from django.db import transaction
+
+from core.models import Review
+from core.services.product_rating import add_reviews
+from core.services.review_analyzer import analyze_many
+
+
+def moderate_batch(batch_size: int) -> int:
+    """Classify up to batch_size pending reviews with one model call.
+
+    Rows are locked with skip_locked so concurrent workers take disjoint
+    batches. Returns the number of reviews moderated.
+    """
+    with transaction.atomic():
+        reviews = list(
+            Review.objects.select_for_update(skip_locked=True)
+            .filter(status="Pending")
+            .order_by('id')[:batch_size]
+        )
+        if not reviews:
+            return 0
+        predictions = analyze_many([review.review or '' for review in reviews])
+        for review, prediction in zip(reviews, predictions):
+            review.status = "Rejected" if prediction == 1 else "Published"
+        Review.objects.bulk_update(reviews, ['status'])
+        add_reviews([review for review in reviews if review.status == "Published"])
+    return len(reviews)
+
+
+def moderate_pending_reviews(batch_size: int) -> int:
+    """Drain the pending queue batch by batch. Returns the number of reviews moderated."""
+    total = 0
+    while True:
+        moderated = moderate_batch(batch_size)
+        total += moderated
+        if moderated < batch_size:
+            return total
@@ -0,0 +1,97 @@
+"""Coalesce product index updates into bulk writes made by a Celery task."""
+
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django_elasticsearch_dsl.apps import DEDConfig
+from django_elasticsearch_dsl.signals import RealTimeSignalProcessor
+from django_redis import get_redis_connection
+
+from core.documents import ProductDocument
+from core.models import Product, ProductImage
+from core.services.product_cache import invalidate_listings
+
+PENDING_KEY = "search-index:pending"
+SCHEDULED_KEY = "search-index:scheduled"
+
+
+def _queue(p_ids: list):
+    get_redis_connection("default").sadd(PENDING_KEY, *p_ids)
+    window = settings.SEARCH_INDEX_WINDOW_MS/1000
+    if cache.add(SCHEDULED_KEY, True, timeout=window):
+        from core.tasks import index_products
+        index_products.apply_async(countdown=window)
+
+
+def queue_products(p_ids):
+    """Index the products once the transaction commits.
+
+    Edits to the same products within SEARCH_INDEX_WINDOW_MS are written by
+    a single bulk request.
+    """
+    p_ids = sorted(set(p_ids))
+    if not p_ids or not DEDConfig.autosync_enabled():
+        return
+    transaction.on_commit(partial(_queue, p_ids))
+
+
+def _index(p_ids):
+    """Bulk index the products and drop cached listings once searches see them.
+
+    wait_for blocks until the next scheduled refresh instead of forcing one.
+    """
+    products = list(ProductDocument().get_queryset().filter(p_id__in=p_ids))
+    ProductDocument().update(products, refresh='wait_for')
+    invalidate_listings({product.category_id for product in products})
+
+
+def index_now(p_ids):
+    """Index the products and wait until they are visible to searches."""
+    if not DEDConfig.autosync_enabled():
+        return
+    _index(p_ids)
+
+
+def flush_pending(batch_size: int) -> int:
+    """Bulk index the queued products. Returns the number of products indexed.
+
+    A batch whose bulk write fails is queued again and the error is raised.
+    """
+    connection = get_redis_connection("default")
+    # Edits queued from here on schedule another flush.
+    cache.delete(SCHEDULED_KEY)
+    total = 0
+    while True:
+        p_ids = [int(p_id) for p_id in connection.spop(PENDING_KEY, batch_size)]
+        if not p_ids:
+            return total
+        try:
+            _index(p_ids)
+        except Exception:
+            # Popping rather than reading keeps edits queued during the write.
+            connection.sadd(PENDING_KEY, *p_ids)
+            raise
+        total += len(p_ids)
+
+
+class QueuedSignalProcessor(RealTimeSignalProcessor):
+    """Queue product saves for the index task instead of writing them in the request.
+
+    Deletes are still applied straight away.
+    """
+
+    def handle_save(self, sender, instance, **kwargs):
+        if isinstance(instance, Product):
+            queue_products([instance.p_id])
+        elif isinstance(instance, ProductImage):
+            queue_products([instance.p_id_id])
+        else:
+            super().handle_save(sender, instance, **kwargs)
+
+    def handle_pre_delete(self, sender, instance, **kwargs):
+        if isinstance(instance, ProductImage):
+            queue_products([instance.p_id_id])
+        else:
+            super().handle_pre_delete(sender, instance, **kwargs)
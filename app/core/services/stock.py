@@ -0,0 +1,63 @@
+"""Stock reservation for completed payments."""
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from core.models import Product
+from core.services.product_cache import invalidate_products
+from core.services.search_index import queue_products
+
+
+class InsufficientStock(Exception):
+    """Raised when one or more products cannot cover the requested quantity."""
+
+    def __init__(self, product_ids: list):
+        self.product_ids = product_ids
+        super().__init__(f"Not enough stock for products: {product_ids}")
+
+
+def reserve_stock(quantities: dict) -> list:
+    """Decrement stock of {p_id: quantity} in one conditional UPDATE.
+
+    Either every product is decremented or none is. Returns the products
+    whose stock dropped below their threshold because of this reservation.
+    """
+    quantities = {p_id: quantity for p_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return []
+
+    condition = Q()
+    for p_id, quantity in quantities.items():
+        condition |= Q(p_id=p_id, stock__gte=quantity)
+    decrement = Case(
+        *[When(p_id=p_id, then=Value(quantity)) for p_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+
+    try:
+        with transaction.atomic():
+            updated = Product.objects.filter(condition).update(stock=F('stock') - decrement)
+            if updated != len(quantities):
+                raise InsufficientStock([])
+    except InsufficientStock:
+        stocks = dict(Product.objects.filter(p_id__in=quantities.keys()).values_list('p_id', 'stock'))
+        raise InsufficientStock(sorted(
+            p_id for p_id, quantity in quantities.items() if stocks.get(p_id, 0) < quantity
+        ))
+
+    invalidate_products(quantities.keys())
+    queue_products(quantities.keys())
+    products = Product.objects.filter(p_id__in=quantities.keys(), stock__lt=F('threshold'))
+    return [
+        product for product in products
+        if product.stock + quantities[product.p_id] >= product.threshold
+    ]
+
+
+def low_stock_message(products: list) -> str:
+    """Single alert body listing every product that went below its threshold."""
+    lines = [
+        f"The product {product.name} with id: {product.p_id} is going out of stock. Current Stock={product.stock}"
+        for product in products
+    ]
+    return "\n".join(lines)
@@ -0,0 +1,61 @@
+"""Invalidate cached product data and build image variants when products change."""
+
+from functools import partial
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.models import Product, ProductImage, Review
+from core.services.product_cache import invalidate_listings, invalidate_products
+from core.tasks import generate_image_variants
+
+
+@receiver(pre_save, sender=Product)
+def remember_category(sender, instance, **kwargs):
+    """Keep the stored category so listings it is moved out of are invalidated too."""
+    instance._previous_category = None
+    if instance.pk:
+        instance._previous_category = Product.objects.filter(pk=instance.pk).values_list('category', flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    invalidate_products([instance.p_id])
+    invalidate_listings({instance.category_id, getattr(instance, '_previous_category', None)} - {None})
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_image_changed(sender, instance, **kwargs):
+    invalidate_products([instance.p_id_id])
+    invalidate_listings(Product.objects.filter(pk=instance.p_id_id).values_list('category', flat=True))
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed(sender, instance, **kwargs):
+    invalidate_products([instance.p_id_id])
+
+
+@receiver(pre_save, sender=ProductImage)
+def remember_image(sender, instance, **kwargs):
+    """Keep the stored file name so variants are only rebuilt for new uploads."""
+    instance._previous_image = None
+    if instance.pk:
+        instance._previous_image = ProductImage.objects.filter(pk=instance.pk).values_list('image_url', flat=True).first()
+
+
+@receiver(post_save, sender=ProductImage)
+def schedule_image_variants(sender, instance, created, **kwargs):
+    if created or instance.image_url.name != getattr(instance, '_previous_image', None):
+        transaction.on_commit(partial(generate_image_variants.delay, instance.pk))
+
+
+@receiver(post_delete, sender=ProductImage)
+def delete_image_variants(sender, instance, **kwargs):
+    for paths in instance.variants.values():
+        for path in paths.values():
+            default_storage.delete(path)
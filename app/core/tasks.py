@@ -7,8 +7,16 @@ import datetime
 import warnings
 import re
 from django.conf import settings
+from celery import chain
+from celery.signals import worker_process_init
 from app.celery import app
-from core.services.mail_sender import send_email as send
+from core.services.mail_queue import queue_email,flush_pending as flush_pending_emails
+from core.services.review_moderation import moderate_pending_reviews
+from core.services.search_index import flush_pending
+from core.services.image_variants import generate_variants
+from core.services.payments import reconcile_pending
+from core.services.invoice import generate_invoice as render_invoice,invoice_file_name
+from core.models import Payment
 
 warnings.filterwarnings('ignore', category=RuntimeWarning, module='django.db.models.fields')
 
@@ -16,5 +24,83 @@ logger = getLogger(__name__)
 
 
 @app.task
-def send_email(subject: str, message: str, to_list: list, pdf_file_path: str):
-    send(subject, message, to_list, pdf_file_path)
\ No newline at end of file
+def send_email(subject: str, message: str, to_list: list, pdf_file_path: str,
+               attachment_name: str = None, digest: str = None):
+    """Queue the email for the next batch, see core.services.mail_queue."""
+    queue_email(subject, message, to_list, pdf_file_path, attachment_name, digest)
+
+
+@app.task(autoretry_for=(Exception,), retry_backoff=True, max_retries=5)
+def flush_emails():
+    """Send the emails queued during the last window over one SMTP connection."""
+    sent = flush_pending_emails(settings.EMAIL_BATCH_SIZE)
+    logger.info("Sent %s emails", sent)
+
+
+@app.task
+def generate_invoice(payment_id: str):
+    """Render the invoice PDF of a completed payment."""
+    return render_invoice(payment_id)
+
+
+@app.task
+def email_invoice(payment_id: str, email: str, transaction_id: str):
+    """Mail the stored invoice of the payment to the customer."""
+    invoice_path = Payment.objects.values_list('invoice_path',flat=True).get(id=payment_id)
+    queue_email(
+        "Payment Successful",
+        f"Your purchase for txn ID:{transaction_id} is successful",
+        [email],
+        invoice_path,
+        invoice_file_name(payment_id),
+    )
+
+
+def invoice_chain(payment_id: str, email: str, transaction_id: str):
+    """Signature rendering the invoice on a worker, then mailing it to the customer."""
+    return chain(
+        generate_invoice.si(payment_id),
+        email_invoice.si(payment_id, email, transaction_id),
+    )
+
+
+@app.task
+def moderate_reviews():
+    """Publish or reject pending reviews in micro-batches."""
+    moderated = moderate_pending_reviews(settings.REVIEW_MODERATION_BATCH_SIZE)
+    logger.info("Moderated %s reviews", moderated)
+
+
+@app.task(autoretry_for=(Exception,), retry_backoff=True, max_retries=5)
+def index_products():
+    """Write the product edits queued during the last window in bulk."""
+    indexed = flush_pending(settings.SEARCH_INDEX_BATCH_SIZE)
+    logger.info("Indexed %s products", indexed)
+
+
+@app.task
+def generate_image_variants(image_id: int):
+    """Render the resized and WebP variants of an uploaded product image."""
+    generate_variants(image_id)
+
+
+@app.task
+def reconcile_payments():
+    """Finalise pending payments whose customer never returned to validate."""
+    outcomes = reconcile_pending(
+        settings.PAYMENT_RECONCILE_AFTER_MINUTES,
+        settings.PAYMENT_RECONCILE_BATCH_SIZE,
+        settings.PAYMENT_RECONCILE_WORKERS,
+    )
+    logger.info("Reconciled pending payments: %s", outcomes)
+
+
+@worker_process_init.connect
+def warm_up_review_analyzer(**kwargs):
+    """Load the review classifier when a worker process starts."""
+    if settings.REVIEW_ANALYZER_WARM_UP:
+        from core.services.review_analyzer import warm_up
+        try:
+            warm_up()
+        except Exception:
+            logger.exception("Review analyzer warm up failed")
@@ -0,0 +1,85 @@
+"""
+Tests for the purchase funnel benchmark commands
+"""
+import json
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TransactionTestCase, override_settings
+
+from core.management.commands.benchmark_funnel import ENDPOINTS, percentile
+from core.models import User, Product, Payment
+
+
+class BenchmarkTests(TransactionTestCase):
+    """Test seeding and running the benchmark."""
+
+    def setUp(self):
+        self.invoices = tempfile.TemporaryDirectory()
+        self.addCleanup(self.invoices.cleanup)
+        storages = {**settings.STORAGES, "invoices": {
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+            "OPTIONS": {"location": self.invoices.name},
+        }}
+        self.settings_override = override_settings(STORAGES=storages, ELASTICSEARCH_DSL_AUTOSYNC=False)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def seed(self, *args):
+        call_command("seed_benchmark_data", "--users", "3", "--categories", "2", "--products", "10",
+                     "--addresses", "2", *args, stdout=StringIO())
+
+    def test_seed_and_clear(self):
+        """Test seeding twice with --clear replaces the dataset."""
+        self.seed()
+        self.seed("--clear")
+
+        self.assertEqual(User.objects.filter(email__startswith="bench-user-").count(), 3)
+        self.assertEqual(Product.objects.count(), 10)
+        self.assertEqual(Payment.objects.filter(status="Completed").count(), 15)
+
+    def test_benchmark_reports_every_endpoint(self):
+        """Test a short run measures each step of the funnel and leaves other cache entries alone."""
+        self.seed()
+        out = StringIO()
+        cache.set("benchmark-test-unrelated", "kept")
+        self.addCleanup(cache.delete, "benchmark-test-unrelated")
+
+        call_command("benchmark_funnel", "--iterations", "3", "--warmup", "1", "--alloc-every", "2", "--json", stdout=out)
+
+        self.assertEqual(cache.get("benchmark-test-unrelated"), "kept")
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(list(report), list(ENDPOINTS))
+        self.assertEqual(report['product-list']['requests'], 1)
+        self.assertEqual(report['cart-create']['requests'], 2)
+        self.assertIsNotNone(report['payment-download']['peak_alloc_kib'])
+        self.assertEqual(Payment.objects.filter(status="Completed").count(), 15 + 4)
+
+    def test_benchmark_fails_on_regression(self):
+        """Test a query count above the baseline is an error."""
+        self.seed()
+        baseline = {name: {'p95_ms': 10**6, 'max_queries': 0} for name in ENDPOINTS}
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as file:
+            json.dump(baseline, file)
+            file.flush()
+
+            with self.assertRaisesMessage(CommandError, "product-detail queries"):
+                call_command("benchmark_funnel", "--iterations", "1", "--warmup", "0", "--alloc-every", "0", "--baseline", file.name,
+                             stdout=StringIO())
+
+    def test_benchmark_without_data(self):
+        """Test the benchmark asks for seeding first."""
+        with self.assertRaisesMessage(CommandError, "seed_benchmark_data"):
+            call_command("benchmark_funnel", stdout=StringIO())
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles."""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile([7], 95), 7)
@@ -0,0 +1,85 @@
+"""
+Tests for product image variants.
+"""
+
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from PIL import Image
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core.models import Product,Category,ProductImage
+from core.services.image_variants import generate_variants,srcset
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def create_upload(width=1200,height=800):
+    """Return an uploaded JPEG of the given size"""
+    buffer = BytesIO()
+    Image.new('RGB',(width,height),color='red').save(buffer,format='JPEG')
+    return SimpleUploadedFile("photo.jpg",buffer.getvalue(),content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT,PRODUCT_IMAGE_VARIANT_WIDTHS=[320,640,2000])
+class TestImageVariants(TestCase):
+    """Tests for rendering and exposing image variants."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT,ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        category = Category.objects.create(category="Electronics")
+        self.product = Product.objects.create(name="Macbook",price=10,stock=10,threshold=2,category=category)
+        self.image = ProductImage.objects.create(p_id=self.product,image_url=create_upload())
+
+    def test_variants_rendered_without_upscaling(self):
+        """Each narrower width is stored as WebP and JPEG, wider ones are skipped."""
+        variants = generate_variants(self.image.id)
+
+        self.assertEqual(set(variants),{'webp','jpeg'})
+        self.assertEqual(set(variants['webp']),{'320','640'})
+        with default_storage.open(variants['webp']['320']) as file:
+            variant = Image.open(file)
+            self.assertEqual(variant.format,'WEBP')
+            self.assertEqual(variant.size,(320,213))
+        self.image.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.image.variants,variants)
+        self.assertEqual(self.product.primary_image_variants,variants)
+
+    def test_srcset_lists_widths_in_order(self):
+        """srcset maps each format to urls with width descriptors."""
+        result = srcset({'webp':{'640':'images/a-640.webp','320':'images/a-320.webp'}})
+
+        self.assertEqual(result,{'webp':'/media/images/a-320.webp 320w, /media/images/a-640.webp 640w'})
+        self.assertEqual(srcset({}),{})
+
+    @mock.patch('core.signals.generate_image_variants.delay')
+    def test_upload_schedules_variants(self,mock_delay):
+        """A new upload schedules one variant task after commit."""
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(p_id=self.product,image_url=create_upload())
+        mock_delay.assert_called_once_with(image.id)
+
+        mock_delay.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        mock_delay.assert_not_called()
+
+    def test_backfill_command(self):
+        """Images without variants are rendered by the backfill command."""
+        out = StringIO()
+        call_command("generate_image_variants","--sync",stdout=out)
+
+        self.image.refresh_from_db()
+        self.assertEqual(set(self.image.variants['jpeg']),{'320','640'})
+        self.assertIn("Rendered variants of 1 images",out.getvalue())
@@ -0,0 +1,137 @@
+"""
+Tests that hot queries are served by indexes.
+"""
+
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from core.models import (Product,Category,Review,Cart,DiscountCoupon,
+                         Payment,PaymentProduct,Address)
+
+
+def create_user(**params):
+    """Create and return a new user"""
+    return get_user_model().objects.create_user(**params)
+
+
+class TestHotQueryIndexes(TestCase):
+    """Hot filters are served by the index added for them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(category="Electronics")
+        products = Product.objects.bulk_create([
+            Product(name=f"Product {i}",price=10,stock=10,threshold=2,category=category)
+            for i in range(20)
+        ])
+        users = [
+            create_user(email=f"user{i}@example.com",password="Test@123",first_name="Test",last_name="User",phone="9800000000")
+            for i in range(10)
+        ]
+        cls.user,cls.product = users[0],products[0]
+        Review.objects.bulk_create([
+            Review(p_id=product,user=user,rating=4,review="good",status="Published")
+            for product in products for user in users
+        ])
+        # Enough carts per product and per user that neither column alone is selective.
+        shoppers = users+get_user_model().objects.bulk_create([
+            get_user_model()(email=f"shopper{i}@example.com",first_name="Test",last_name="User",phone="9800000000")
+            for i in range(40)
+        ])
+        Cart.objects.bulk_create([
+            Cart(p_id=product,user=user,quantity=1)
+            for product in products for user in shoppers
+        ])
+        DiscountCoupon.objects.bulk_create([
+            DiscountCoupon(user=user,coupon_code=f"C{i:02d}{j:03d}",max_amount=100,max_percentage=10,used=j%2==0)
+            for i,user in enumerate(users) for j in range(20)
+        ]+[
+            DiscountCoupon(user=shoppers[k%len(shoppers)],coupon_code=f"X{k:05d}",max_amount=100,max_percentage=10,used=True)
+            for k in range(5000)
+        ])
+        payments = Payment.objects.bulk_create([
+            Payment(id=f"pay-{i}-{j}",quantity=1,user=user,status="Completed" if j%2 else "Pending")
+            for i,user in enumerate(users) for j in range(20)
+        ])
+        cls.payment = payments[0]
+        PaymentProduct.objects.bulk_create([
+            PaymentProduct(payment_id=payment,product=products[j],quantity=1,amount=10)
+            for payment in payments for j in range(3)
+        ])
+        cls.province = Address.objects.create(id="P1",name="Province")
+        Address.objects.bulk_create([
+            Address(id=f"C{i}",name=f"City {i}",parent=cls.province) for i in range(50)
+        ])
+
+    def setUp(self):
+        if(connection.vendor == 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("ANALYZE")
+        elif(connection.vendor != 'sqlite'):
+            self.skipTest("Plan inspection is only implemented for PostgreSQL and SQLite.")
+
+    def assertNoSeqScan(self,queryset,table):
+        """Fail if the plan reads the whole table instead of an index."""
+        plan = queryset.explain()
+        if(connection.vendor == 'postgresql'):
+            seq_scan = re.search(rf'Seq Scan on {table}\b',plan)
+        else:
+            seq_scan = re.search(rf'SCAN {table}\b(?! USING)',plan)
+        self.assertIsNone(seq_scan,plan)
+
+    def assertUsesIndex(self,queryset,index):
+        """Fail unless the plan reads the given index."""
+        plan = queryset.explain()
+        self.assertRegex(plan,rf'\b{index}\b')
+
+    def test_payment_history_uses_index(self):
+        """Payment list of a user ordered by date."""
+        queryset = Payment.objects.filter(user=self.user).order_by('-date_time')[:10]
+        self.assertUsesIndex(queryset,'payment_user_date_idx')
+
+    def test_completed_payments_use_index(self):
+        """Completed payments of a user, checked before accepting a review."""
+        queryset = Payment.objects.filter(user=self.user,status='Completed')
+        self.assertUsesIndex(queryset,'payment_user_status_idx')
+
+    def test_cart_lookup_uses_index(self):
+        """Cart rows of a user and a user's product."""
+        self.assertNoSeqScan(Cart.objects.filter(user=self.user),'core_cart')
+        self.assertUsesIndex(Cart.objects.filter(user=self.user,p_id=self.product),'cart_user_product_idx')
+
+    def test_unused_coupons_use_index(self):
+        """Unused coupons of a user, listed and redeemed by code."""
+        queryset = DiscountCoupon.objects.filter(user=self.user,used=False).order_by('-id')
+        self.assertUsesIndex(queryset,'coupon_user_unused_idx')
+        queryset = DiscountCoupon.objects.filter(user=self.user,coupon_code="C00001",used=False)
+        self.assertNoSeqScan(queryset,'core_discountcoupon')
+
+    def test_coupon_redemption_planner_picks_code_index(self):
+        """Redemption by code is served by the unique coupon_code index, seqscan left enabled."""
+        if(connection.vendor != 'postgresql'):
+            self.skipTest("Planner costs are only meaningful on PostgreSQL.")
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = on")
+        queryset = DiscountCoupon.objects.filter(user=self.user,coupon_code="C00001",used=False)
+        self.assertNoSeqScan(queryset,'core_discountcoupon')
+        self.assertRegex(queryset.explain(),r'Index Cond: \(\(coupon_code\)')
+
+    def test_published_reviews_use_index(self):
+        """Published reviews of a product, newest first."""
+        queryset = Review.objects.filter(p_id=self.product,status="Published").order_by('-id')[:10]
+        self.assertUsesIndex(queryset,'review_product_published_idx')
+
+    def test_payment_products_use_index(self):
+        """Products of a payment, and payments containing a product."""
+        self.assertNoSeqScan(PaymentProduct.objects.filter(payment_id=self.payment),'core_paymentproduct')
+        queryset = PaymentProduct.objects.filter(payment_id=self.payment,product=self.product)
+        self.assertUsesIndex(queryset,'paymentproduct_payment_idx')
+
+    def test_child_addresses_use_index(self):
+        """Children of an address."""
+        queryset = Address.objects.filter(parent=self.province).order_by('parent')
+        self.assertNoSeqScan(queryset,'core_address')
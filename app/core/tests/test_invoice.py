@@ -0,0 +1,130 @@
+"""
+Tests for invoice generation.
+"""
+
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Category,Product,Payment,PaymentProduct
+from core.services.invoice import generate_many,invoice_rows
+from core.services.invoice_storage import invoice_storage
+from core.services.pdf_generator import get_renderer
+from core import tasks
+
+INVOICES_PATH = tempfile.mkdtemp()
+STORAGES = {
+    **settings.STORAGES,
+    "invoices": {"BACKEND": "django.core.files.storage.FileSystemStorage","OPTIONS": {"location": INVOICES_PATH}},
+}
+
+
+@override_settings(STORAGES=STORAGES)
+class TestInvoice(TestCase):
+    """Tests for rendering invoices outside the request."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(INVOICES_PATH,ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email="user@example.com",password="test123")
+        category = Category.objects.create(category="Electronics")
+        self.product = Product.objects.create(name="Macbook",price=10,stock=10,threshold=2,category=category)
+        self.payment = self.create_payment("pidx")
+
+    def create_payment(self,payment_id):
+        payment = Payment.objects.create(id=payment_id,quantity=2,status="Completed",transaction_id="txn",
+                                         amount=20,discount_amount=5,user=self.user)
+        PaymentProduct.objects.create(payment_id=payment,product=self.product,quantity=2,amount=20)
+        return payment
+
+    def test_invoice_rows(self):
+        """Rows list the products and the discount of the payment."""
+        self.assertEqual(invoice_rows(self.payment),[
+            ['Product Name','Unit Price','Units','Subtotal'],
+            ['Macbook',10,2,20],
+            ['Discount',None,None,-5],
+        ])
+
+    def test_generate_invoice_writes_pdf(self):
+        """The task stores the PDF under its content hash and records the path."""
+        path = tasks.generate_invoice(self.payment.id)
+
+        self.assertRegex(path,r"^([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.pdf$")
+        self.assertEqual(Payment.objects.get(id="pidx").invoice_path,path)
+        with invoice_storage().open(path,'rb') as file:
+            self.assertTrue(file.read().startswith(b"%PDF"))
+
+    def test_rerender_is_deduplicated(self):
+        """Rendering an unchanged invoice again yields the same stored file."""
+        path = tasks.generate_invoice(self.payment.id)
+        modified = invoice_storage().get_modified_time(path)
+
+        self.assertEqual(tasks.generate_invoice(self.payment.id),path)
+        self.assertEqual(invoice_storage().get_modified_time(path),modified)
+        self.assertEqual(invoice_storage().listdir(path.rsplit('/',1)[0])[1],[path.rsplit('/',1)[1]])
+
+    def test_email_invoice_attaches_stored_file(self):
+        """The email task reads the invoice from storage under a readable name."""
+        tasks.generate_invoice(self.payment.id)
+
+        with mock.patch('core.tasks.queue_email') as mock_send:
+            tasks.email_invoice("pidx","user@example.com","txn")
+
+        args = mock_send.call_args.args
+        self.assertEqual(args[2:],(["user@example.com"],Payment.objects.get(id="pidx").invoice_path,"pidx.pdf"))
+
+    def test_invoice_chain_renders_then_emails(self):
+        """The email is only sent after the invoice is rendered."""
+        render,email = tasks.invoice_chain("pidx","user@example.com","txn").tasks
+
+        self.assertEqual(render.task,'core.tasks.generate_invoice')
+        self.assertEqual(render.args,("pidx",))
+        self.assertEqual(email.task,'core.tasks.email_invoice')
+        self.assertEqual(email.args,("pidx","user@example.com","txn"))
+        self.assertTrue(render.immutable)
+
+    def test_generate_many_queries_independent_of_count(self):
+        """A batch loads its rows with a fixed number of queries."""
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(generate_many(Payment.objects.all()),1)
+        for index in range(5):
+            self.create_payment(f"pidx{index}")
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(generate_many(Payment.objects.all()),6)
+
+        self.assertEqual(len(few),len(many))
+        self.assertTrue(invoice_storage().exists(Payment.objects.get(id="pidx4").invoice_path))
+
+    def test_renderer_built_once_per_thread(self):
+        """Styles and header are shared by every invoice of the thread."""
+        self.assertIs(get_renderer(),get_renderer())
+
+    def test_regenerate_missing_only(self):
+        """Only payments without a stored invoice are rendered."""
+        tasks.generate_invoice(self.payment.id)
+        self.create_payment("other")
+        out = StringIO()
+
+        call_command("regenerate_invoices","--missing-only",stdout=out)
+
+        self.assertIn("Rendered 1 invoices",out.getvalue())
+        self.assertTrue(invoice_storage().exists(Payment.objects.get(id="other").invoice_path))
+
+    def test_benchmark_command(self):
+        """The benchmark reports both rendering strategies."""
+        out = StringIO()
+        call_command("benchmark_invoices","--count","2",stdout=out)
+
+        self.assertIn("per-invoice renderer",out.getvalue())
+        self.assertIn("shared renderer",out.getvalue())
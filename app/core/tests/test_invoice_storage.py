@@ -0,0 +1,94 @@
+"""
+Tests for invoice storage backends.
+"""
+
+import hashlib
+import shutil
+import tempfile
+from unittest import mock
+
+import boto3
+from moto import mock_aws
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from core.services.invoice_storage import content_path,digest_of,invoice_exists,open_invoice,save_invoice
+
+INVOICES_PATH = tempfile.mkdtemp()
+LOCAL_STORAGES = {
+    **settings.STORAGES,
+    "invoices": {"BACKEND": "django.core.files.storage.FileSystemStorage","OPTIONS": {"location": INVOICES_PATH}},
+}
+S3_STORAGES = {
+    **settings.STORAGES,
+    "invoices": {
+        "BACKEND": "storages.backends.s3.S3Storage",
+        "OPTIONS": {
+            "bucket_name": "invoices",
+            "access_key": "testing",
+            "secret_key": "testing",
+            "region_name": "us-east-1",
+            "file_overwrite": True,
+        },
+    },
+}
+
+
+class InvoiceStorageMixin:
+    """Behaviour every invoices backend must provide."""
+
+    def test_content_path_is_sharded_hash(self):
+        """Paths are two directory levels taken from the SHA-256 of the bytes."""
+        digest = hashlib.sha256(b"%PDF-1.4 a").hexdigest()
+
+        self.assertEqual(content_path(b"%PDF-1.4 a"),f"{digest[:2]}/{digest[2:4]}/{digest}.pdf")
+        self.assertEqual(digest_of(content_path(b"%PDF-1.4 a")),digest)
+
+    def test_save_and_open(self):
+        """Stored invoices can be read back by their path."""
+        path = save_invoice(b"%PDF-1.4 a")
+
+        self.assertTrue(invoice_exists(path))
+        with open_invoice(path) as file:
+            self.assertEqual(file.read(),b"%PDF-1.4 a")
+
+    def test_identical_content_stored_once(self):
+        """Saving the same bytes twice returns the same path without rewriting."""
+        path = save_invoice(b"%PDF-1.4 a")
+
+        with self.assertNoWrite():
+            self.assertEqual(save_invoice(b"%PDF-1.4 a"),path)
+        self.assertNotEqual(save_invoice(b"%PDF-1.4 b"),path)
+
+    def test_missing_invoice(self):
+        """Empty and unknown paths do not exist."""
+        self.assertFalse(invoice_exists(''))
+        self.assertFalse(invoice_exists(content_path(b"never stored")))
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class LocalInvoiceStorageTests(InvoiceStorageMixin,TestCase):
+    """Invoices on the local disk."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(INVOICES_PATH,ignore_errors=True)
+        super().tearDownClass()
+
+    def assertNoWrite(self):
+        return mock.patch('django.core.files.storage.FileSystemStorage._save',side_effect=AssertionError)
+
+
+@override_settings(STORAGES=S3_STORAGES)
+class S3InvoiceStorageTests(InvoiceStorageMixin,TestCase):
+    """Invoices in an S3-compatible bucket, served by moto's in-process stand-in."""
+
+    def setUp(self):
+        self.mock_aws = mock_aws()
+        self.mock_aws.start()
+        self.addCleanup(self.mock_aws.stop)
+        boto3.client("s3",region_name="us-east-1").create_bucket(Bucket="invoices")
+
+    def assertNoWrite(self):
+        return mock.patch('storages.backends.s3.S3Storage._save',side_effect=AssertionError)
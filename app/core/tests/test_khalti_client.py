@@ -0,0 +1,101 @@
+"""
+Tests for the Khalti gateway client.
+"""
+
+from django.test import SimpleTestCase, override_settings
+
+from core.services.fake_khalti import FakeKhalti
+from core.services.khalti_client import KhaltiClient,GatewayUnavailable,CircuitOpen
+
+
+class TestKhaltiClient(SimpleTestCase):
+    """Tests against the local fake gateway."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeKhalti().start()
+        cls.settings = override_settings(
+            PAYMENT_URL=cls.fake.initiate_url,
+            PAYMENT_LOOKUP_URL=cls.fake.lookup_url,
+            KHALTI_API_KEY="Key test",
+            KHALTI_READ_TIMEOUT=0.5,
+            KHALTI_RETRY_BACKOFF=0.01,
+            KHALTI_LOOKUP_RETRIES=2,
+            KHALTI_BREAKER_THRESHOLD=2,
+            KHALTI_BREAKER_RESET_TIMEOUT=60,
+        )
+        cls.settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        cls.fake.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.fake.delay = 0
+        self.fake.failures.clear()
+        self.fake.requests.clear()
+        self.fake.connections.clear()
+        self.khalti = KhaltiClient()
+
+    def test_initiate_and_lookup(self):
+        """A payment started through the gateway can be looked up."""
+        pidx = self.khalti.initiate({"amount":1000}).json()["pidx"]
+        self.fake.complete(pidx,"txn")
+
+        data = self.khalti.lookup(pidx).json()
+
+        self.assertEqual(data["status"],"Completed")
+        self.assertEqual(data["transaction_id"],"txn")
+
+    def test_client_errors_returned(self):
+        """4xx answers are the caller's to handle and do not count as failures."""
+        for _ in range(3):
+            self.assertEqual(self.khalti.initiate({"amount":1}).status_code,400)
+        self.assertEqual(self.khalti.breaker.state,'closed')
+
+    def test_connections_reused(self):
+        """Consecutive calls share one pooled connection."""
+        for _ in range(3):
+            self.khalti.lookup("missing")
+        self.assertEqual(len(self.fake.connections),1)
+
+    def test_lookup_retried(self):
+        """Transient 5xx answers to lookups are retried."""
+        self.fake.fail_next(2)
+
+        self.assertEqual(self.khalti.lookup("missing").status_code,404)
+        self.assertEqual(len(self.fake.requests),3)
+
+    def test_initiate_not_retried(self):
+        """A failed initiate is not repeated."""
+        self.fake.fail_next(1)
+
+        with self.assertRaises(GatewayUnavailable):
+            self.khalti.initiate({"amount":1000})
+        self.assertEqual(len(self.fake.requests),1)
+
+    def test_read_timeout(self):
+        """A slow gateway raises once the read timeout passes."""
+        self.fake.delay = 1
+
+        with self.assertRaises(GatewayUnavailable):
+            self.khalti.initiate({"amount":1000})
+
+    def test_circuit_opens_and_recovers(self):
+        """Repeated failures fail fast until a trial call succeeds."""
+        self.fake.fail_next(2)
+        for _ in range(2):
+            with self.assertRaises(GatewayUnavailable):
+                self.khalti.initiate({"amount":1000})
+
+        with self.assertRaises(CircuitOpen):
+            self.khalti.lookup("missing")
+        self.assertEqual(len(self.fake.requests),2)
+
+        self.khalti.breaker.opened_at -= 60
+        self.assertEqual(self.khalti.breaker.state,'half-open')
+        self.assertEqual(self.khalti.lookup("missing").status_code,404)
+        self.assertEqual(self.khalti.breaker.state,'closed')
@@ -0,0 +1,203 @@
+"""
+Tests for batched email delivery.
+"""
+
+import json
+import smtplib
+import threading
+from unittest import mock
+
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from core.services.mail_queue import PENDING_KEY,PROCESSING_KEY,DEAD_KEY,LOCK_KEY,FlushInProgress,queue_email,flush_pending
+from core import tasks
+
+
+class FakeRedis:
+    """In memory stand in for the redis commands used by the email queue."""
+
+    def __init__(self):
+        self.lists = {}
+        self.locks = {}
+
+    def rpush(self,key,*values):
+        self.lists.setdefault(key,[]).extend(values)
+
+    def lpush(self,key,*values):
+        for value in values:
+            self.lists.setdefault(key,[]).insert(0,value)
+
+    def lmove(self,source,destination,where_from,where_to):
+        values = self.lists.get(source)
+        if not values:
+            return None
+        value = values.pop(0 if where_from == 'LEFT' else -1)
+        if where_to == 'LEFT':
+            self.lpush(destination,value)
+        else:
+            self.rpush(destination,value)
+        return value
+
+    def delete(self,key):
+        self.lists.pop(key,None)
+
+    def lock(self,name,timeout=None):
+        return self.locks.setdefault(name,threading.Lock())
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Queues commands and runs them against the FakeRedis on execute."""
+
+    def __init__(self,redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self,name):
+        return lambda *args: self.commands.append((name,args))
+
+    def execute(self):
+        return [getattr(self.redis,name)(*args) for name,args in self.commands]
+
+
+def failing_send(subject,error,times=1):
+    """Make the locmem backend raise error for the first times sends of subject."""
+    send_messages = locmem.EmailBackend.send_messages
+    failures = [times]
+
+    def send(backend,messages):
+        if messages[0].subject == subject and failures[0]:
+            failures[0] -= 1
+            raise error
+        return send_messages(backend,messages)
+    return mock.patch.object(locmem.EmailBackend,'send_messages',send)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                   EMAIL_HOST_USER="shop@example.com",EMAIL_BATCH_WINDOW_MS=2000)
+@mock.patch('core.tasks.flush_emails.apply_async')
+@mock.patch('core.services.mail_queue.queue_connection')
+class TestMailQueue(TestCase):
+    """Tests for queueing and sending emails in batches."""
+
+    def setUp(self):
+        cache.clear()
+        self.redis = FakeRedis()
+
+    def test_one_flush_scheduled_per_window(self,mock_redis,mock_apply_async):
+        """Emails queued in the same window schedule a single flush."""
+        mock_redis.return_value = self.redis
+        for index in range(3):
+            tasks.send_email(f"Mail {index}","message",["user@example.com"],'')
+
+        self.assertEqual(len(self.redis.lists[PENDING_KEY]),3)
+        mock_apply_async.assert_called_once_with(countdown=2.0)
+        self.assertEqual(mail.outbox,[])
+
+    def test_batch_sent_over_one_connection(self,mock_redis,mock_apply_async):
+        """A flush opens one connection per batch and sends every email."""
+        mock_redis.return_value = self.redis
+        for index in range(5):
+            queue_email(f"Mail {index}","message",[f"user{index}@example.com"])
+
+        with mock.patch('core.services.mail_queue.get_connection',wraps=mail.get_connection) as get_connection:
+            self.assertEqual(flush_pending(2),5)
+
+        self.assertEqual(get_connection.call_count,3)
+        self.assertEqual([email.subject for email in mail.outbox],[f"Mail {index}" for index in range(5)])
+
+    def test_low_stock_alerts_merged(self,mock_redis,mock_apply_async):
+        """Alerts sharing a digest key and recipients become one email."""
+        mock_redis.return_value = self.redis
+        queue_email("Threshold Reached","Macbook is low",["shop@example.com"],digest="low-stock")
+        queue_email("Welcome","Hi",["user@example.com"])
+        queue_email("Threshold Reached","iPhone is low",["shop@example.com"],digest="low-stock")
+
+        self.assertEqual(flush_pending(50),2)
+
+        digest,welcome = mail.outbox
+        self.assertEqual(digest.body,"Macbook is low\n\niPhone is low")
+        self.assertEqual(welcome.subject,"Welcome")
+
+    def test_failed_batch_requeued(self,mock_redis,mock_apply_async):
+        """A batch the SMTP server rejects is kept in order for the retry."""
+        mock_redis.return_value = self.redis
+        queue_email("First","message",["user@example.com"])
+        queue_email("Second","message",["user@example.com"])
+
+        with mock.patch('core.services.mail_queue.send_batch',side_effect=ConnectionError()):
+            with self.assertRaises(ConnectionError):
+                flush_pending(50)
+
+        self.assertEqual(flush_pending(50),2)
+        self.assertEqual([email.subject for email in mail.outbox],["First","Second"])
+
+    def test_only_unsent_emails_requeued(self,mock_redis,mock_apply_async):
+        """Emails sent before a transient failure are not sent again by the retry."""
+        mock_redis.return_value = self.redis
+        for subject in ("First","Second","Third"):
+            queue_email(subject,"message",["user@example.com"])
+
+        with failing_send("Second",smtplib.SMTPServerDisconnected()):
+            with self.assertRaises(smtplib.SMTPServerDisconnected):
+                flush_pending(50)
+            self.assertEqual(len(self.redis.lists[PENDING_KEY]),2)
+            self.assertEqual(flush_pending(50),2)
+
+        self.assertEqual([email.subject for email in mail.outbox],["First","Second","Third"])
+
+    def test_refused_email_dead_lettered(self,mock_redis,mock_apply_async):
+        """An email the server refuses for good is set aside and the rest still go out."""
+        mock_redis.return_value = self.redis
+        queue_email("Bad","message",["nobody@example.com"])
+        queue_email("Good","message",["user@example.com"])
+        refused = smtplib.SMTPRecipientsRefused({"nobody@example.com":(550,b"No such user")})
+
+        with failing_send("Bad",refused):
+            self.assertEqual(flush_pending(50),1)
+            self.assertEqual(flush_pending(50),0)
+
+        self.assertEqual([email.subject for email in mail.outbox],["Good"])
+        self.assertEqual(self.redis.lists[PENDING_KEY],[])
+        dead, = self.redis.lists[DEAD_KEY]
+        self.assertEqual(json.loads(dead)['subject'],"Bad")
+
+    def test_crashed_flush_batch_recovered(self,mock_redis,mock_apply_async):
+        """A batch left in the processing list by a dead flush is sent first, in order."""
+        mock_redis.return_value = self.redis
+        queue_email("First","message",["user@example.com"])
+        queue_email("Second","message",["user@example.com"])
+        queue_email("Third","message",["user@example.com"])
+        self.redis.lmove(PENDING_KEY,PROCESSING_KEY,'LEFT','RIGHT')
+        self.redis.lmove(PENDING_KEY,PROCESSING_KEY,'LEFT','RIGHT')
+
+        self.assertEqual(flush_pending(50),3)
+
+        self.assertEqual([email.subject for email in mail.outbox],["First","Second","Third"])
+        self.assertEqual(self.redis.lists.get(PROCESSING_KEY,[]),[])
+
+    def test_one_flush_at_a_time(self,mock_redis,mock_apply_async):
+        """A flush started while another holds the queue leaves it alone."""
+        mock_redis.return_value = self.redis
+        queue_email("First","message",["user@example.com"])
+        self.redis.lock(LOCK_KEY).acquire()
+
+        with self.assertRaises(FlushInProgress):
+            flush_pending(50)
+
+        self.assertEqual(len(self.redis.lists[PENDING_KEY]),1)
+        self.assertEqual(mail.outbox,[])
+
+    def test_incomplete_email_not_queued(self,mock_redis,mock_apply_async):
+        """Emails without a subject or recipients are dropped."""
+        mock_redis.return_value = self.redis
+        queue_email(None,"message",["user@example.com"])
+        queue_email("Hi","message",[])
+
+        self.assertEqual(self.redis.lists,{})
+        mock_apply_async.assert_not_called()
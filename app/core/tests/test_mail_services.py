@@ -20,7 +20,7 @@ class TestMailSender(TestCase):
         response = mail_sender.send_email(None,"message",['xyz@example.com'],'')
         self.assertEqual(response,False)
 
-    @mock.patch('core.services.mail_sender.open',return_value=IOError)
+    @mock.patch('core.services.mail_sender.open_invoice',side_effect=IOError)
     def test_mail_sent_service_down(self,mock_send):
         """Test send mail when smtp server is down"""
         response = mail_sender.send_email("hi","message",['xyz@example.com'],'path')
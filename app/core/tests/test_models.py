@@ -4,6 +4,8 @@ Tests for models
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
+from core.models import Product,Category,ProductImage
+
 
 class ModelTests(TestCase):
     """Test models"""
@@ -48,4 +50,21 @@ class ModelTests(TestCase):
             password="test123"
         )
         self.assertTrue(user.is_superuser)
-        self.assertTrue(user.is_staff)
\ No newline at end of file
+        self.assertTrue(user.is_staff)
+
+    def test_primary_image_follows_first_image(self):
+        """Test primary_image is kept on the first image by saves and deletes"""
+        category = Category.objects.create(category="Electronics")
+        product = Product.objects.create(name="Macbook",price=10,stock=10,threshold=2,category=category)
+        first = ProductImage.objects.create(p_id=product,image_url="images/first.jpg")
+        ProductImage.objects.create(p_id=product,image_url="images/second.jpg")
+        product.refresh_from_db()
+        self.assertEqual(product.primary_image.name,"images/first.jpg")
+
+        first.delete()
+        product.refresh_from_db()
+        self.assertEqual(product.primary_image.name,"images/second.jpg")
+
+        ProductImage.objects.filter(p_id=product).get().delete()
+        product.refresh_from_db()
+        self.assertFalse(product.primary_image)
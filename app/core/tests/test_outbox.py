@@ -0,0 +1,123 @@
+"""
+Tests for the task outbox.
+"""
+
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from core.models import OutboxMessage
+from core.services import outbox
+from core.tasks import send_email
+
+
+def email(subject="Hi"):
+    return send_email.si(subject,"message",["user@example.com"],'')
+
+
+@mock.patch('celery.app.task.Task.apply_async')
+class TestOutbox(TestCase):
+    """Tests for enqueueing and relaying outbox messages."""
+
+    def test_enqueue_does_not_publish(self,mock_apply_async):
+        """Enqueueing only writes a row."""
+        outbox.enqueue(email())
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.signature['task'],'core.tasks.send_email')
+        self.assertIsNone(message.published_at)
+        mock_apply_async.assert_not_called()
+
+    def test_rolled_back_message_never_published(self,mock_apply_async):
+        """A message written by a failed transaction disappears with it."""
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                outbox.enqueue(email())
+                raise ValueError()
+
+        self.assertEqual(outbox.relay_pending(10),0)
+        mock_apply_async.assert_not_called()
+
+    def test_key_deduplicates(self,mock_apply_async):
+        """A second message with the same key is dropped."""
+        outbox.enqueue(email("First"),key="welcome:1")
+        outbox.enqueue(email("Second"),key="welcome:1")
+        outbox.enqueue(email("Other"))
+
+        self.assertEqual(OutboxMessage.objects.count(),2)
+        self.assertEqual(OutboxMessage.objects.get(key="welcome:1").signature['args'][0],"First")
+
+    def test_relay_publishes_in_order_once(self,mock_apply_async):
+        """Pending messages are published in batches and marked published."""
+        for index in range(5):
+            outbox.enqueue(email(f"Mail {index}"))
+
+        self.assertEqual(outbox.relay_pending(2),5)
+        self.assertEqual(outbox.relay_pending(2),0)
+
+        self.assertEqual(mock_apply_async.call_count,5)
+        self.assertFalse(OutboxMessage.objects.filter(published_at=None).exists())
+
+    def test_failed_publish_left_pending(self,mock_apply_async):
+        """A broker error keeps the whole batch for the next attempt."""
+        outbox.enqueue(email())
+        mock_apply_async.side_effect = ConnectionError()
+
+        with self.assertRaises(ConnectionError):
+            outbox.relay_pending(10)
+
+        self.assertEqual(outbox.stats()['pending'],1)
+
+    def test_stats_report_lag(self,mock_apply_async):
+        """Lag is the age of the oldest pending message."""
+        self.assertEqual(outbox.stats(),{'pending':0,'lag_seconds':0})
+        outbox.enqueue(email())
+        OutboxMessage.objects.update(created_at=timezone.now()-timedelta(seconds=30))
+
+        stats = outbox.stats()
+
+        self.assertEqual(stats['pending'],1)
+        self.assertGreaterEqual(stats['lag_seconds'],30)
+
+    def test_purge_published(self,mock_apply_async):
+        """Only messages published before the retention window are deleted."""
+        outbox.enqueue(email(),key="old")
+        outbox.enqueue(email(),key="pending")
+        OutboxMessage.objects.filter(key="old").update(published_at=timezone.now()-timedelta(hours=25))
+
+        self.assertEqual(outbox.purge_published(timedelta(hours=24)),1)
+        self.assertEqual(list(OutboxMessage.objects.values_list('key',flat=True)),["pending"])
+
+    def test_relay_command(self,mock_apply_async):
+        """The relay command publishes once and reports stats."""
+        outbox.enqueue(email())
+        out = StringIO()
+
+        call_command("relay_outbox","--once",stdout=out)
+        self.assertIn("Published 1 messages",out.getvalue())
+
+        out = StringIO()
+        call_command("relay_outbox","--stats",stdout=out)
+        self.assertEqual(json.loads(out.getvalue()),{'pending':0,'lag_seconds':0})
+
+    @mock.patch('core.management.commands.relay_outbox.time.sleep')
+    def test_relay_command_survives_broker_errors(self,mock_sleep,mock_apply_async):
+        """A broker error is logged and the relay backs off and carries on."""
+        outbox.enqueue(email())
+        mock_apply_async.side_effect = [ConnectionError(),None]
+        mock_sleep.side_effect = [None,KeyboardInterrupt()]
+        out,err = StringIO(),StringIO()
+
+        with self.assertRaises(KeyboardInterrupt):
+            call_command("relay_outbox","--interval","0.5",stdout=out,stderr=err)
+
+        self.assertIn("Relaying failed",err.getvalue())
+        self.assertIn("Published 1 messages",out.getvalue())
+        self.assertEqual([call.args[0] for call in mock_sleep.call_args_list],[1.0,0.5])
+        self.assertEqual(outbox.stats()['pending'],0)
@@ -0,0 +1,172 @@
+"""
+Tests for payment finalisation and reconciliation.
+"""
+
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.models import Category,Product,Cart,Payment,PaymentProduct,DiscountCoupon,OutboxMessage
+from core.services.fake_khalti import FakeKhalti
+from core.services.khalti_client import get_client
+from core.services.payments import reconcile_pending,complete_payment,apply_lookup
+from core import tasks
+
+
+class TestReconcilePayments(TestCase):
+    """Tests for finalising and reconciling pending payments."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeKhalti().start()
+        cls.settings = override_settings(
+            PAYMENT_URL=cls.fake.initiate_url,
+            PAYMENT_LOOKUP_URL=cls.fake.lookup_url,
+            KHALTI_API_KEY="Key test",
+            KHALTI_RETRY_BACKOFF=0.01,
+        )
+        cls.settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        cls.fake.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        get_client().breaker.reset()
+        self.fake.payments.clear()
+        self.fake.requests.clear()
+        self.user = get_user_model().objects.create_user(email="user@example.com",password="test123")
+        category = Category.objects.create(category="Electronics")
+        self.product = Product.objects.create(name="Macbook",price=10,stock=10,threshold=2,category=category)
+        Cart.objects.create(user=self.user,p_id=self.product,quantity=2)
+
+    def create_payment(self,pidx,gateway_status="Pending",minutes_ago=30,**kwargs):
+        payment = Payment.objects.create(id=pidx,quantity=2,amount=20,user=self.user,**kwargs)
+        Payment.objects.filter(id=pidx).update(date_time=timezone.now()-timedelta(minutes=minutes_ago))
+        PaymentProduct.objects.create(payment_id=payment,product=self.product,quantity=2,amount=20)
+        self.fake.payments[pidx] = {"pidx":pidx,"total_amount":2000,"status":gateway_status,
+                                    "transaction_id":None,"fee":0,"refunded":False}
+        return payment
+
+    def test_completed_payments_finalised(self):
+        """Payments paid at the gateway are completed like validate does."""
+        self.create_payment("paid")
+        self.fake.complete("paid","txn")
+
+        self.assertEqual(reconcile_pending(15,10,4),{'completed':1})
+
+        payment = Payment.objects.get(id="paid")
+        self.assertEqual((payment.status,payment.transaction_id,payment.amount),("Completed","txn",20))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock,8)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+        email = OutboxMessage.objects.get(key="invoice:paid").signature['kwargs']['tasks'][1]
+        self.assertEqual(email['args'],["paid","user@example.com","txn"])
+
+    def test_completion_keeps_items_added_later(self):
+        """Only the paid lines leave the cart, later additions stay."""
+        self.create_payment("paid")
+        self.fake.complete("paid","txn")
+        Cart.objects.filter(user=self.user).update(quantity=3)
+        other = Product.objects.create(name="iPad",price=5,stock=10,threshold=2,category=self.product.category)
+        Cart.objects.create(user=self.user,p_id=other,quantity=1)
+
+        self.assertEqual(reconcile_pending(15,10,4),{'completed':1})
+
+        self.assertEqual(sorted(Cart.objects.filter(user=self.user).values_list('p_id','quantity')),
+                         sorted([(self.product.p_id,1),(other.p_id,1)]))
+
+    def test_completion_is_idempotent(self):
+        """Finalising the same payment again changes nothing and sends nothing."""
+        payment = self.create_payment("paid")
+        # Rs. 150 earns one point, fractions are truncated.
+        data = {"pidx":"paid","total_amount":15000,"status":"Completed","transaction_id":"txn"}
+
+        self.assertTrue(complete_payment(payment,data))
+        self.assertFalse(complete_payment(Payment.objects.get(id="paid"),data))
+        self.assertEqual(apply_lookup(payment,data),'already_finalised')
+
+        self.product.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.product.stock,8)
+        self.assertEqual(self.user.reward_points,1)
+        self.assertEqual(OutboxMessage.objects.count(),1)
+
+    def test_insufficient_stock_needs_refund(self):
+        """A paid payment that cannot be covered is flagged for refund and alerted once."""
+        payment = self.create_payment("paid")
+        Product.objects.filter(p_id=self.product.p_id).update(stock=1)
+        data = {"pidx":"paid","total_amount":2000,"status":"Completed","transaction_id":"txn"}
+
+        self.assertEqual(apply_lookup(payment,data),'needs_refund')
+
+        payment.refresh_from_db()
+        self.assertEqual((payment.status,payment.transaction_id),("NeedsRefund","txn"))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock,1)
+        self.assertTrue(Cart.objects.filter(user=self.user).exists())
+        alert = OutboxMessage.objects.get()
+        self.assertEqual(alert.signature['args'][0],"Refund Required")
+        self.assertEqual(apply_lookup(payment,data),'already_finalised')
+        self.assertEqual(OutboxMessage.objects.count(),1)
+
+    def test_needs_refund_payments_not_reconciled(self):
+        """Payments flagged for refund are not looked up again."""
+        self.create_payment("paid",status="NeedsRefund",transaction_id="txn")
+
+        self.assertEqual(reconcile_pending(15,10,4),{})
+        self.assertEqual(self.fake.requests,[])
+
+    def test_abandoned_payments_closed(self):
+        """Expired and canceled payments are closed and their coupon released."""
+        coupon = DiscountCoupon.objects.create(user=self.user,coupon_code="abc",max_percentage=10,max_amount=5,used=True)
+        self.create_payment("expired","Expired",coupon=coupon)
+        self.create_payment("canceled","User canceled")
+
+        self.assertEqual(reconcile_pending(15,1,4),{'abandoned':2})
+
+        self.assertEqual(Payment.objects.get(id="expired").status,"Expired")
+        self.assertEqual(Payment.objects.get(id="canceled").status,"Canceled")
+        coupon.refresh_from_db()
+        self.assertFalse(coupon.used)
+
+    def test_recent_and_unavailable_payments_left_pending(self):
+        """Recent payments are skipped and failed lookups retried next run."""
+        self.create_payment("recent",minutes_ago=1)
+        self.create_payment("waiting")
+        self.create_payment("down")
+        self.fake.payments.pop("down")
+
+        self.assertEqual(reconcile_pending(15,10,4),{'pending':1,'unavailable':1})
+
+        self.assertEqual(sorted(self.fake.requests),["/api/v2/epayment/lookup/"]*2)
+        self.assertEqual(Payment.objects.filter(status="Pending").count(),3)
+
+    def test_non_json_lookup_counted_unavailable(self):
+        """A lookup answered with something other than JSON does not stop the run."""
+        self.create_payment("broken")
+        self.create_payment("expired","Expired")
+        response = mock.MagicMock(status_code=200)
+        response.json.side_effect = ValueError("Expecting value")
+        lookup = get_client().lookup
+
+        with mock.patch.object(get_client(),'lookup',side_effect=lambda pidx: response if pidx == "broken" else lookup(pidx)):
+            self.assertEqual(reconcile_pending(15,10,4),{'unavailable':1,'abandoned':1})
+
+        self.assertEqual(Payment.objects.get(id="broken").status,"Pending")
+        self.assertEqual(Payment.objects.get(id="expired").status,"Expired")
+
+    @override_settings(PAYMENT_RECONCILE_AFTER_MINUTES=15,PAYMENT_RECONCILE_BATCH_SIZE=10,PAYMENT_RECONCILE_WORKERS=2)
+    def test_task_runs_reconciliation(self):
+        """The beat task reconciles with the configured limits."""
+        self.create_payment("expired","Expired")
+
+        tasks.reconcile_payments()
+
+        self.assertEqual(Payment.objects.get(id="expired").status,"Expired")
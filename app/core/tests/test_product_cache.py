@@ -0,0 +1,74 @@
+"""
+Tests for the product cache.
+"""
+
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from core.services import product_cache
+
+
+class TestProductCacheFetch(SimpleTestCase):
+    """Tests for single-flight recomputation and early expiration."""
+
+    def setUp(self):
+        cache.clear()
+
+    def store(self, value, expires_in, delta=0.1):
+        cache.set("key",{'value':value,'expires':time.time() + expires_in,'delta':delta})
+
+    def test_concurrent_misses_compute_once(self):
+        """Requests missing the same key wait for one recomputation."""
+        compute = mock.Mock(side_effect=lambda: time.sleep(0.2) or "fresh")
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(product_cache.fetch('list',"key",compute,60)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        compute.assert_called_once()
+        self.assertEqual(results,["fresh"]*8)
+
+    def test_stale_served_while_rebuilding(self):
+        """An expired entry is served while another request holds the lock."""
+        self.store("stale",expires_in=-1)
+        cache.add("key:lock",True)
+        compute = mock.Mock(return_value="fresh")
+
+        self.assertEqual(product_cache.fetch('list',"key",compute,60),"stale")
+        compute.assert_not_called()
+        self.assertEqual(product_cache.stats()['list']['stale'],1)
+
+    def test_expired_entry_recomputed_by_lock_holder(self):
+        """The first request after expiry rebuilds the entry and releases the lock."""
+        self.store("stale",expires_in=-1)
+
+        self.assertEqual(product_cache.fetch('list',"key",lambda: "fresh",60),"fresh")
+        self.assertIsNone(cache.get("key:lock"))
+        self.assertEqual(cache.get("key")['value'],"fresh")
+
+    @mock.patch('core.services.product_cache.random.random')
+    def test_early_expiration(self,mock_random):
+        """Entries close to expiry are refreshed early depending on the draw."""
+        self.store("cached",expires_in=5,delta=1)
+        compute = mock.Mock(return_value="fresh")
+
+        mock_random.return_value = 0.0
+        self.assertEqual(product_cache.fetch('list',"key",compute,60),"cached")
+        mock_random.return_value = 0.999999
+        self.assertEqual(product_cache.fetch('list',"key",compute,60),"fresh")
+        compute.assert_called_once()
+
+    def test_waiter_computes_when_lock_released_without_value(self):
+        """A failed rebuild does not leave other requests waiting for the lock timeout."""
+        cache.add("key:lock",True)
+        with mock.patch('core.services.product_cache.time.sleep',side_effect=lambda seconds: cache.delete("key:lock")):
+            self.assertEqual(product_cache.fetch('list',"key",lambda: "fresh",60),"fresh")
@@ -0,0 +1,93 @@
+"""
+Tests for query budgets and the query stats middleware
+"""
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from address.views import AddressViewSet
+from core.models import Address
+from core.query_budget import QueryBudgetMixin, QueryRecorder, view_action
+
+ADDRESS_URL = reverse("address:address-list")
+
+
+class QueryStatsMiddlewareTests(QueryBudgetMixin, TestCase):
+    """Test recording queries per view."""
+
+    def setUp(self):
+        self.client = APIClient()
+        user = get_user_model().objects.create_user(email="user@example.com", password="test123", is_active=True)
+        self.authenticate(self.client, user)
+        Address.objects.create(id="1", name="Province")
+
+    @override_settings(QUERY_STATS_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        """Test the query count and time are sent with the response."""
+        response = self.client.get(ADDRESS_URL)
+
+        self.assertRegex(response['Server-Timing'], r'^db;dur=\d+\.\d;desc="2 queries"$')
+
+    @override_settings(QUERY_STATS_SERVER_TIMING=False)
+    def test_server_timing_disabled(self):
+        """Test no header is sent when disabled."""
+        response = self.client.get(ADDRESS_URL)
+
+        self.assertNotIn('Server-Timing', response)
+
+    def test_over_budget_logged(self):
+        """Test an action running over its budget is logged as a warning."""
+        with mock.patch.object(AddressViewSet, 'query_budgets', {'list': 1}):
+            with self.assertLogs('core.query_budget', level='WARNING') as logs:
+                self.client.get(ADDRESS_URL)
+
+        self.assertIn("AddressViewSet.list ran 2 queries, over its budget of 1", logs.output[0])
+
+    def test_within_budget_not_warned(self):
+        """Test requests within budget are logged at debug level."""
+        with self.assertLogs('core.query_budget', level='DEBUG') as logs:
+            self.client.get(ADDRESS_URL)
+
+        self.assertEqual([record.levelname for record in logs.records], ['DEBUG'])
+        self.assertIn("AddressViewSet.list ran 2 queries", logs.output[0])
+
+    def test_assert_within_budget_fails_over_budget(self):
+        """Test the assertion lists the queries of an action over budget."""
+        with mock.patch.object(AddressViewSet, 'query_budgets', {'list': 1}):
+            with self.assertRaisesMessage(AssertionError, "AddressViewSet.list ran 2 queries, budget 1"):
+                self.assertWithinBudget(AddressViewSet, 'list', lambda: self.client.get(ADDRESS_URL))
+
+    def test_assert_independent_of_n_fails_when_growing(self):
+        """Test queries that grow with the data fail the assertion."""
+        def seed(size):
+            for index in range(size):
+                Address.objects.create(id=f"{size}.{index}", name="City")
+        def request():
+            # One query per address, as an N+1 loop would run.
+            for address in Address.objects.all():
+                Address.objects.filter(id=address.id).exists()
+            return self.client.get(ADDRESS_URL)
+
+        with mock.patch.object(AddressViewSet, 'query_budgets', {'list': 100}):
+            with self.assertRaisesMessage(AssertionError, "queries grow with the data"):
+                self.assertBudgetIndependentOfN(AddressViewSet, 'list', seed, request)
+
+    def test_view_action(self):
+        """Test the viewset and action are found from a routed view."""
+        view = AddressViewSet.as_view({'get': 'list'})
+
+        self.assertEqual(view_action(view, 'GET'), (AddressViewSet, 'list'))
+        self.assertEqual(view_action(view, 'POST'), (AddressViewSet, None))
+
+    def test_recorder_counts_queries(self):
+        """Test queries on the connection are counted and timed."""
+        recorder = QueryRecorder()
+        with recorder.record():
+            list(Address.objects.all())
+            Address.objects.count()
+
+        self.assertEqual(len(recorder), 2)
+        self.assertGreater(recorder.duration, 0)
@@ -0,0 +1,93 @@
+"""
+Tests for the reindex_products command.
+"""
+
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.management.commands.reindex_products import Command
+from core.models import Product,Category,ProductImage
+
+
+def create_product(category,**params):
+    """Create and return a new product with two images"""
+    product = Product.objects.create(category=category,**params)
+    ProductImage.objects.create(p_id=product,image_url=f"products/{product.name}-1.jpg")
+    ProductImage.objects.create(p_id=product,image_url=f"products/{product.name}-2.jpg")
+    return product
+
+
+def consume_actions(client,actions,**kwargs):
+    """Stand in for parallel_bulk, reporting every action as indexed."""
+    return [(True,{'index':action}) for action in actions]
+
+
+@mock.patch('core.management.commands.reindex_products.parallel_bulk',side_effect=consume_actions)
+@mock.patch('core.management.commands.reindex_products.connections')
+class TestReindexProducts(TestCase):
+    """Tests for rebuilding the product index behind an alias."""
+
+    def setUp(self):
+        self.category = Category.objects.create(category="Electronics")
+        for i in range(3):
+            create_product(self.category,name=f"product{i}",price=10,stock=10,threshold=2)
+
+    def test_documents_built_with_first_image(self,mock_connections,mock_parallel_bulk):
+        """Every product is sent to the new index with its first image."""
+        client = mock_connections.get_connection.return_value
+        client.indices.exists_alias.return_value = False
+        client.indices.exists.return_value = False
+
+        call_command("reindex_products","--workers","2","--chunk-size","2",stdout=StringIO())
+
+        args,kwargs = mock_parallel_bulk.call_args
+        self.assertEqual(kwargs['thread_count'],2)
+        self.assertEqual(kwargs['chunk_size'],2)
+        index_name = client.indices.refresh.call_args.kwargs['index']
+        self.assertTrue(index_name.startswith("product-"))
+        client.indices.update_aliases.assert_called_once_with(
+            body={'actions':[{'add':{'index':index_name,'alias':'product'}}]}
+        )
+
+    def test_query_count_independent_of_catalog_size(self,mock_connections,mock_parallel_bulk):
+        """The image url is read from primary_image instead of queried per product."""
+        command = Command()
+        with CaptureQueriesContext(connection) as few:
+            actions = list(command.actions("product-test",chunk_size=100))
+        for i in range(3,10):
+            create_product(self.category,name=f"product{i}",price=10,stock=10,threshold=2)
+        with CaptureQueriesContext(connection) as many:
+            list(command.actions("product-test",chunk_size=100))
+
+        self.assertEqual(len(few),len(many))
+        self.assertEqual(actions[0]['_index'],"product-test")
+        self.assertTrue(actions[0]['_source']['image_url'].endswith("product0-1.jpg"))
+
+    def test_alias_swapped_from_old_index(self,mock_connections,mock_parallel_bulk):
+        """The alias moves to the new index atomically and the old index is dropped."""
+        client = mock_connections.get_connection.return_value
+        client.indices.exists_alias.return_value = True
+        client.indices.get_alias.return_value = {'product-old':{'aliases':{'product':{}}}}
+
+        call_command("reindex_products",stdout=StringIO())
+
+        index_name = client.indices.refresh.call_args.kwargs['index']
+        client.indices.update_aliases.assert_called_once_with(body={'actions':[
+            {'add':{'index':index_name,'alias':'product'}},
+            {'remove':{'index':'product-old','alias':'product'}},
+        ]})
+        client.indices.delete.assert_called_once_with(index='product-old')
+
+    def test_alias_unchanged_on_failure(self,mock_connections,mock_parallel_bulk):
+        """A failed bulk request leaves searches on the current index."""
+        client = mock_connections.get_connection.return_value
+        mock_parallel_bulk.side_effect = lambda client,actions,**kwargs: [(False,{'index':{'error':'boom'}})]
+
+        call_command("reindex_products",stdout=StringIO(),stderr=StringIO())
+
+        client.indices.update_aliases.assert_not_called()
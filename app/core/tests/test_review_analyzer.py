@@ -0,0 +1,59 @@
+"""
+Tests for review analyzer.
+"""
+
+from django.test import SimpleTestCase
+from unittest import mock
+
+import numpy as np
+
+from core.services import review_analyzer
+
+
+@mock.patch('core.services.review_analyzer.WordNetLemmatizer')
+@mock.patch('core.services.review_analyzer.word_tokenize', side_effect=lambda text: text.split())
+@mock.patch('core.services.review_analyzer.stopwords', new=mock.Mock(words=lambda language: ['the','i','to']))
+@mock.patch('core.services.review_analyzer.pickle')
+@mock.patch('core.services.review_analyzer.open', new_callable=mock.mock_open)
+@mock.patch('core.services.review_analyzer.load_model')
+class TestReviewAnalyzer(SimpleTestCase):
+    """Tests for loading and running the review classifier."""
+
+    def setUp(self):
+        review_analyzer._classifier = None
+
+    def tearDown(self):
+        review_analyzer._classifier = None
+
+    def test_model_loaded_once(self, mock_load_model, mock_open, mock_pickle, mock_tokenize, mock_lemmatizer):
+        """Model and tokenizer are loaded once for many analyses."""
+        mock_lemmatizer.return_value.lemmatize.side_effect = lambda word: word
+        mock_pickle.load.return_value.texts_to_sequences.return_value = [[1]]
+        mock_load_model.return_value.predict.return_value = np.array([[0.1]])
+
+        review_analyzer.analyze("good product")
+        review_analyzer.analyze("good product")
+
+        mock_load_model.assert_called_once()
+        mock_pickle.load.assert_called_once()
+        mock_lemmatizer.assert_called_once()
+
+    def test_analyze_many_single_predict(self, mock_load_model, mock_open, mock_pickle, mock_tokenize, mock_lemmatizer):
+        """A batch of reviews is padded and predicted in one call."""
+        mock_lemmatizer.return_value.lemmatize.side_effect = lambda word: word
+        mock_pickle.load.return_value.texts_to_sequences.return_value = [[1], [2, 3], [4]]
+        mock_load_model.return_value.predict.return_value = np.array([[0.1], [0.9], [0.4]])
+
+        result = review_analyzer.analyze_many(["good", "I want to kill you", "the best"])
+
+        self.assertEqual(result, [0, 1, 0])
+        mock_load_model.return_value.predict.assert_called_once()
+        padded = mock_load_model.return_value.predict.call_args[0][0]
+        self.assertEqual(padded.shape, (3, review_analyzer.MAX_SEQUENCE_LENGTH))
+        mock_pickle.load.return_value.texts_to_sequences.assert_called_once_with(["good", "want kill you", "best"])
+
+    def test_analyze_many_empty(self, mock_load_model, mock_open, mock_pickle, mock_tokenize, mock_lemmatizer):
+        """No prediction is made for an empty batch."""
+        mock_lemmatizer.return_value.lemmatize.side_effect = lambda word: word
+        self.assertEqual(review_analyzer.analyze_many([]), [])
+        mock_load_model.return_value.predict.assert_not_called()
@@ -0,0 +1,96 @@
+"""
+Tests for queued product indexing.
+"""
+
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+
+from core.models import Product,Category,ProductImage
+from core.services import search_index
+
+
+class FakeRedis:
+    """In memory stand in for the redis set commands used by the index queue."""
+
+    def __init__(self):
+        self.sets = {}
+
+    def sadd(self,key,*values):
+        self.sets.setdefault(key,set()).update(str(value) for value in values)
+
+    def spop(self,key,count):
+        members = self.sets.get(key,set())
+        return [members.pop() for _ in range(min(count,len(members)))]
+
+
+@override_settings(ELASTICSEARCH_DSL_AUTOSYNC=True,SEARCH_INDEX_WINDOW_MS=1000)
+@mock.patch('core.services.search_index.ProductDocument')
+@mock.patch('core.services.search_index.get_redis_connection')
+class TestSearchIndex(TestCase):
+    """Tests for coalescing product index writes."""
+
+    def setUp(self):
+        cache.clear()
+        self.redis = FakeRedis()
+        category = Category(category="Electronics")
+        with override_settings(ELASTICSEARCH_DSL_AUTOSYNC=False):
+            category.save()
+            self.product = Product.objects.create(name="Macbook",price=10,stock=10,threshold=2,category=category)
+
+    @mock.patch('core.signals.generate_image_variants.delay')
+    @mock.patch('core.tasks.index_products.apply_async')
+    def test_repeated_edits_coalesced(self,mock_apply_async,mock_variants,mock_redis,mock_document):
+        """Edits within the window queue the product once and schedule one flush."""
+        mock_redis.return_value = self.redis
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for price in (11,12,13):
+                self.product.price = price
+                self.product.save()
+            ProductImage.objects.create(p_id=self.product,image_url="products/macbook.jpg")
+
+        self.assertEqual(self.redis.sets[search_index.PENDING_KEY],{str(self.product.p_id)})
+        mock_apply_async.assert_called_once_with(countdown=1.0)
+        mock_document.return_value.update.assert_not_called()
+
+    def test_nothing_queued_before_commit(self,mock_redis,mock_document):
+        """Rolled back edits are never queued."""
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.product.save()
+
+        self.assertTrue(callbacks)
+        mock_redis.assert_not_called()
+
+    def test_flush_writes_batches_without_forced_refresh(self,mock_redis,mock_document):
+        """Queued products are indexed in bulk and become visible on the refresh interval."""
+        mock_redis.return_value = self.redis
+        self.redis.sadd(search_index.PENDING_KEY,1,2,3)
+
+        indexed = search_index.flush_pending(batch_size=2)
+
+        self.assertEqual(indexed,3)
+        self.assertEqual(mock_document.return_value.update.call_count,2)
+        for call in mock_document.return_value.update.call_args_list:
+            self.assertEqual(call.kwargs['refresh'],'wait_for')
+        self.assertEqual(self.redis.sets[search_index.PENDING_KEY],set())
+
+    def test_failed_bulk_write_requeued(self,mock_redis,mock_document):
+        """Products whose bulk write fails stay queued for the retry."""
+        mock_redis.return_value = self.redis
+        self.redis.sadd(search_index.PENDING_KEY,1,2)
+        mock_document.return_value.update.side_effect = ConnectionError()
+
+        with self.assertRaises(ConnectionError):
+            search_index.flush_pending(batch_size=10)
+
+        self.assertEqual(self.redis.sets[search_index.PENDING_KEY],{"1","2"})
+        mock_document.return_value.update.side_effect = None
+        self.assertEqual(search_index.flush_pending(batch_size=10),2)
+
+    def test_index_now_waits_for_refresh(self,mock_redis,mock_document):
+        """Read-your-write indexing waits for the next refresh instead of forcing one."""
+        search_index.index_now([self.product.p_id])
+
+        self.assertEqual(mock_document.return_value.update.call_args.kwargs['refresh'],'wait_for')
@@ -0,0 +1,56 @@
+"""
+Tests for stock reservation service.
+"""
+
+from django.test import TestCase
+
+from core.models import Product,Category
+from core.services.stock import reserve_stock,low_stock_message,InsufficientStock
+
+
+def create_product(**params):
+    """Create and return a new product"""
+    category = Category(category="Electornics")
+    category.save()
+    params["category"] = category
+    return Product.objects.create(**params)
+
+
+class TestStockService(TestCase):
+    """Tests for reserving stock."""
+
+    def setUp(self):
+        self.p1 = create_product(name="Macbook Pro M1 Pro",price=10,stock=10,threshold=2)
+        self.p2 = create_product(name="Macbook Pro M2 Pro",price=20,stock=5,threshold=4)
+
+    def test_reserve_stock_decrements_all_products(self):
+        """Stock of every product is decremented in a single update."""
+        reserve_stock({self.p1.p_id:3,self.p2.p_id:1})
+        self.p1.refresh_from_db()
+        self.p2.refresh_from_db()
+        self.assertEqual(self.p1.stock,7)
+        self.assertEqual(self.p2.stock,4)
+
+    def test_reserve_stock_returns_products_crossing_threshold(self):
+        """Only products that went below threshold with this reservation are returned."""
+        low_stock = reserve_stock({self.p1.p_id:3,self.p2.p_id:2})
+        self.assertEqual([product.p_id for product in low_stock],[self.p2.p_id])
+
+        low_stock = reserve_stock({self.p2.p_id:1})
+        self.assertEqual(low_stock,[])
+
+    def test_reserve_stock_insufficient_rolls_back(self):
+        """Nothing is decremented when a product cannot cover its quantity."""
+        with self.assertRaises(InsufficientStock) as context:
+            reserve_stock({self.p1.p_id:3,self.p2.p_id:6})
+        self.assertEqual(context.exception.product_ids,[self.p2.p_id])
+        self.p1.refresh_from_db()
+        self.p2.refresh_from_db()
+        self.assertEqual(self.p1.stock,10)
+        self.assertEqual(self.p2.stock,5)
+
+    def test_low_stock_message_lists_every_product(self):
+        """Single alert message contains all low stock products."""
+        message = low_stock_message([self.p1,self.p2])
+        self.assertIn(str(self.p1.p_id),message)
+        self.assertIn(str(self.p2.p_id),message)
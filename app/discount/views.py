@@ -6,7 +6,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
 from core.models import DiscountCoupon
-from core.pagination import CustomPagination
+from core.pagination import KeysetPagination
 from discount.serializers import DiscountCouponSerializer
 
 
@@ -15,10 +15,10 @@ class DiscountCouponViewSet(GenericViewSet,ListModelMixin):
     serializer_class = DiscountCouponSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
-    pagination_class = CustomPagination
+    pagination_class = KeysetPagination
     queryset = DiscountCoupon.objects.filter(used=False)
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        queryset = queryset.filter(user=self.request.user)
+        queryset = queryset.filter(user=self.request.user).order_by('-id')
         return queryset
\ No newline at end of file
@@ -7,13 +7,22 @@ from django.test.utils import override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework.test import APIClient
 from rest_framework import status
-from core.models import Category,Product,Cart,DiscountCoupon,Payment,PaymentProduct,Address,DeliveryAddress
+from core.models import Category,Product,Cart,DiscountCoupon,Payment,PaymentProduct,Address,DeliveryAddress,OutboxMessage
 from core.tasks import send_email
+from core.services.invoice_storage import invoice_storage,save_invoice
+from core.services.khalti_client import get_client
+from core.query_budget import QueryBudgetMixin
+from payment.views import PaymentViewSet
 from unittest import mock
 import requests
+import os
+import shutil
+import tempfile
 
 PAYMENT_URL = reverse("payment:payment-list")
 VALIDATION_URL = reverse("payment:validate")
@@ -76,6 +85,7 @@ class PrivatePaymentApiTests(TestCase):
     """Unit test for payment api."""
 
     def setUp(self) -> None:
+        get_client().breaker.reset()
         self.client = APIClient()
         payload = {
             "first_name" : "xyz",
@@ -134,7 +144,7 @@ class PrivatePaymentApiTests(TestCase):
         url = PAYMENT_URL
         data = {"return_url":"http://127.0.0.1:8000/success"} 
 
-        with mock.patch('requests.post') as mock_post:
+        with mock.patch('requests.Session.post') as mock_post:
             mock_post.side_effect = requests.exceptions.RequestException()
 
             response = self.client.post(url, data)
@@ -188,7 +198,7 @@ class PrivatePaymentApiTests(TestCase):
             'error_key': 'validation_error'
             }
 
-        with mock.patch('requests.post') as mock_post:
+        with mock.patch('requests.Session.post') as mock_post:
             mock_post.return_value = mock_response
 
             response = self.client.post(url, data=data)
@@ -468,7 +478,7 @@ class PrivatePaymentApiTests(TestCase):
             'message': 'Success',
         }
         data = {"coupon_code":coupon["coupon_code"],"return_url":"http://127.0.0.1:8000/success"} 
-        with mock.patch('requests.post') as mock_post:
+        with mock.patch('requests.Session.post') as mock_post:
             mock_post.return_value = mock_response
 
             response = self.client.post(url, data=data)
@@ -484,7 +494,8 @@ class PrivatePaymentApiTests(TestCase):
             mock_post.assert_called_with(
                 url=settings.PAYMENT_URL, 
                 json=api_data,
-                headers={"Authorization":settings.KHALTI_API_KEY}
+                headers={"Authorization":settings.KHALTI_API_KEY},
+                timeout=(settings.KHALTI_CONNECT_TIMEOUT,settings.KHALTI_READ_TIMEOUT)
             )
         
         mock_response = mock.MagicMock()
@@ -530,7 +541,7 @@ class PrivatePaymentApiTests(TestCase):
                 }
             ]
             }
-        with mock.patch('requests.post') as mock_post:
+        with mock.patch('requests.Session.post') as mock_post:
             mock_post.return_value = mock_response
 
             response = self.client.post(url, data=data)
@@ -546,9 +557,35 @@ class PrivatePaymentApiTests(TestCase):
             mock_post.assert_called_with(
                 url=settings.PAYMENT_URL, 
                 json=api_data,
-                headers={"Authorization":settings.KHALTI_API_KEY}
+                headers={"Authorization":settings.KHALTI_API_KEY},
+                timeout=(settings.KHALTI_CONNECT_TIMEOUT,settings.KHALTI_READ_TIMEOUT)
             )
 
+    def test_create_payment_query_count_independent_of_cart_size(self):
+        """Checkout runs the same number of queries for small and large carts."""
+        a1 = create_address(id="1",name="xyz",parent=None)
+        a2 = create_address(id="2",name="xyz2",parent=a1)
+        a3 = create_address(id="3",name="xyz3",parent=a2)
+        create_delivery_address(user=self.user,provience=a1,city=a2,area=a3)
+        data = {"return_url":"http://127.0.0.1:8000/success"}
+        query_counts = []
+        for index,cart_size in enumerate([2,8]):
+            Cart.objects.filter(user=self.user).delete()
+            for _ in range(cart_size):
+                product = create_product(name="Macbook",price=10,stock=10,threshold=2)
+                create_cart(p_id=product,quantity=1,user=self.user)
+            mock_response = mock.MagicMock()
+            mock_response.status_code = status.HTTP_200_OK
+            mock_response.json.return_value = {"pidx":f"pidx{index}"}
+            with mock.patch('requests.Session.post') as mock_post:
+                mock_post.return_value = mock_response
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.post(PAYMENT_URL, data=data)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(PaymentProduct.objects.filter(payment_id=f"pidx{index}").count(),cart_size)
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0],query_counts[1])
+
     def test_get_payment_list_success(self):
         """Test Get list of payment made by user"""
         payment = {
@@ -631,13 +668,43 @@ class PrivatePaymentApiTests(TestCase):
             "fee": 0,
             "refunded": False
         }
-        with mock.patch('requests.post') as mock_get:
+        with mock.patch('requests.Session.post') as mock_get:
             mock_get.return_value.status_code = status.HTTP_200_OK
             mock_get.return_value = mock_response
-            with mock.patch('payment.views.send_email') as mock_send_email:
+            with mock.patch('core.services.invoice.get_renderer') as mock_generate:
                 response = self.client.get(VALIDATION_URL+"?pidx=xyz&transaction_id=xyz&amount=1000")
                 self.assertEqual(response.status_code, status.HTTP_200_OK)
+                invoice = OutboxMessage.objects.get(key="invoice:xyz")
+                self.assertEqual(invoice.signature['subtask_type'],"chain")
+                mock_generate.assert_not_called()
     
+    def test_validate_payment_insufficient_stock(self):
+        """Validation fails without touching stock and flags the paid payment for refund."""
+        p1 = create_product(name="Macbook Pro M1 Pro",price=10,stock=10,threshold=2)
+        p2 = create_product(name="Macbook Pro M2 Pro",price=10,stock=1,threshold=2)
+        p = create_payment(id="xyz",quantity=3,status="Pending",amount=1000,user=self.user)
+        create_payment_product(payment_id=p,product=p1,quantity=1,amount=10)
+        create_payment_product(payment_id=p,product=p2,quantity=2,amount=20)
+
+        mock_response = mock.MagicMock()
+        mock_response.status_code = status.HTTP_200_OK
+        mock_response.json.return_value = {
+            "pidx": "xyz",
+            "total_amount": 2000,
+            "status": "Completed",
+            "transaction_id": "xyz",
+            "fee": 0,
+            "refunded": False
+        }
+        with mock.patch('requests.Session.post') as mock_post:
+            mock_post.return_value = mock_response
+            with mock.patch('core.tasks.send_email'):
+                response = self.client.get(VALIDATION_URL+"?pidx=xyz&transaction_id=xyz&amount=1000")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        p1.refresh_from_db()
+        self.assertEqual(p1.stock,10)
+        self.assertEqual(Payment.objects.get(id="xyz").status,"NeedsRefund")
+
     def test_validate_payment_not_found(self):
         """Validate user payment."""
         payment = {
@@ -661,13 +728,13 @@ class PrivatePaymentApiTests(TestCase):
             "fee": 0,
             "refunded": False
         }
-        with mock.patch('requests.get') as mock_get:
+        with mock.patch('requests.Session.post') as mock_get:
             mock_get.return_value = mock_response
             response = self.client.get(VALIDATION_URL+"?pidx=xyz1&transaction_id=xyz&amount=1000")
             self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
             self.assertEqual(response.json(),{'error': 'Payment not found'})
     
-    @mock.patch('requests.post')  
+    @mock.patch('requests.Session.post')  
     def test_validate_payment_service_unavailable(self,mock_get):
         payment = {
             "id":"xyz",
@@ -685,6 +752,31 @@ class PrivatePaymentApiTests(TestCase):
         # mock_exception.assert_called()  
         self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
 
+    @mock.patch('requests.Session.post')
+    def test_validate_payment_gateway_returns_non_json(self,mock_post):
+        """A lookup answered with something other than JSON is reported as unavailable."""
+        create_payment(id="xyz",quantity=5,status="Pending",amount=1000,user=self.user)
+        mock_response = mock.MagicMock()
+        mock_response.status_code = status.HTTP_200_OK
+        mock_response.json.side_effect = ValueError("Expecting value")
+        mock_post.return_value = mock_response
+
+        response = self.client.get(VALIDATION_URL+"?pidx=xyz&transaction_id=xyz&amount=1000")
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(Payment.objects.get(id="xyz").status,"Pending")
+
+    @mock.patch('requests.Session.post')
+    def test_validate_closed_payment_from_database(self,mock_post):
+        """A payment closed by reconciliation is answered without a gateway call."""
+        create_payment(id="xyz",quantity=5,status="Expired",amount=1000,user=self.user)
+
+        response = self.client.get(VALIDATION_URL+"?pidx=xyz&transaction_id=xyz&amount=1000")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["status"],"Expired")
+        mock_post.assert_not_called()
+
     def test_validate_status_not_completed(self):
         """Test validate with payment status not completed"""
         payment = {
@@ -706,7 +798,7 @@ class PrivatePaymentApiTests(TestCase):
             "fee": 0,
             "refunded": False
         }
-        with mock.patch('payment.views.requests.post') as mock_get:
+        with mock.patch('requests.Session.post') as mock_get:
             mock_get.return_value = mock_response
             response = self.client.get(VALIDATION_URL+"?pidx=xyz&transaction_id=xyz&amount=1000")
             self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -733,7 +825,7 @@ class PrivatePaymentApiTests(TestCase):
             "fee": 0,
             "refunded": False
         }
-        with mock.patch('payment.views.requests.post') as mock_get:
+        with mock.patch('requests.Session.post') as mock_get:
             mock_get.return_value = mock_response
             response = self.client.get(VALIDATION_URL+"?pidx=xyz&transaction_id=xyz&amount=1000")
             self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -760,7 +852,7 @@ class PrivatePaymentApiTests(TestCase):
             "fee": 0,
             "refunded": False
         }
-        with mock.patch('payment.views.requests.post') as mock_get:
+        with mock.patch('requests.Session.post') as mock_get:
             mock_get.return_value = mock_response
             response = self.client.get(VALIDATION_URL+"?pidx=xyz&amount=1000")
             self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -773,7 +865,7 @@ class PrivatePaymentApiTests(TestCase):
         self.assertIn("detail",response.json().keys())
         self.assertEqual(response.status_code,status.HTTP_404_NOT_FOUND)
 
-    @mock.patch('payment.views.open', side_effect=IOError("Mocked file open error"))
+    @mock.patch('payment.views.open_invoice', side_effect=IOError("Mocked file open error"))
     def test_download_file_reading_error(self,os_path_exists):
         """Test downloading file when payment doesnot exist."""
         payment = {
@@ -803,3 +895,146 @@ class PrivatePaymentApiTests(TestCase):
         create_payment(**payment)
         response = self.client.get(DOWNLOAD_URL+"?id=xyz")
         self.assertEqual(response.status_code,status.HTTP_200_OK)
+
+
+INVOICES_PATH = tempfile.mkdtemp()
+STORAGES = {
+    **settings.STORAGES,
+    "invoices": {"BACKEND": "django.core.files.storage.FileSystemStorage","OPTIONS": {"location": INVOICES_PATH}},
+}
+
+
+@override_settings(STORAGES=STORAGES)
+class InvoiceDownloadTests(TestCase):
+    """Tests for streaming invoice downloads."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(INVOICES_PATH,ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self) -> None:
+        self.user = create_user(email="user@example.com",password="test123")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.invoice_path = save_invoice(b"%PDF-1.4 invoice")
+        create_payment(id="xyz",quantity=5,status="Completed",transaction_id="txn",amount=1000,user=self.user,invoice_path=self.invoice_path)
+
+    def test_download_streams_with_validators(self):
+        """Invoice is streamed with length, ETag and Last-Modified."""
+        response = self.client.get(DOWNLOAD_URL+"?id=xyz")
+
+        self.assertEqual(response.status_code,status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b"".join(response.streaming_content),b"%PDF-1.4 invoice")
+        self.assertEqual(response['Content-Length'],"16")
+        self.assertEqual(response['Content-Type'],"application/pdf")
+        self.assertIn('attachment; filename="xyz.pdf"',response['Content-Disposition'])
+        self.assertEqual(response['ETag'],'"%s"' % os.path.basename(self.invoice_path)[:-4])
+        self.assertIn('Last-Modified',response)
+
+    def test_download_not_modified(self):
+        """A matching If-None-Match is answered with 304 and no body."""
+        etag = self.client.get(DOWNLOAD_URL+"?id=xyz")['ETag']
+
+        response = self.client.get(DOWNLOAD_URL+"?id=xyz",HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code,status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content,b"")
+
+    @override_settings(INVOICES_SENDFILE="x-accel-redirect",INVOICES_ACCEL_REDIRECT_PREFIX="/protected/invoices/")
+    def test_download_offloaded_to_proxy(self):
+        """In X-Accel-Redirect mode the proxy is told which file to send."""
+        response = self.client.get(DOWNLOAD_URL+"?id=xyz")
+
+        self.assertEqual(response.status_code,status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'],"/protected/invoices/"+self.invoice_path)
+        self.assertEqual(response.content,b"")
+
+    @override_settings(INVOICES_SENDFILE="x-sendfile")
+    def test_download_streamed_from_remote_storage(self):
+        """Storages without local files are streamed even in sendfile mode."""
+        with mock.patch('payment.views.on_local_disk',return_value=False):
+            response = self.client.get(DOWNLOAD_URL+"?id=xyz")
+
+        self.assertEqual(response.status_code,status.HTTP_200_OK)
+        self.assertNotIn('X-Sendfile',response)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b"".join(response.streaming_content),b"%PDF-1.4 invoice")
+
+    def test_download_renders_missing_invoice(self):
+        """An invoice the worker has not rendered yet is generated on demand."""
+        invoice_storage().delete(self.invoice_path)
+
+        response = self.client.get(DOWNLOAD_URL+"?id=xyz")
+
+        self.assertEqual(response.status_code,status.HTTP_200_OK)
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+        invoice_path = Payment.objects.get(id="xyz").invoice_path
+        self.assertNotEqual(invoice_path,self.invoice_path)
+        self.assertTrue(invoice_storage().exists(invoice_path))
+
+
+@override_settings(STORAGES=STORAGES)
+class PaymentQueryBudgetTests(QueryBudgetMixin,TestCase):
+    """Queries of each payment action stay within budget whatever the number of items."""
+
+    def setUp(self) -> None:
+        get_client().breaker.reset()
+        self.user = create_user(email="user@example.com",password="test123",is_active=True)
+        self.client = APIClient()
+        self.authenticate(self.client,self.user)
+        province = create_address(id="1",name="Province",parent=None)
+        city = create_address(id="2",name="City",parent=province)
+        area = create_address(id="3",name="Area",parent=city)
+        create_delivery_address(user=self.user,provience=province,city=city,area=area)
+        self.payments = []
+
+    def create_product(self,index):
+        category,_ = Category.objects.get_or_create(category="Electornics")
+        return Product.objects.create(name=f"Product {index}",price=100,stock=100,threshold=2,category=category)
+
+    def seed_payment(self,size,status="Completed"):
+        """A new payment of size lines."""
+        payment = create_payment(id=f"payment-{len(self.payments)}",quantity=size,status=status,
+                                 transaction_id=None if status=="Pending" else "txn",amount=100*size,user=self.user)
+        for index in range(size):
+            create_payment_product(payment_id=payment,product=self.create_product(index),quantity=1,amount=100)
+        self.payments.append(payment)
+
+    def gateway(self,**data):
+        response = mock.MagicMock()
+        response.status_code = status.HTTP_200_OK
+        response.json.return_value = data
+        return response
+
+    def test_list_budget(self):
+        self.assertBudgetIndependentOfN(PaymentViewSet,'list',lambda size: [self.seed_payment(1) for _ in range(size)],
+                                        lambda: self.client.get(PAYMENT_URL))
+
+    def test_retrieve_budget(self):
+        self.assertBudgetIndependentOfN(PaymentViewSet,'retrieve',self.seed_payment,
+                                        lambda: self.client.get(reverse("payment:payment-detail",args=[self.payments[-1].id])))
+
+    def test_create_budget(self):
+        def seed(size):
+            for index in range(Cart.objects.filter(user=self.user).count(),size):
+                create_cart(p_id=self.create_product(index),quantity=1,user=self.user)
+        def create():
+            pidx = f"pidx-{Payment.objects.count()}"
+            with mock.patch('requests.Session.post',return_value=self.gateway(pidx=pidx)):
+                return self.client.post(PAYMENT_URL,{"return_url":"http://127.0.0.1:8000/success"})
+        self.assertBudgetIndependentOfN(PaymentViewSet,'create',seed,create)
+
+    def test_validate_budget(self):
+        def validate():
+            payment = self.payments[-1]
+            lookup = self.gateway(pidx=payment.id,total_amount=payment.amount*100,status="Completed",transaction_id="txn")
+            with mock.patch('requests.Session.post',return_value=lookup):
+                return self.client.get(VALIDATION_URL,{"pidx":payment.id,"transaction_id":"txn","amount":payment.amount})
+        self.assertBudgetIndependentOfN(PaymentViewSet,'validate',lambda size: self.seed_payment(size,"Pending"),validate)
+
+    def test_download_budget(self):
+        """Invoices rendered on demand, whatever the number of lines."""
+        self.assertBudgetIndependentOfN(PaymentViewSet,'download',self.seed_payment,
+                                        lambda: self.client.get(DOWNLOAD_URL,{"id":self.payments[-1].id}))
@@ -13,22 +13,25 @@ from rest_framework_simplejwt.authentication import JWTAuthentication
 
 from django.conf import settings
 from django.urls import reverse
-from django.http import HttpResponse
+from django.http import HttpResponse,FileResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header,http_date,quote_etag
 from django.shortcuts import get_object_or_404
 from django.conf import settings
 
 from urllib.parse import urlsplit
 
-from core.tasks import send_email
-
-from core.models import Payment,Product,Cart,PaymentProduct,User,DiscountCoupon,DeliveryAddress
-from core.pagination import CustomPagination
-from core.services.pdf_generator import generate
+from core.models import Payment,DiscountCoupon,DeliveryAddress
+from core.pagination import KeysetPagination
+from core.services.invoice import ensure_invoice,invoice_file_name
+from core.services.invoice_storage import invoice_storage,open_invoice,digest_of,on_local_disk
+from core.services.checkout import PricedCart
+from core.services.khalti_client import get_client,GatewayUnavailable
+from core.services.payments import complete_payment,flag_for_refund
+from core.services.stock import InsufficientStock
 from payment import serializers,exceptions
 
 import uuid
-import os
-import requests
 
 def generate_unique_id():
     return str(uuid.uuid4())
@@ -49,8 +52,16 @@ class PaymentViewSet(viewsets.GenericViewSet,
     serializer_class = serializers.PaymentSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticatedOrReadOnly]
-    pagination_class = CustomPagination
+    pagination_class = KeysetPagination
     queryset = Payment.objects.all()
+    query_budgets = {
+        # Page number responses without a cursor add a COUNT.
+        'list': 3,
+        'retrieve': 2,
+        'create': 6,
+        'validate': 15,
+        'download': 5,
+    }
     
     def get_serializer_class(self):
         if self.action == "create":
@@ -71,29 +82,15 @@ class PaymentViewSet(viewsets.GenericViewSet,
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid()
         data = serializer.data
-        product_details = []
-        total_amount = 0
-        items = list(Cart.objects.filter(user=self.request.user).values())
-        if(len(items)==0):
+        cart = PricedCart.for_user(self.request.user)
+        if(cart.is_empty()):
             return Response({"error":"Cart is empty"},status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         if("return_url" not in data.keys()):
             return Response({"error":"return_url is required"},status=status.HTTP_400_BAD_REQUEST)
         get_object_or_404(DeliveryAddress,user=self.request.user)
-        product_details = []
-        total_quantity = 0
-        total_amount = 0
-        for item in items:
-            record = {}
-            product = Product.objects.get(p_id=item["p_id_id"])
-            record["name"] = product.name
-            record["unit_price"] = product.price
-            record["quantity"] = item['quantity']
-            record["total_price"] = item["quantity"]*product.price
-            record["identity"] = str(product.p_id)
-            record['id'] = item["p_id_id"]
-            product_details.append(record)
-            total_amount += product.price*item["quantity"]
-            total_quantity += item['quantity']
+        product_details = cart.product_details()
+        total_amount = cart.total_amount
+        total_quantity = cart.total_quantity
 
         purchase_id = generate_unique_id()
         coupon = None
@@ -118,24 +115,15 @@ class PaymentViewSet(viewsets.GenericViewSet,
             "website_url": self.get_base_url(data["return_url"]),
             "product_details":product_details
         }
-        headers = {
-            "Authorization" : settings.KHALTI_API_KEY
-        }
         try:
-            response = requests.post(url=settings.PAYMENT_URL, json=payload, headers=headers)
+            response = get_client().initiate(payload)
             response_data = response.json()
-        except:
+        except (GatewayUnavailable,ValueError):
             raise exceptions.ServiceUnavailable()
         if response.status_code == 200:
             payment = Payment.objects.create(user=self.request.user, id=response_data["pidx"],amount=total_amount,quantity=total_quantity,coupon=coupon,discount_amount=discount_amount)
             
-            for product_detail in product_details:
-                product = Product.objects.get(p_id=product_detail['id'])
-                payment_product = PaymentProduct.objects.create(payment_id=payment,
-                                                                amount=product_detail['total_price'],
-                                                                quantity=product_detail['quantity'],
-                                                                product=product)
-                payment_product.save()
+            cart.create_payment_products(payment)
 
             response_data["message"] = "Success"
             return Response(data=response_data, status=status.HTTP_201_CREATED)
@@ -158,45 +146,27 @@ class PaymentViewSet(viewsets.GenericViewSet,
         transaction_id = self.request.query_params.get("transaction_id")
         amount = self.request.query_params.get("amount")
         if pidx and transaction_id and amount:
-            payload = {
-                "pidx": pidx
-            }
-            headers = {
-                "Authorization" : settings.KHALTI_API_KEY
-            }
             try:
                 payment = Payment.objects.get(id=pidx)
             except Payment.DoesNotExist:
                 return Response({"error": "Payment not found"}, status=status.HTTP_400_BAD_REQUEST)
-            if(payment.transaction_id == None and payment.amount != None):
+            # Payments already finalised here or by the reconciliation job are answered from the database.
+            if(payment.status == "Pending" and payment.transaction_id == None and payment.amount != None):
                 try:
-                    response = requests.post(url=settings.PAYMENT_LOOKUP_URL, data=payload, headers=headers)
-                except Exception as e:
+                    response = get_client().lookup(pidx)
+                except GatewayUnavailable:
                     raise exceptions.ServiceUnavailable()
                 if(response.status_code == status.HTTP_200_OK):
-                    response_data = response.json()
+                    try:
+                        response_data = response.json()
+                    except ValueError:
+                        raise exceptions.ServiceUnavailable()
                     if(response_data["status"] == "Completed"):
-                        payment.status = response_data['status']
-                        payment.transaction_id = response_data['transaction_id']
-                        payment.amount = float(amount)/100
-                        payment_products = PaymentProduct.objects.filter(payment_id = response_data['pidx'])
-                        payment_detail_list = [['Product Name','Unit Price','Units','Subtotal']]
-                        for payment_product in payment_products:
-                            product = Product.objects.get(p_id=payment_product.product.p_id)
-                            product.stock -= payment_product.quantity
-                            if(product.stock < product.threshold):
-                                send_email.delay("Threshold Reached",f"The product {product.name} with id: {product.p_id} is going out of stock.\n Current Stock={product.stock}",[settings.EMAIL_HOST_USER],'')
-                            product.save()
-
-                            payment_detail_list.append([product.name,product.price,payment_product.quantity,payment_product.amount])
-                        payment_detail_list.append(['Discount',None,None,payment.discount_amount*-1])
-                        generate(response_data['pidx']+'.pdf',payment_detail_list,response_data['transaction_id'])
-                        send_email.delay("Payment Successful",f"Your purchase for txn ID:{response_data['transaction_id']} is successful",[payment.user.email],response_data['pidx']+'.pdf')
-                        Cart.objects.filter(user=payment.user).delete()
-                        user = User.objects.get(id=payment.user.id)
-                        user.reward_points += payment.amount/100
-                        user.save()
-                        payment.save()
+                        try:
+                            complete_payment(payment,response_data)
+                        except InsufficientStock as e:
+                            flag_for_refund(payment,response_data,e.product_ids)
+                            return Response({"error":"Not Enough Stock"},status=status.HTTP_409_CONFLICT)
                     else:
                         return Response({"error":"Payment Not Completed"},status=status.HTTP_400_BAD_REQUEST)
                 else:
@@ -213,13 +183,33 @@ class PaymentViewSet(viewsets.GenericViewSet,
     )
     def download(self,request,*args,**kwargs):
         payment = get_object_or_404(Payment,id=request.query_params["id"],status="Completed",user=self.request.user)
-        file_name = payment.id+".pdf"
-        file_path = os.path.join(settings.INVOICES_PATH,file_name)
-        if(os.path.exists(file_path)):
+        file_name = invoice_file_name(payment.id)
+        file_path = ensure_invoice(payment)
+        # Paths are content hashes, so the ETag changes only with the bytes.
+        etag = quote_etag(digest_of(file_path))
+        modified = invoice_storage().get_modified_time(file_path).timestamp()
+        not_modified = get_conditional_response(request,etag=etag,last_modified=int(modified))
+        if(not_modified):
+            return not_modified
+
+        # Only files on local disk can be handed to the proxy, others are streamed.
+        sendfile = settings.INVOICES_SENDFILE if on_local_disk() else ""
+        if(sendfile == "x-accel-redirect"):
+            # The reverse proxy streams the file from an internal location.
+            response = HttpResponse(content_type='application/pdf')
+            response['X-Accel-Redirect'] = settings.INVOICES_ACCEL_REDIRECT_PREFIX+file_path
+            response['Content-Disposition'] = content_disposition_header(True,file_name)
+        elif(sendfile == "x-sendfile"):
+            response = HttpResponse(content_type='application/pdf')
+            response['X-Sendfile'] = invoice_storage().path(file_path)
+            response['Content-Disposition'] = content_disposition_header(True,file_name)
+        else:
             try:
-                with open(file_path, 'rb') as file:
-                    response = HttpResponse(file, content_type='pdf')
-                    response['Content-Disposition'] = f'attachment; filename={file_name}'
-                    return response
-            except:
-                return Response({"error":"Error reading file."},status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+                file = open_invoice(file_path)
+            except OSError:
+                return Response({"error":"Error reading file."},status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            # FileResponse streams the file in blocks and sets Content-Length.
+            response = FileResponse(file,as_attachment=True,filename=file_name,content_type='application/pdf')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modified)
+        return response
\ No newline at end of file
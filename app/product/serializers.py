@@ -2,31 +2,40 @@
 Serializers for product model.
 """
 from rest_framework import serializers
+from django.urls import reverse
 
 from core.models import Product,ProductImage,Category
 from core.documents import ProductDocument
+from core.services.image_variants import srcset
 
 from review.serializers import ReviewSerializer
+from core.pagination import KeysetPagination
 
 from typing import Optional
 
 from django_elasticsearch_dsl_drf.serializers import DocumentSerializer
+from drf_spectacular.utils import extend_schema_field
 
 class ProductImageSerializer(serializers.ModelSerializer):
     """Serializer for product images."""
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductImage
-        fields = ['image_url']
+        fields = ['image_url', 'srcset']
         read_only_fields = ['image_url']
 
+    @extend_schema_field({'type': 'object', 'additionalProperties': {'type': 'string'}})
+    def get_srcset(self, image):
+        """Resized variants per format, e.g. {"webp": "url 320w, url 640w"}."""
+        return srcset(image.variants)
+
 class ProductSerializer(serializers.ModelSerializer):
     """Serializer for product"""
 
     def get_first_image_url(self, product):
-        first_image = product.product_id_image.first()
-        if first_image:
-            return first_image.image_url.url
+        if product.primary_image:
+            return product.primary_image.url
         return None
     
     image_url = serializers.SerializerMethodField()
@@ -45,19 +54,41 @@ class ProductDocumentSerializer(DocumentSerializer):
     class Meta:
         model = Product
         document = ProductDocument
-        fields = ['p_id', 'name', 'price', 'rating', 'category','image_url']
+        fields = ['p_id', 'name', 'price', 'rating', 'category','image_url','srcset']
         read_only_fields = ['rating', 'p_id']
 
 
 class ProductDetailSerializer(serializers.ModelSerializer):
-    """Serializer for product including description."""
-    review = ReviewSerializer(many=True, read_only=True, source='product_id_review')
+    """Serializer for product including description and its latest reviews.
+
+    Expects the product to come from ProductViewSet.get_detail_queryset, which
+    annotates review_count and prefetches latest_reviews and images.
+    """
+    REVIEW_LIMIT = KeysetPagination.page_size
+
+    review = serializers.SerializerMethodField()
+    review_count = serializers.IntegerField(read_only=True)
+    review_next = serializers.SerializerMethodField()
     image_url = ProductImageSerializer(many=True, read_only=True, source='product_id_image')
     class Meta:
         model = Product
-        fields = ['p_id', 'name', 'price', 'threshold', 'stock', 'rating', 'description', 'review', 'category','image_url']
+        fields = ['p_id', 'name', 'price', 'threshold', 'stock', 'rating', 'description', 'review', 'review_count', 'review_next', 'category','image_url']
         read_only_fields = ['rating','id']
 
+    @extend_schema_field(ReviewSerializer(many=True))
+    def get_review(self, product):
+        return ReviewSerializer(product.latest_reviews, many=True).data
+
+    def get_review_next(self, product) -> Optional[str]:
+        """Link to the remaining reviews in the review list endpoint."""
+        if product.review_count <= len(product.latest_reviews):
+            return None
+        url = reverse('review:review-list') + f'?p_id={product.p_id}'
+        request = self.context.get('request')
+        if request:
+            url = request.build_absolute_uri(url)
+        return KeysetPagination().cursor_url(url, product.latest_reviews[-1].id)
+
 class CategorySerializer(serializers.ModelSerializer):
     """Serializer for category"""
     class Meta:
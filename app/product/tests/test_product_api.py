@@ -4,15 +4,21 @@ Tests for product API.
 
 from django.test import TestCase
 from django.contrib.auth import get_user_model
-from core.models import Product,Review,Category
+from core.models import Product,ProductImage,Review,Category
 from django.urls import reverse
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework.test import APIClient
+from rest_framework.response import Response
 from rest_framework import status
 from unittest.mock import Mock
 from unittest import mock
 
-from product.serializers import ProductSerializer
+from product.serializers import ProductSerializer,ProductDetailSerializer
+from product.views import ProductViewSet
+from core.query_budget import QueryBudgetMixin
 from django_elasticsearch_dsl_drf.viewsets import DocumentViewSet
 
 PRODUCT_URL = reverse('product:product-list')
@@ -35,6 +41,7 @@ class PublicUserApiTests(TestCase):
     """Test the public features of the user API"""
 
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
 
     @mock.patch.object(DocumentViewSet, 'list')
@@ -163,11 +170,41 @@ class PublicUserApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertIn('name',res.data.keys())
 
+    def test_product_detail_reviews_capped_with_constant_queries(self):
+        """Detail embeds the latest reviews only and its queries do not grow with reviews."""
+        product = create_product(name="Macbook Pro M1 Pro",price=265000,stock=10,threshold=2)
+        detail_url = reverse('product:product-detail', args=[product.p_id])
+        query_counts = []
+        for review_total in [2,15]:
+            for index in range(Review.objects.filter(p_id=product).count(),review_total):
+                user = create_user(email=f"user{index}@example.com",password="test123",first_name=f"user{index}")
+                Review.objects.create(p_id=product,review="Good",rating=5,user=user,status="Published")
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.get(detail_url)
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0],query_counts[1])
+        self.assertEqual(len(res.data["review"]),ProductDetailSerializer.REVIEW_LIMIT)
+        self.assertEqual(res.data["review_count"],15)
+        self.assertEqual(res.data["review"][0]["name"],"user14")
+        self.assertIn(f"p_id={product.p_id}",res.data["review_next"])
+        res = self.client.get(res.data["review_next"])
+        self.assertEqual([review["name"] for review in res.json()["results"]],[f"user{index}" for index in range(4,-1,-1)])
+
+    def test_product_detail_hides_unpublished_reviews(self):
+        """Pending and rejected reviews are not embedded or counted."""
+        product = create_product(name="Macbook Pro M1 Pro",price=265000,stock=10,threshold=2)
+        Review.objects.create(p_id=product,review="Good",rating=5,user=create_user(email="a@example.com",password="test123"),status="Published")
+        Review.objects.create(p_id=product,review="Bad",rating=1,user=create_user(email="b@example.com",password="test123"),status="Rejected")
+        cache.clear()
+        res = self.client.get(reverse('product:product-detail', args=[product.p_id]))
+        self.assertEqual(res.data["review_count"],1)
+        self.assertEqual(len(res.data["review"]),1)
+        self.assertIsNone(res.data["review_next"])
+
     def test_returns_image_url_if_first_image_exists(self):
         product = Mock()
-        first_image = Mock()
-        first_image.image_url.url = "http://example.com/image.jpg"
-        product.product_id_image.first.return_value = first_image
+        product.primary_image.url = "http://example.com/image.jpg"
 
         serializer = ProductSerializer()
         result = serializer.get_image_url(product)
@@ -176,9 +213,95 @@ class PublicUserApiTests(TestCase):
 
     def test_returns_none_if_no_first_image(self):
         product = Mock()
-        product.product_id_image.first.return_value = None
+        product.primary_image = None
 
         serializer = ProductSerializer()
         result = serializer.get_image_url(product)
 
-        self.assertIsNone(result)
\ No newline at end of file
+        self.assertIsNone(result)
+
+class ProductCacheTests(TestCase):
+    """Test caching of product listings and details"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.product = create_product(name="Macbook Pro M1 Pro",price=265000,stock=10,threshold=2)
+
+    def test_detail_cached_until_product_changes(self):
+        """Detail is served from cache until a save bumps the product version."""
+        detail_url = reverse('product:product-detail', args=[self.product.p_id])
+        self.client.get(detail_url)
+        Product.objects.filter(p_id=self.product.p_id).update(price=1)
+        res = self.client.get(detail_url)
+        self.assertEqual(res.data["price"],265000)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 2
+            self.product.save()
+        res = self.client.get(detail_url)
+        self.assertEqual(res.data["price"],2)
+
+    @mock.patch.object(DocumentViewSet, 'list')
+    def test_equivalent_list_queries_share_entry(self, mock_list):
+        """Queries differing only in defaults, case or spacing hit the same entry."""
+        mock_list.return_value = Response({"results":[]})
+
+        self.client.get(PRODUCT_URL+"?search=Macbook%20%20Pro&price=0&page_no=1")
+        self.client.get(PRODUCT_URL+"?search=macbook+pro")
+        self.assertEqual(mock_list.call_count,1)
+
+        self.client.get(PRODUCT_URL+"?search=macbook+pro&price=1")
+        self.assertEqual(mock_list.call_count,2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.client.get(PRODUCT_URL+"?search=macbook+pro")
+        self.assertEqual(mock_list.call_count,3)
+
+    @mock.patch.object(DocumentViewSet, 'list')
+    def test_unknown_list_params_bypass_cache(self, mock_list):
+        """Queries the cache cannot normalise are always answered by the search backend."""
+        mock_list.return_value = Response({"results":[]})
+
+        self.client.get(PRODUCT_URL+"?category__in=a__b")
+        self.client.get(PRODUCT_URL+"?category__in=a__b")
+        self.assertEqual(mock_list.call_count,2)
+
+    def test_cache_stats_admin_only(self):
+        """Hit and miss counters are exposed to admins."""
+        stats_url = reverse('product:product-cache-stats')
+        detail_url = reverse('product:product-detail', args=[self.product.p_id])
+        self.client.get(detail_url)
+        self.client.get(detail_url)
+
+        user = create_user(email="user@example.com",password="test123")
+        self.client.force_authenticate(user)
+        res = self.client.get(stats_url)
+        self.assertEqual(res.status_code,status.HTTP_403_FORBIDDEN)
+
+        user.is_staff = True
+        user.save()
+        res = self.client.get(stats_url)
+        self.assertEqual(res.status_code,status.HTTP_200_OK)
+        self.assertEqual(res.data["detail"],{"hits":1,"stale":0,"misses":1,"hit_ratio":0.5})
+
+
+class ProductQueryBudgetTests(QueryBudgetMixin,TestCase):
+    """Product detail stays within budget whatever the number of reviews and images."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.product = create_product(name="Macbook Pro M1 Pro",price=265000,stock=10,threshold=2)
+
+    def seed(self,size):
+        """Reviews and images on the product, with an empty cache to measure a miss."""
+        for index in range(Review.objects.filter(p_id=self.product).count(),size):
+            user = create_user(email=f"user{index}@example.com",password="test123",first_name=f"user{index}")
+            Review.objects.create(p_id=self.product,review="Good",rating=5,user=user,status="Published")
+            ProductImage.objects.create(p_id=self.product,image_url=f"images/product-{index}.jpg")
+        cache.clear()
+
+    def test_retrieve_budget(self):
+        detail_url = reverse('product:product-detail',args=[self.product.p_id])
+        self.assertBudgetIndependentOfN(ProductViewSet,'retrieve',self.seed,lambda: self.client.get(detail_url))
@@ -17,5 +17,6 @@ app_name = 'product' #name for reverse url
 urlpatterns = [
     path('product/', views.ProductViewSet.as_view({'get': 'list'}), name='product-list'),
     path('product/<int:pk>/', views.ProductViewSet.as_view({'get': 'retrieve'}), name='product-detail'),
+    path('product/cache-stats/', views.ProductCacheStatsView.as_view(), name='product-cache-stats'),
     path('category/', views.CategoryViewSet.as_view({'get': 'list'}), name='category-list'),
 ]
\ No newline at end of file
@@ -1,17 +1,22 @@
 """View for product model"""
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from django.conf import settings
+from django.db.models import Count,Q,Prefetch
+from django.shortcuts import get_object_or_404
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
+from rest_framework.views import APIView
+from rest_framework.permissions import IsAdminUser
 from rest_framework import status
 from drf_spectacular.openapi import OpenApiParameter
 from drf_spectacular.utils import extend_schema
+from drf_spectacular.types import OpenApiTypes
 from django_elasticsearch_dsl_drf.viewsets import DocumentViewSet
 from django_elasticsearch_dsl_drf.filter_backends import CompoundSearchFilterBackend,FilteringFilterBackend
 from product import serializers
 from core.pagination import CustomPagination
-from core.models import Product,Category
+from core.models import Product,Category,Review
 from core.documents import ProductDocument
+from core.services import product_cache
 
     
 class ProductViewSet(
@@ -30,6 +35,10 @@ class ProductViewSet(
     filter_fields = {"category":"category"}
 
     http_method_names = ['get']
+    # Listings are served by Elasticsearch and run no queries.
+    query_budgets = {
+        'retrieve': 3,
+    }
     
     def get_queryset(self):
         query_set = super().get_queryset().sort('-p_id')
@@ -61,19 +70,40 @@ class ProductViewSet(
             OpenApiParameter(name='category',location=OpenApiParameter.QUERY, description='Category', required=False, type=str),
         ],
     )
-    @method_decorator(cache_page(60))
     def list(self, request, *args, **kwargs):
+        key = product_cache.list_key(request.query_params)
         try:
-            return super().list(request, *args, **kwargs)
+            if(key is None):
+                return super().list(request, *args, **kwargs)
+            data = product_cache.fetch(
+                'list',key,lambda: super(ProductViewSet,self).list(request, *args, **kwargs).data,
+                settings.PRODUCT_LIST_CACHE_TIMEOUT
+            )
         except Exception as e:
             return Response({"error":"Elasticsearch connection failed"},status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(data)
     
         
-    @method_decorator(cache_page(60))
+    def get_detail_queryset(self):
+        """Product with its images, published review count and latest reviews with authors."""
+        latest_reviews = Review.objects.filter(status="Published").select_related('user').order_by('-id')
+        return Product.objects.annotate(
+            review_count=Count('product_id_review',filter=Q(product_id_review__status="Published"))
+        ).prefetch_related(
+            'product_id_image',
+            Prefetch('product_id_review',
+                     queryset=latest_reviews[:serializers.ProductDetailSerializer.REVIEW_LIMIT],
+                     to_attr='latest_reviews'),
+        )
+
     def retrieve(self, request, *args, **kwargs):
-        instance = self.queryset.get(p_id=kwargs['pk'])
-        serializer = self.get_serializer_class()
-        data = serializer(instance).data
+        def serialize():
+            instance = get_object_or_404(self.get_detail_queryset(),p_id=kwargs['pk'])
+            serializer = self.get_serializer_class()
+            return serializer(instance,context={'request':request}).data
+        data = product_cache.fetch(
+            'detail',product_cache.detail_key(kwargs['pk']),serialize,settings.PRODUCT_DETAIL_CACHE_TIMEOUT
+        )
         return Response(data)
 
     def get_serializer_class(self):
@@ -85,4 +115,13 @@ class ProductViewSet(
 class CategoryViewSet(ModelViewSet):
     """View for category list"""
     serializer_class = serializers.CategorySerializer
-    queryset = Category.objects.all()
\ No newline at end of file
+    queryset = Category.objects.all()
+
+
+class ProductCacheStatsView(APIView):
+    """Hit and miss counts of the product cache"""
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(responses={200: OpenApiTypes.OBJECT})
+    def get(self, request):
+        return Response(product_cache.stats())
@@ -10,8 +10,8 @@ class ReviewSerializer(serializers.ModelSerializer):
     name = serializers.SerializerMethodField()
     class Meta:
         model = Review
-        fields = ['p_id','review','user','name','rating']
-        read_only_fields = ["user"]
+        fields = ['p_id','review','user','name','rating','status']
+        read_only_fields = ["user","status"]
     
     def get_name(self, obj) -> str:
         return obj.user.first_name
\ No newline at end of file
@@ -6,10 +6,19 @@ from django.test import TestCase
 from django.contrib.auth import get_user_model
 from core.models import Review,Product,Category,Payment,PaymentProduct
 from django.urls import reverse
+from django.core.cache import cache
 
 from rest_framework.test import APIClient
 from rest_framework import status
 from datetime import datetime
+from unittest import mock
+
+from core.tasks import moderate_reviews
+from core.query_budget import QueryBudgetMixin
+from review.views import ReviewViewSet
+from core.services.product_rating import add_reviews
+from django.core.management import call_command
+from io import StringIO
 
 
 REVIEW_LIST = reverse("review:review-list")
@@ -180,8 +189,23 @@ class PrivateRviewAPITests(TestCase):
         res = self.client.post(REVIEW_LIST, review)
         self.assertEqual(res.status_code,status.HTTP_201_CREATED)
 
-    def test_create_harmful_review_failed(self):
-        """Test creating review for a valid product with inappropriate review."""
+    def test_resubmit_after_rejection(self):
+        """A rejected review does not stop the user from reviewing the product again."""
+        payment = create_payment(id="123",quantity="1",status="Completed",transaction_id="transaction",
+                                 amount=123,user=self.user,date_time=datetime.now())
+        create_payment_product(payment_id=payment,product=self.product,quantity=1,amount=100)
+        rejected = create_review(p_id=self.product,review="I want to kill you.",rating=1,user=self.user,status="Rejected")
+
+        with mock.patch('review.views.schedule_moderation'):
+            res = self.client.post(REVIEW_LIST,{"p_id":self.product.p_id,"review":"good","rating":5})
+
+        self.assertEqual(res.status_code,status.HTTP_201_CREATED)
+        self.assertFalse(Review.objects.filter(id=rejected.id).exists())
+        review = Review.objects.get(p_id=self.product,user=self.user)
+        self.assertEqual((review.review,review.status),("good","Pending"))
+
+    def test_create_harmful_review_rejected(self):
+        """Review is accepted as pending and rejected by moderation when harmful."""
         
         review = {
             "p_id": self.product.p_id,  # Use "p_id" as the key
@@ -207,8 +231,49 @@ class PrivateRviewAPITests(TestCase):
         }
         create_payment_product(**payment_product)
         res = self.client.post(REVIEW_LIST, review)
-        self.assertEqual(res.status_code,status.HTTP_400_BAD_REQUEST)
-        self.assertEqual("Your content is recognised as harmful",res.json()["error"][0])
+        self.assertEqual(res.status_code,status.HTTP_201_CREATED)
+        self.assertEqual(res.json()["status"],"Pending")
+
+        with mock.patch('core.services.review_moderation.analyze_many',side_effect=lambda texts:[int("kill" in text) for text in texts]):
+            moderate_reviews()
+        created = Review.objects.get(p_id=self.product,user=self.user)
+        self.assertEqual(created.status,"Rejected")
+        res = self.client.get(REVIEW_LIST+"?p_id="+str(self.product.p_id))
+        self.assertEqual(res.json()["results"],[])
+
+    def test_moderation_publishes_safe_reviews_in_one_batch(self):
+        """Pending reviews are classified with a single call and published."""
+        user = create_user(email="user2@example.com",password="test123")
+        create_review(p_id=self.product,review="good",rating=4,user=self.user)
+        create_review(p_id=self.product,review="great",rating=2,user=user)
+        with mock.patch('core.services.review_moderation.analyze_many',side_effect=lambda texts:[0]*len(texts)) as mock_analyze:
+            moderate_reviews()
+        mock_analyze.assert_called_once_with(["good","good","great"])
+        self.assertEqual(Review.objects.filter(p_id=self.product,status="Published").count(),2)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum,self.product.rating_count,self.product.rating),(6,2,3))
+
+    def test_create_review_schedules_moderation_once_per_window(self):
+        """Reviews posted within the window share one moderation run."""
+        user = create_user(email="user2@example.com",password="test123")
+        payment = create_payment(id="123",quantity=1,status="Completed",amount=123,user=self.user)
+        create_payment_product(payment_id=payment,product=self.product,quantity=1,amount=100)
+        payment = create_payment(id="456",quantity=1,status="Completed",amount=123,user=user)
+        create_payment_product(payment_id=payment,product=self.product,quantity=1,amount=100)
+        review = {
+            "p_id": self.product.p_id,
+            "review": "good",
+            "rating": 5,
+        }
+        cache.delete("review-moderation-scheduled")
+        with mock.patch('review.views.moderate_reviews') as mock_task:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(REVIEW_LIST, review)
+            self.client.force_authenticate(user)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(REVIEW_LIST, review)
+        mock_task.apply_async.assert_called_once()
+        cache.delete("review-moderation-scheduled")
 
     def test_create_review_invalid_product(self):
         """Throw error if product doesnot exists."""
@@ -357,6 +422,18 @@ class PrivateRviewAPITests(TestCase):
         self.assertEqual(res.status_code,status.HTTP_400_BAD_REQUEST)
         self.assertIn("error",res.json().keys())
 
+    def test_unpublished_review_hidden_from_others(self):
+        """Pending and rejected reviews are only shown to their author."""
+        rejected = create_review(p_id=create_product(name="Other",price=100,stock=10,threshold=2),
+                                 review="harmful",rating=1,user=self.user,status="Rejected")
+        url = reverse("review:review-detail",args=[rejected.id])
+        self.assertEqual(self.client.get(url).status_code,status.HTTP_200_OK)
+
+        self.client.force_authenticate(create_user(email="user1@example.com",password="test123"))
+        self.assertEqual(self.client.get(url).status_code,status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(url).status_code,status.HTTP_404_NOT_FOUND)
+
     def test_delete_review_by_same_user(self):
         """Succes if same user tries to delete their review."""
         REVIEW_OBJECT = reverse("review:review-detail",args=[self.review.id])
@@ -368,4 +445,120 @@ class PrivateRviewAPITests(TestCase):
         REVIEW_OBJECT = reverse("review:review-detail",args=[1234])
         res = self.client.delete(REVIEW_OBJECT)
         self.assertEqual(res.status_code,status.HTTP_400_BAD_REQUEST)
-        self.assertIn('error',res.json().keys())
\ No newline at end of file
+        self.assertIn('error',res.json().keys())
+
+    def test_delete_published_review_updates_rating(self):
+        """Deleting a published review takes it out of the product rating."""
+        user = create_user(email="user2@example.com",password="test123")
+        create_review(p_id=self.product,review="good",rating=4,user=self.user,status="Published")
+        other = create_review(p_id=self.product,review="great",rating=2,user=user,status="Published")
+        add_reviews(Review.objects.filter(p_id=self.product))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum,self.product.rating_count,self.product.rating),(6,2,3))
+
+        self.client.force_authenticate(user)
+        res = self.client.delete(reverse("review:review-detail",args=[other.id]))
+        self.assertEqual(res.status_code,status.HTTP_204_NO_CONTENT)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum,self.product.rating_count,self.product.rating),(4,1,4))
+
+    def test_rebuild_product_ratings_command(self):
+        """Command recomputes aggregates from published reviews only."""
+        user = create_user(email="user2@example.com",password="test123")
+        create_review(p_id=self.product,review="good",rating=4,user=self.user,status="Published")
+        create_review(p_id=self.product,review="bad",rating=1,user=user,status="Rejected")
+        Product.objects.update(rating_sum=100,rating_count=7,rating=2)
+
+        call_command("rebuild_product_ratings",stdout=StringIO())
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum,self.product.rating_count,self.product.rating),(4,1,4))
+        self.review.p_id.refresh_from_db()
+        self.assertEqual((self.review.p_id.rating_count,self.review.p_id.rating),(0,0))
+
+    def test_review_list_cursor_pagination(self):
+        """Following next links walks every published review once, newest first."""
+        for index in range(25):
+            user = create_user(email=f"user{index}@example.com",password="test123")
+            create_review(p_id=self.product,review="good",rating=4,user=user,status="Published")
+        users = []
+        url = REVIEW_LIST+"?p_id="+str(self.product.p_id)+"&total=true&cursor="
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code,status.HTTP_200_OK)
+            self.assertNotIn("count",res.json())
+            self.assertIsInstance(res.json()["total"],int)
+            self.assertGreaterEqual(res.json()["total"],0)
+            users.extend(review["user"] for review in res.json()["results"])
+            url = res.json()["next"]
+        self.assertEqual(len(users),25)
+        self.assertEqual(users,sorted(set(users),reverse=True))
+
+    def test_review_list_without_cursor_is_page_numbered(self):
+        """The first page of clients that send no cursor still carries count."""
+        for index in range(15):
+            user = create_user(email=f"user{index}@example.com",password="test123")
+            create_review(p_id=self.product,review=f"review {index}",rating=4,user=user,status="Published")
+        res = self.client.get(REVIEW_LIST+"?p_id="+str(self.product.p_id))
+        self.assertEqual(res.status_code,status.HTTP_200_OK)
+        self.assertEqual(res.json()["count"],15)
+        self.assertEqual(len(res.json()["results"]),10)
+        self.assertIn("page_no=2",res.json()["next"])
+
+    def test_review_list_page_no_still_supported(self):
+        """Clients paginating with page_no get page number responses."""
+        for index in range(15):
+            user = create_user(email=f"user{index}@example.com",password="test123")
+            create_review(p_id=self.product,review=f"review {index}",rating=4,user=user,status="Published")
+        res = self.client.get(REVIEW_LIST+"?p_id="+str(self.product.p_id)+"&page_no=2")
+        self.assertEqual(res.status_code,status.HTTP_200_OK)
+        self.assertEqual(res.json()["count"],15)
+        self.assertEqual([review["review"] for review in res.json()["results"]],[f"review {index}" for index in range(4,-1,-1)])
+
+
+class ReviewQueryBudgetTests(QueryBudgetMixin,TestCase):
+    """Queries of each review action stay within budget whatever the number of reviews."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com",password="test123",first_name="xyz",is_active=True)
+        self.authenticate(self.client,self.user)
+        self.product = create_product(name="Macbook Pro M1 Pro",price=265000,stock=10,threshold=2)
+        self.review = create_review(p_id=self.product,review="good",rating=5,user=self.user,status="Published")
+
+    def seed_reviews(self,size):
+        """Published reviews of the product by size different users."""
+        for index in range(Review.objects.filter(p_id=self.product).count(),size):
+            user = create_user(email=f"user{index}@example.com",password="test123",first_name=f"user{index}")
+            create_review(p_id=self.product,review="good",rating=5,user=user,status="Published")
+
+    def test_list_budget(self):
+        self.assertBudgetIndependentOfN(ReviewViewSet,'list',self.seed_reviews,
+                                        lambda: self.client.get(REVIEW_LIST,{'p_id':self.product.p_id}))
+
+    def test_retrieve_budget(self):
+        self.assertBudgetIndependentOfN(ReviewViewSet,'retrieve',self.seed_reviews,
+                                        lambda: self.client.get(reverse("review:review-detail",args=[self.review.id])))
+
+    def test_create_budget(self):
+        """Review of a purchased product, whatever the number of purchases."""
+        products = []
+        def seed(size):
+            for index in range(Payment.objects.filter(user=self.user).count(),size):
+                product = create_product(name=f"Product {index}",price=100,stock=10,threshold=2)
+                payment = create_payment(id=f"payment-{index}",quantity=1,status="Completed",
+                                         transaction_id=f"transaction-{index}",amount=100,user=self.user)
+                create_payment_product(payment_id=payment,product=product,quantity=1,amount=100)
+                products.append(product)
+        with mock.patch('review.views.schedule_moderation'):
+            self.assertBudgetIndependentOfN(ReviewViewSet,'create',seed,
+                                            lambda: self.client.post(REVIEW_LIST,{'p_id':products.pop().p_id,'review':'good','rating':5}))
+
+    def test_destroy_budget(self):
+        reviews = []
+        def seed(size):
+            self.seed_reviews(size)
+            reviews.append(create_review(p_id=create_product(name="Other",price=100,stock=10,threshold=2),
+                                         review="good",rating=5,user=self.user,status="Published"))
+        self.assertBudgetIndependentOfN(ReviewViewSet,'destroy',seed,
+                                        lambda: self.client.delete(reverse("review:review-detail",args=[reviews[-1].id])))
@@ -1,5 +1,8 @@
 """View for review model"""
-from django.db.models import Avg
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
 
 from rest_framework import viewsets,mixins
 from rest_framework.validators import ValidationError
@@ -9,9 +12,16 @@ from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from drf_spectacular.openapi import OpenApiParameter
 from drf_spectacular.utils import extend_schema
 from review import serializers
-from core.pagination import CustomPagination
-from core.models import Review,Payment,Product,PaymentProduct
-from core.services.review_analyzer import analyze
+from core.pagination import KeysetPagination
+from core.models import Review,Payment,PaymentProduct
+from core.tasks import moderate_reviews
+from core.services.product_rating import remove_reviews
+
+def schedule_moderation():
+    """Queue one moderation run per window so reviews posted close together share a batch."""
+    window = settings.REVIEW_MODERATION_WINDOW_MS/1000
+    if cache.add("review-moderation-scheduled",True,timeout=window):
+        moderate_reviews.apply_async(countdown=window)
 
 class ReviewViewSet(viewsets.GenericViewSet,
                     mixins.ListModelMixin,
@@ -20,10 +30,17 @@ class ReviewViewSet(viewsets.GenericViewSet,
                     mixins.DestroyModelMixin):
     """View for reviews."""
     serializer_class = serializers.ReviewSerializer
-    queryset = Review.objects.all()
+    queryset = Review.objects.select_related("user")
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticatedOrReadOnly]
-    pagination_class = CustomPagination
+    pagination_class = KeysetPagination
+    query_budgets = {
+        # Page number responses without a cursor add a COUNT.
+        'list': 3,
+        'retrieve': 2,
+        'create': 5,
+        'destroy': 8,
+    }
 
     def get_queryset(self):
         if(self.action=='list'):
@@ -31,8 +48,11 @@ class ReviewViewSet(viewsets.GenericViewSet,
                 raise ValidationError({"error":["p_id not provided."]})
             
             product_id = self.request.query_params.get('p_id')
-            return self.queryset.filter(p_id=product_id).order_by("-id")
-        return self.queryset
+            return self.queryset.filter(p_id=product_id,status="Published").order_by("-id")
+        # Pending and rejected reviews are only visible to their author.
+        if(self.request.user.is_authenticated):
+            return self.queryset.filter(Q(status="Published")|Q(user=self.request.user))
+        return self.queryset.filter(status="Published")
     
     def perform_create(self, serializer):
         data = serializer.validated_data
@@ -40,15 +60,17 @@ class ReviewViewSet(viewsets.GenericViewSet,
         purchased_product = PaymentProduct.objects.filter(payment_id__in=purchase,product=data["p_id"])
         if(len(purchased_product)<1):
             raise ValidationError({"error":["You havenot purchased the product yet."]})
-        reviews = Review.objects.filter(p_id=data["p_id"],user=self.request.user)
-        if(len(reviews)>0):
+        reviews = list(Review.objects.filter(p_id=data["p_id"],user=self.request.user).values_list('id','status'))
+        if(any(review_status != "Rejected" for _,review_status in reviews)):
             raise ValidationError({"error":["Your review is already registered."]})
-        if(analyze(data["review"]) == 1):
-            raise ValidationError({"error":["Your content is recognised as harmful"]})
-        serializer.save(user=self.request.user)
-        product = Product.objects.get(p_id=data["p_id"].p_id)
-        product.rating = Review.objects.aggregate(avg_rating=Avg('rating'))['avg_rating']
-        product.save()
+        if(reviews):
+            # A rejected review makes way for the resubmitted one.
+            with transaction.atomic():
+                Review.objects.filter(id__in=[review_id for review_id,_ in reviews],status="Rejected").delete()
+                serializer.save(user=self.request.user,status="Pending")
+        else:
+            serializer.save(user=self.request.user,status="Pending")
+        transaction.on_commit(schedule_moderation)
 
     @extend_schema(
         parameters=[
@@ -63,6 +85,14 @@ class ReviewViewSet(viewsets.GenericViewSet,
             review = Review.objects.get(id=kwargs.get('pk'))
         except Review.DoesNotExist:
             raise ValidationError({"error":["Details not found."]})
-        if(review.user != self.request.user):
+        if(review.user_id != self.request.user.id):
             raise ValidationError({"error":["Invalid Request"]})
-        return super().destroy(request, *args, **kwargs)
\ No newline at end of file
+        return super().destroy(request, *args, **kwargs)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # Lock the row so a moderation run cannot publish it while it is removed.
+            instance = Review.objects.select_for_update().get(pk=instance.pk)
+            if(instance.status == "Published"):
+                remove_reviews([instance])
+            instance.delete()
\ No newline at end of file
@@ -16,6 +16,7 @@ from rest_framework import serializers
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from core.tasks import send_email
+from core.services.outbox import enqueue
 
 class PasswordValidator:
     def __init__(self, min_length=8):
@@ -68,7 +69,7 @@ class UserSerializer(serializers.ModelSerializer):
                 continue
             cache.set(token,user.email,60*3)
             break
-        send_email.delay("GoShopNow: Activate Account",f"Activate the account token: {token}",[user.email],'')
+        enqueue(send_email.si("GoShopNow: Activate Account",f"Activate the account token: {token}",[user.email],''))
         return user
     
     def update(self,instance,validated_data):